@@ -1,67 +1,177 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import akshare as ak
 from datetime import datetime, timedelta
-import pandas as pd
-from io import BytesIO
 import os
+import socket
+import tempfile
+import time
+import unicodedata
+from urllib.parse import quote
 
-app = Flask(__name__)
+from market_data import (
+    cache,
+    fetch_stock_info,
+    fetch_stock_hist,
+    fetch_zt_pool,
+    fetch_dt_pool,
+    fetch_intraday,
+    fetch_pool_view,
+    gather,
+    imap_unordered,
+)
+from spot_snapshot import market_snapshot
+from market_analytics import ANALYTICS_MAX_N, INDUSTRY_FIELDS, market_analytics
+from industry_map import industry_map
+from pool_query import POOL_MAX_PAGE_SIZE, parse_fields, parse_filter, parse_sort
+from http_encoding import encode_response, immutable, mark_stale
+import metrics
+from quote_stream import STREAM_HEARTBEAT, STREAM_MAX_CODES, quote_hub
+from upstream import REQUEST_BUDGET, clear_deadline, start_deadline, upstream
+from cache import track_stale
+from trade_calendar import trade_calendar
+from history_store import history_store
+from indicators import indicator_engine, parse_indicators
+from tick_store import BAR_FREQS, parse_time, resample, tick_collector, tick_store, to_frame
+from prewarm import prewarmer, request_stats
+from pool_archive import ARCHIVED_POOLS, PoolTable, pool_archive, pool_archiver
+from pool_analytics import POOL_STATS_MAX_WINDOW, code_history, daily_stats, ladder
+from stock_search import SEARCH_MAX_RESULTS, stock_index
+from screener import screener
+from comparison import COMPARE_MAX_CODES, COMPARE_MAX_POINTS, compare
+from exporters import EXPORT_FORMATS, export_cache, iter_csv, write_xlsx
+from formatting import (
+    format_numeric_value,
+    format_dict_values,
+    format_column,
+    format_columns,
+    format_records,
+    format_frame,
+)
 
-# 配置CORS - 简化配置，允许所有来源
-CORS(app, 
-     resources={r"/api/*": {"origins": "*"}},
-     allow_headers=["Content-Type", "Authorization"],
-     methods=["GET", "POST", "OPTIONS"],
-     supports_credentials=False)
+api = Blueprint('api', __name__)
 
-def format_numeric_value(value, decimals=3):
+# 导出指标时从缓存与行情推送的统计中读取的仪表
+metrics.Gauge(
+    'cache_hit_ratio', '行情缓存命中率', ('namespace',),
+    collect=lambda: {(ns,): s['hit_ratio'] for ns, s in cache.stats()['namespaces'].items()},
+)
+metrics.Gauge('cache_bytes', '行情缓存占用的字节数', collect=lambda: {(): cache.stats()['bytes']})
+metrics.Gauge('stream_subscribers', '行情推送的订阅连接数', collect=lambda: {(): quote_hub.stats()['subscribers']})
+metrics.Gauge(
+    'upstream_circuit_open', 'akshare 函数是否处于熔断（1 为熔断中）', ('function',),
+    collect=lambda: {(name,): int(b['state'] == 'open') for name, b in upstream.stats()['breakers'].items()},
+)
+
+# 批量查询：单次最多股票数量与每个批量请求的上游并发数
+BATCH_MAX_CODES = int(os.environ.get('BATCH_MAX_CODES', 200))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+
+@api.route('/')
+def index():
+    return jsonify({
+        'message': '股票信息查询 API',
+        'version': '1.0.0'
+    })
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
     """
-    格式化数值，保留指定位数小数
+    Prometheus 格式的运行指标
     """
-    if value is None or value == '' or value == '-':
-        return value
-    
-    try:
-        # 尝试转换为浮点数
-        num = float(value)
-        # 保留指定位小数
-        return round(num, decimals)
-    except (ValueError, TypeError):
-        # 如果不是数值，返回原值
-        return value
-
-def format_dict_values(data, decimals=3):
-    """
-    格式化字典中的所有数值，但保留股票代码为字符串
-    """
-    if isinstance(data, dict):
-        result = {}
-        for k, v in data.items():
-            # 股票代码相关字段保持字符串格式，不进行数值转换
-            if k in ['代码', '股票代码', 'code', 'stock_code', '证券代码']:
-                result[k] = str(v).zfill(6) if v else v  # 确保6位，不足前面补0
-            else:
-                result[k] = format_numeric_value(v, decimals)
-        return result
-    return data
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    获取行情缓存的命中统计
+    """
+    return jsonify({
+        'success': True,
+        'data': cache.stats()
+    })
 
-def format_list_values(data_list, decimals=3):
+@api.route('/api/upstream/stats', methods=['GET'])
+def get_upstream_stats():
     """
-    格式化列表中所有字典的数值
+    获取上游请求的连接、限流与重试统计
     """
-    if isinstance(data_list, list):
-        return [format_dict_values(item, decimals) for item in data_list]
-    return data_list
+    return jsonify({
+        'success': True,
+        'data': upstream.stats()
+    })
 
-@app.route('/')
-def index():
+@api.route('/api/stream/stats', methods=['GET'])
+def get_stream_stats():
+    """
+    获取行情推送的订阅统计
+    """
     return jsonify({
-        'message': '股票信息查询 API',
-        'version': '1.0.0'
+        'success': True,
+        'data': quote_hub.stats()
+    })
+
+@api.route('/api/prewarm/stats', methods=['GET'])
+def get_prewarm_stats():
+    """
+    获取缓存预热的配置、最近一次运行结果与访问最多的历史行情
+    """
+    return jsonify({
+        'success': True,
+        'data': prewarmer.stats()
+    })
+
+def _rejects_code(stock_code):
+    """
+    代码不在当天的股票列表中、本地也没有它的历史数据时返回 True（不再请求上游）；
+    已退市或当天不在行情列表中的股票只要本地有历史数据就不拒绝
+    """
+    return stock_index.rejects(stock_code) and not history_store.has(str(stock_code).strip())
+
+def _unknown_code_response(stock_code):
+    """
+    代码被 _rejects_code 拒绝时返回 404 响应，否则返回 None
+    """
+    if _rejects_code(stock_code):
+        return jsonify({
+            'success': False,
+            'message': '未找到该股票代码'
+        }), 404
+    return None
+
+@api.route('/api/stock/search', methods=['GET'])
+def search_stocks():
+    """
+    股票搜索（自动补全）：代码前缀、名称前缀或拼音首字母前缀，如：6000、浦发、pfyh
+    参数: q - 搜索内容
+          limit - 返回条数，默认10，最多 SEARCH_MAX_RESULTS
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': '缺少搜索内容参数 q'}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+        if not 1 <= limit <= SEARCH_MAX_RESULTS:
+            raise ValueError(f'limit 需在 1 到 {SEARCH_MAX_RESULTS} 之间')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    index = stock_index.current
+    if index is None:
+        return jsonify({
+            'success': False,
+            'message': '股票列表尚未就绪，请稍后重试'
+        }), 503
+    
+    data = index.search(query, limit)
+    return jsonify({
+        'success': True,
+        'q': query,
+        'count': len(data),
+        'data': data
     })
 
-@app.route('/api/stock/info', methods=['GET'])
+@api.route('/api/stock/info', methods=['GET'])
 def get_stock_info():
     """
     获取个股综合信息（基本信息 + 实时数据）
@@ -70,56 +180,55 @@ def get_stock_info():
     stock_code = request.args.get('code')
     if not stock_code:
         return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    unknown = _unknown_code_response(stock_code)
+    if unknown:
+        return unknown
     
     try:
         info_result = {}
         realtime_data = None
         
-        # 1. 获取个股基本信息
-        try:
-            stock_info = ak.stock_individual_info_em(symbol=stock_code)
-            for index, row in stock_info.iterrows():
-                info_result[row['item']] = format_numeric_value(row['value'])
-        except Exception as e:
-            print(f"基本信息获取失败: {e}")
-            # 基本信息失败时返回空字典，继续尝试获取实时数据
+        # 基本信息与最近几天的日线相互独立，并发获取
+        # 使用更轻量级的方法：获取最近几天的历史数据作为实时数据，避免超时
+        today = datetime.now().strftime('%Y%m%d')
+        yesterday = (datetime.now() - timedelta(days=3)).strftime('%Y%m%d')
+        results = gather({
+            'basic_info': (fetch_stock_info, stock_code),
+            'history': (fetch_stock_hist, stock_code, 'daily', yesterday, today, ''),
+        })
         
-        # 2. 获取实时行情数据 - 使用单个股票查询避免超时
-        try:
-            # 使用更轻量级的方法：获取单日历史数据作为实时数据
-            today = datetime.now().strftime('%Y%m%d')
-            yesterday = (datetime.now() - timedelta(days=3)).strftime('%Y%m%d')
-            
-            df_hist = ak.stock_zh_a_hist(
-                symbol=stock_code,
-                period='daily',
-                start_date=yesterday,
-                end_date=today,
-                adjust=''
-            )
-            
-            if not df_hist.empty:
-                # 获取最新一条数据
-                latest = df_hist.iloc[-1].to_dict()
-                # 构造类似实时数据的格式
-                realtime_data = {
-                    '代码': stock_code,
-                    '名称': info_result.get('股票简称', stock_code),
-                    '最新价': format_numeric_value(latest.get('收盘')),
-                    '涨跌幅': format_numeric_value(latest.get('涨跌幅')),
-                    '涨跌额': format_numeric_value(latest.get('涨跌额')),
-                    '成交量': format_numeric_value(latest.get('成交量')),
-                    '成交额': format_numeric_value(latest.get('成交额')),
-                    '振幅': format_numeric_value(latest.get('振幅')),
-                    '最高': format_numeric_value(latest.get('最高')),
-                    '最低': format_numeric_value(latest.get('最低')),
-                    '今开': format_numeric_value(latest.get('开盘')),
-                    '昨收': format_numeric_value(latest.get('昨收', latest.get('收盘'))),
-                    '换手率': format_numeric_value(latest.get('换手率')),
-                }
-        except Exception as e:
-            print(f"实时数据获取失败: {e}")
+        # 1. 个股基本信息
+        stock_info, error = results['basic_info']
+        if error is None:
+            info_result = dict(zip(stock_info['item'].tolist(), format_column(stock_info['value'])))
+        else:
+            print(f"基本信息获取失败: {error}")
+            # 基本信息失败时返回空字典，继续返回实时数据
+        
+        # 2. 实时行情数据
+        df_hist, error = results['history']
+        if error is not None:
+            print(f"实时数据获取失败: {error}")
             # 实时数据获取失败，保持为None
+        elif not df_hist.empty:
+            # 获取最新一条数据
+            latest = df_hist.iloc[-1].to_dict()
+            # 构造类似实时数据的格式
+            realtime_data = {
+                '代码': stock_code,
+                '名称': info_result.get('股票简称', stock_code),
+                '最新价': format_numeric_value(latest.get('收盘')),
+                '涨跌幅': format_numeric_value(latest.get('涨跌幅')),
+                '涨跌额': format_numeric_value(latest.get('涨跌额')),
+                '成交量': format_numeric_value(latest.get('成交量')),
+                '成交额': format_numeric_value(latest.get('成交额')),
+                '振幅': format_numeric_value(latest.get('振幅')),
+                '最高': format_numeric_value(latest.get('最高')),
+                '最低': format_numeric_value(latest.get('最低')),
+                '今开': format_numeric_value(latest.get('开盘')),
+                '昨收': format_numeric_value(latest.get('昨收', latest.get('收盘'))),
+                '换手率': format_numeric_value(latest.get('换手率')),
+            }
         
         # 如果两个数据都为空，返回错误
         if not info_result and not realtime_data:
@@ -145,7 +254,103 @@ def get_stock_info():
             'message': f'查询失败: {str(e)}'
         }), 500
 
-@app.route('/api/stock/history', methods=['GET'])
+@api.route('/api/stock/realtime', methods=['GET'])
+def get_stock_realtime():
+    """
+    获取实时行情数据（来自全市场行情快照）
+    参数: code - 股票代码，如：600000（查询参数）
+    """
+    stock_code = request.args.get('code')
+    if not stock_code:
+        return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    
+    snapshot = market_snapshot.current
+    if snapshot is None:
+        return jsonify({
+            'success': False,
+            'message': '行情快照尚未就绪，请稍后重试'
+        }), 503
+    
+    row = snapshot.get_row(stock_code)
+    if row is None:
+        return jsonify({
+            'success': False,
+            'message': '未找到该股票代码'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'code': stock_code,
+        'data': format_dict_values(row),
+        'timestamp': snapshot.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+@api.route('/api/stock/stream', methods=['GET'])
+def stream_stock_quotes():
+    """
+    订阅实时行情（Server-Sent Events）
+    参数: codes - 逗号分隔的股票代码，如：600000,000001
+    首先推送 snapshot 事件（订阅代码的完整行情），之后每次快照刷新只推送变化的字段（quote 事件）
+    """
+    codes = [c.strip() for c in request.args.get('codes', '').split(',') if c.strip()]
+    codes = list(dict.fromkeys(codes))
+    if not codes:
+        return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    if len(codes) > STREAM_MAX_CODES:
+        return jsonify({'success': False, 'message': f'单次最多订阅{STREAM_MAX_CODES}只股票'}), 400
+    if not market_snapshot.ready:
+        return jsonify({
+            'success': False,
+            'message': '行情快照尚未就绪，请稍后重试'
+        }), 503
+    
+    subscribed = quote_hub.subscribe(codes)
+    if subscribed is None:
+        return jsonify({
+            'success': False,
+            'message': '推送连接数已达上限，请稍后重试'
+        }), 503
+    sub, rows, missing = subscribed
+    if not rows:
+        quote_hub.unsubscribe(sub)
+        return jsonify({
+            'success': False,
+            'message': '未找到该股票代码'
+        }), 404
+    
+    def event(name, data, event_id=None):
+        head = f'id: {event_id}\n' if event_id is not None else ''
+        return f'{head}event: {name}\ndata: {current_app.json.dumps(data)}\n\n'
+    
+    def generate():
+        try:
+            snapshot = market_snapshot.current
+            yield event('snapshot', {
+                'data': rows,
+                'missing': missing,
+                'timestamp': snapshot.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+            }, snapshot.version)
+            while True:
+                changes, version = sub.take(STREAM_HEARTBEAT)
+                if changes is None:
+                    # 心跳（注释行），保持连接
+                    yield ': ping\n\n'
+                    continue
+                current = market_snapshot.current
+                yield event('quote', {
+                    'data': changes,
+                    'timestamp': current.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+                }, version)
+        finally:
+            quote_hub.unsubscribe(sub)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭反向代理（如 nginx）的缓冲，保证事件立即送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api.route('/api/stock/history', methods=['GET'])
 def get_stock_history():
     """
     获取历史行情数据
@@ -155,20 +360,26 @@ def get_stock_history():
         end_date - 结束日期 (format: 20211231)
         period - 周期 (daily, weekly, monthly)
         adjust - 复权类型 (qfq-前复权, hfq-后复权, 空-不复权)
+        indicators - 技术指标，逗号分隔，如：MA:5:10:20,MACD,RSI:14,BOLL,KDJ,CROSS:MA5:MA20
+        format - records（默认）/ columnar（data 为 {columns, arrays}）
     """
     stock_code = request.args.get('code')
     if not stock_code:
         return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    unknown = _unknown_code_response(stock_code)
+    if unknown:
+        return unknown
     
     try:
         start_date = request.args.get('start_date', '20240101')
         end_date = request.args.get('end_date', '20241231')
         period = request.args.get('period', 'daily')
         adjust = request.args.get('adjust', '')
+        indicators, crosses = parse_indicators(request.args.get('indicators'))
         
-        # 获取历史行情数据
-        df = ak.stock_zh_a_hist(
-            symbol=stock_code,
+        # 获取历史行情数据（本地存储，缺失部分增量拉取）
+        df = history_store.query(
+            stock_code,
             period=period,
             start_date=start_date,
             end_date=end_date,
@@ -180,215 +391,599 @@ def get_stock_history():
                 'success': False,
                 'message': '未找到历史数据'
             }), 404
+        request_stats.record(stock_code, period, adjust)
         
-        # 转换为列表格式并格式化数值
-        result = format_list_values(df.to_dict('records'))
+        # 转换为列表格式并格式化数值；format=columnar 时按列返回，不再在每条记录中重复字段名
+        if _columnar_requested():
+            result = {'columns': list(df.columns), 'arrays': format_columns(df)}
+        else:
+            result = format_records(df)
+        
+        # 技术指标在完整历史序列上计算（结果按股票缓存，新K线只增量计算），作为附加列返回
+        if indicators or crosses:
+            names, values = indicator_engine.compute(stock_code, period, adjust, indicators, crosses, df)
+            if isinstance(result, dict):
+                result['columns'] += names
+                result['arrays'] += values
+            else:
+                for record, row in zip(result, zip(*values)):
+                    record.update(zip(names, row))
         
+        response = jsonify({
+            'success': True,
+            'code': stock_code,
+            'count': len(df),
+            'data': result
+        })
+        # 区间内的K线都已收盘、不复权 / 后复权且本地已校验到结束日期时数据不会再变化
+        if history_store.is_complete(stock_code, period, end_date, adjust):
+            immutable(response)
+        return response
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'message': f'查询失败: {str(e)}'
+        }), 400
+
+@api.route('/api/stock/intraday', methods=['GET'])
+def get_stock_intraday():
+    """
+    从分时成交存档中查询（不请求上游，只有关注列表 TICK_WATCHLIST 中的股票有存档）
+    参数: 
+        code - 股票代码
+        date - 交易日 (format: 20241009)，默认最近交易日
+        start / end - 时间区间，如：09:30、10:00:00，默认全天
+        freq - tick（默认，逐笔）/ 1min / 5min / 15min / 30min / 60min（OHLCV 分钟K线）
+        format - records（默认）/ columnar（data 为 {columns, arrays}）
+    """
+    stock_code = request.args.get('code')
+    if not stock_code:
+        return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    
+    try:
+        date_param = request.args.get('date') or trade_calendar.latest_trading_day(datetime.now().strftime('%Y%m%d'))
+        start = request.args.get('start')
+        end = request.args.get('end')
+        freq = request.args.get('freq', 'tick')
+        minutes = None
+        if freq != 'tick':
+            minutes = int(freq[:-3]) if freq.endswith('min') and freq[:-3].isdigit() else None
+            if minutes not in BAR_FREQS:
+                raise ValueError(f'不支持的周期: {freq}')
+        columnar = _columnar_requested()
+        
+        columns = tick_store.read(
+            date_param, stock_code,
+            start=parse_time(start) if start else None,
+            end=parse_time(end) if end else None,
+        )
+        if columns is None:
+            return jsonify({
+                'success': False,
+                'message': f'未找到该股票{date_param}的分时成交存档'
+            }), 404
+        
+        df = resample(columns, minutes) if minutes else to_frame(columns)
+        # 时间、买卖盘性质为字符串，只格式化数值列
+        arrays = [
+            df[col].tolist() if df[col].dtype.kind == 'O' else format_column(df[col])
+            for col in df.columns
+        ]
+        if columnar:
+            result = {'columns': list(df.columns), 'arrays': arrays}
+        else:
+            result = [dict(zip(df.columns, row)) for row in zip(*arrays)]
+        
+        complete = tick_store.is_complete(date_param, stock_code)
+        response = jsonify({
             'success': True,
             'code': stock_code,
-            'count': len(result),
+            'date': date_param,
+            'freq': freq,
+            'complete': complete,
+            'count': len(df),
             'data': result
         })
+        # 收盘后的最终数据不再变化
+        if complete:
+            immutable(response)
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'查询失败: {str(e)}'
+        }), 400
+
+def _parse_batch_codes():
+    """
+    解析批量接口请求体中的股票代码列表（去重并保持顺序），
+    并按股票数量放宽本次请求的上游时间预算（每 BATCH_CONCURRENCY 只一份）
+    返回 (codes, 错误响应)
+    """
+    body = request.get_json(silent=True) or {}
+    codes = body.get('codes')
+    if not isinstance(codes, list) or not codes:
+        return None, (jsonify({'success': False, 'message': '缺少股票代码列表参数 codes'}), 400)
+    codes = list(dict.fromkeys(str(code).strip() for code in codes if str(code).strip()))
+    if len(codes) > BATCH_MAX_CODES:
+        return None, (jsonify({'success': False, 'message': f'单次最多查询{BATCH_MAX_CODES}只股票'}), 400)
+    start_deadline(REQUEST_BUDGET * max(1, -(-len(codes) // BATCH_CONCURRENCY)))
+    return codes, None
+
+def _ndjson_response(rows):
+    """
+    将逐条产出的结果以 NDJSON 流式返回，最后一行为汇总
+    """
+    def generate():
+        count = 0
+        for row in rows:
+            count += 1
+            yield current_app.json.dumps(row) + '\n'
+        yield current_app.json.dumps({'done': True, 'count': count}) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api.route('/api/stock/info/batch', methods=['POST'])
+def get_stock_info_batch():
+    """
+    批量获取个股信息，结果按完成顺序以 NDJSON 流式返回
+    请求体: {"codes": ["600000", "000001", ...]}
+    实时数据直接读取全市场行情快照；基本信息命中缓存时立即返回，其余并发获取
+    """
+    codes, error_response = _parse_batch_codes()
+    if error_response:
+        return error_response
+    
+    snapshot = market_snapshot.current
+    
+    def load(stock_code):
+        if _rejects_code(stock_code):
+            # 不存在的代码不再请求上游
+            return None
+        row = snapshot.get_row(stock_code) if snapshot is not None else None
+        realtime_data = format_dict_values(row) if row is not None else None
+        try:
+            stock_info = fetch_stock_info(stock_code)
+            info_result = dict(zip(stock_info['item'].tolist(), format_column(stock_info['value'])))
+        except Exception as e:
+            # 与 /api/stock/info 一致：基本信息失败时返回空字典，保留快照中的实时数据
+            if realtime_data is None:
+                raise
+            print(f"基本信息获取失败 {stock_code}: {e}")
+            info_result = {}
+        if not info_result and realtime_data is None:
+            return None
+        return {'basic_info': info_result, 'realtime_data': realtime_data}
+    
+    def rows():
+        for stock_code, data, error in imap_unordered(load, codes, BATCH_CONCURRENCY):
+            if error is not None:
+                yield {'success': False, 'code': stock_code, 'message': f'查询失败: {str(error)}'}
+            elif data is None:
+                yield {'success': False, 'code': stock_code, 'message': '未找到该股票代码'}
+            else:
+                yield {'success': True, 'code': stock_code, 'data': data}
+    
+    return _ndjson_response(rows())
+
+@api.route('/api/stock/history/batch', methods=['POST'])
+def get_stock_history_batch():
+    """
+    批量获取历史行情数据，结果按完成顺序以 NDJSON 流式返回
+    请求体: {"codes": [...], "start_date": "20240101", "end_date": "20241231", "period": "daily", "adjust": ""}
+    优先读取本地历史行情存储，缺失部分并发从上游增量拉取
+    """
+    codes, error_response = _parse_batch_codes()
+    if error_response:
+        return error_response
+    
+    body = request.get_json(silent=True) or {}
+    start_date = body.get('start_date', '20240101')
+    end_date = body.get('end_date', '20241231')
+    period = body.get('period', 'daily')
+    adjust = body.get('adjust', '')
+    
+    def load(stock_code):
+        if _rejects_code(stock_code):
+            # 不存在的代码不再请求上游
+            return None
+        df = history_store.query(
+            stock_code,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=adjust
+        )
+        if not df.empty:
+            request_stats.record(stock_code, period, adjust)
+        return df
+    
+    def rows():
+        for stock_code, df, error in imap_unordered(load, codes, BATCH_CONCURRENCY):
+            if error is not None:
+                yield {'success': False, 'code': stock_code, 'message': f'查询失败: {str(error)}'}
+            elif df is None:
+                yield {'success': False, 'code': stock_code, 'message': '未找到该股票代码'}
+            elif df.empty:
+                yield {'success': False, 'code': stock_code, 'message': '未找到历史数据'}
+            else:
+                result = format_records(df)
+                yield {'success': True, 'code': stock_code, 'count': len(result), 'data': result}
+    
+    return _ndjson_response(rows())
+
+@api.route('/api/stock/compare', methods=['GET'])
+def compare_stocks():
+    """
+    多股对比：对齐到同一交易日索引、归一化为相对基准日的累计涨跌幅，
+    并返回日收益率相关系数矩阵与相对表现矩阵
+    参数: 
+        codes - 股票代码，逗号分隔，如：600000,000001
+        start_date / end_date / period / adjust - 同 /api/stock/history（adjust 默认 qfq）
+        base_date - 归一化基准日，默认区间内第一个交易日
+        points - 每条曲线最多返回的点数，超过时用 LTTB 降采样，默认不降采样
+    """
+    codes = list(dict.fromkeys(c.strip() for c in request.args.get('codes', '').split(',') if c.strip()))
+    if not codes:
+        return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    if len(codes) > COMPARE_MAX_CODES:
+        return jsonify({'success': False, 'message': f'单次最多对比{COMPARE_MAX_CODES}只股票'}), 400
+    
+    try:
+        start_date = request.args.get('start_date', '20240101')
+        end_date = request.args.get('end_date', '20241231')
+        period = request.args.get('period', 'daily')
+        # 对比的是价格走势，默认前复权避免除权缺口
+        adjust = request.args.get('adjust', 'qfq')
+        points = request.args.get('points')
+        if points is not None:
+            points = int(points)
+            if not 3 <= points <= COMPARE_MAX_POINTS:
+                raise ValueError(f'points 需在 3 到 {COMPARE_MAX_POINTS} 之间')
+        
+        def load(stock_code):
+            if _rejects_code(stock_code):
+                return None
+            return history_store.query(
+                stock_code,
+                period=period,
+                start_date=start_date,
+                end_date=end_date,
+                adjust=adjust
+            )
+        
+        # 并发读取各股票的历史K线，单只失败不影响其他股票
+        frames, errors = {}, []
+        for stock_code, df, error in imap_unordered(load, codes, BATCH_CONCURRENCY):
+            if error is not None:
+                errors.append({'code': stock_code, 'message': f'查询失败: {str(error)}'})
+            elif df is None:
+                errors.append({'code': stock_code, 'message': '未找到该股票代码'})
+            elif df.empty:
+                errors.append({'code': stock_code, 'message': '未找到历史数据'})
+            else:
+                frames[stock_code] = df
+                request_stats.record(stock_code, period, adjust)
+        if not frames:
+            return jsonify({
+                'success': False,
+                'message': '未找到历史数据',
+                'errors': errors
+            }), 404
+        
+        found = [code for code in codes if code in frames]
+        result = compare(found, [frames[code] for code in found], request.args.get('base_date'), points)
+        
+        # 名称取自全市场行情快照，快照未就绪时为 None
+        snapshot = market_snapshot.current
+        for item in result['series']:
+            row = snapshot.get_row(item['code']) if snapshot is not None else None
+            item['name'] = row.get('名称') if row else None
+        
+        response = jsonify({
+            'success': True,
+            'codes': found,
+            **result,
+            'errors': errors
+        })
+        if not errors and snapshot is not None and all(
+            history_store.is_complete(code, period, end_date, adjust) for code in found
+        ):
+            immutable(response)
+        return response
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'查询失败: {str(e)}'
         }), 400
 
-@app.route('/api/stock/limit-up/previous', methods=['GET'])
+def _columnar_requested():
+    """
+    是否请求按列返回数据（format=columnar）
+    """
+    fmt = request.args.get('format', 'records')
+    if fmt not in ('records', 'columnar'):
+        raise ValueError(f'不支持的数据格式: {fmt}')
+    return fmt == 'columnar'
+
+def _page_args():
+    """
+    分页参数 (page, page_size)，不传 page_size 时为 None（返回全部）
+    """
+    page = int(request.args.get('page', 1))
+    page_size = request.args.get('page_size')
+    if page_size is not None:
+        page_size = int(page_size)
+        if not 1 <= page_size <= POOL_MAX_PAGE_SIZE:
+            raise ValueError(f'page_size 需在 1 到 {POOL_MAX_PAGE_SIZE} 之间')
+    if page < 1:
+        raise ValueError('page 需大于等于 1')
+    return page, page_size
+
+def _query_pool(name, date_param):
+    """
+    按查询参数在股票池视图上完成筛选、排序、分页与列裁剪
+    参数: 
+        filter - 筛选条件，逗号分隔，如：所属行业=半导体|光伏设备,连板数>=2,代码!^=30
+        sort - 排序字段，逗号分隔，- 表示降序，如：-连板数,首次封板时间
+        fields - 返回字段，逗号分隔，默认全部
+        page / page_size - 分页（从1开始），不传 page_size 时返回全部
+        format - records（默认）/ columnar（data 为 {columns, arrays}）
+    股票池为空时返回 None，否则返回响应中的分页字段与数据加载时间
+    """
+    view = fetch_pool_view(name, date_param)
+    if len(view) == 0:
+        return None
+    
+    page, page_size = _page_args()
+    total, result = view.query(
+        filters=parse_filter(request.args.get('filter')),
+        sort=parse_sort(request.args.get('sort')),
+        fields=parse_fields(request.args.get('fields')),
+        page=page,
+        page_size=page_size,
+        columnar=_columnar_requested(),
+    )
+    return {
+        'count': total,
+        'page': page,
+        'page_size': page_size or total,
+        'data': result,
+        'timestamp': view.loaded_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def _pool_cache_headers(response, date_param):
+    """
+    明确指定了已收盘交易日的股票池不会再变化，允许长时间缓存
+    （未指定日期时返回的是"最近交易日"，随时间变化）
+    """
+    if request.args.get('date') and date_param <= trade_calendar.last_closed_day():
+        immutable(response)
+    return response
+
+@api.route('/api/stock/limit-up/previous', methods=['GET'])
 def get_previous_limit_up():
     """
     获取涨停股票池
     参数: date - 日期 (format: 20241009)，可选，默认为今天或最近交易日
+          filter / sort / fields / page / page_size - 见 _query_pool
     """
     try:
-        # 获取日期参数
-        date_param = request.args.get('date', '')
+        # 获取日期参数，解析为不晚于该日期的最近交易日（周末、节假日自动往前推）
+        date_param = trade_calendar.resolve_pool_date(request.args.get('date', ''))
         
-        if date_param:
-            # 如果指定了日期，直接使用
-            target_date = datetime.strptime(date_param, '%Y%m%d')
-        else:
-            # 如果没有指定日期，从今天开始查找最近的交易日
-            target_date = datetime.now()
-        
-        # 尝试获取数据，如果是周末或节假日则往前推
-        max_attempts = 10  # 最多尝试10天，覆盖周末和长假
-        df = None
-        
-        for i in range(max_attempts):
-            current_date = target_date - timedelta(days=i)
-            
-            # 跳过周末
-            if current_date.weekday() >= 5:  # 5=周六, 6=周日
-                continue
-            
-            date_str = current_date.strftime('%Y%m%d')
-            
-            try:
-                df = ak.stock_zt_pool_em(date=date_str)
-                
-                if not df.empty:
-                    # 找到有数据的交易日
-                    date_param = date_str
-                    break
-            except Exception as e:
-                # 该日期可能无数据（节假日），继续尝试前一天
-                print(f"尝试日期 {date_str} 失败: {e}")
-                continue
-        
-        if df is None or df.empty:
+        # 在缓存的列式视图上完成筛选、排序、分页与列裁剪
+        page = _query_pool('zt_pool', date_param)
+        
+        if page is None:
             return jsonify({
                 'success': False,
-                'message': f'未找到最近{max_attempts}天内的涨停数据，可能遇到长假期'
+                'message': f'未找到{date_param}的涨停数据'
             }), 404
         
-        # 转换为列表格式并格式化数值
-        result = format_list_values(df.to_dict('records'))
-        
         # 格式化日期显示
         display_date = datetime.strptime(date_param, '%Y%m%d').strftime('%Y年%m月%d日')
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'count': len(result),
-            'data': result,
+            **page,
             'date': date_param,
             'display_date': display_date,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         })
+        return _pool_cache_headers(response, date_param)
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'查询失败: {str(e)}'
         }), 400
 
-@app.route('/api/stock/strong', methods=['GET'])
+@api.route('/api/stock/strong', methods=['GET'])
 def get_strong_stocks():
     """
     获取强势股票池
     参数: date - 日期 (format: 20241009)，可选，默认为今天或最近交易日
+          filter / sort / fields / page / page_size - 见 _query_pool
     """
     try:
-        # 获取日期参数
-        date_param = request.args.get('date', '')
+        # 获取日期参数，解析为不晚于该日期的最近交易日（周末、节假日自动往前推）
+        date_param = trade_calendar.resolve_pool_date(request.args.get('date', ''))
         
-        if date_param:
-            # 如果指定了日期，直接使用
-            target_date = datetime.strptime(date_param, '%Y%m%d')
-        else:
-            # 如果没有指定日期，从今天开始查找最近的交易日
-            target_date = datetime.now()
-        
-        # 尝试获取数据，如果是周末或节假日则往前推
-        max_attempts = 10
-        df = None
-        
-        for i in range(max_attempts):
-            current_date = target_date - timedelta(days=i)
-            
-            # 跳过周末
-            if current_date.weekday() >= 5:
-                continue
-            
-            date_str = current_date.strftime('%Y%m%d')
-            
-            try:
-                df = ak.stock_zt_pool_strong_em(date=date_str)
-                
-                if not df.empty:
-                    date_param = date_str
-                    break
-            except Exception as e:
-                print(f"尝试日期 {date_str} 失败: {e}")
-                continue
-        
-        if df is None or df.empty:
+        # 在缓存的列式视图上完成筛选、排序、分页与列裁剪
+        page = _query_pool('strong_pool', date_param)
+        
+        if page is None:
             return jsonify({
                 'success': False,
-                'message': f'未找到最近{max_attempts}天内的强势股票数据'
+                'message': f'未找到{date_param}的强势股票数据'
             }), 404
         
-        # 转换为列表格式并格式化数值
-        result = format_list_values(df.to_dict('records'))
-        
         # 格式化日期显示
         display_date = datetime.strptime(date_param, '%Y%m%d').strftime('%Y年%m月%d日')
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'count': len(result),
-            'data': result,
+            **page,
             'date': date_param,
             'display_date': display_date,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         })
+        return _pool_cache_headers(response, date_param)
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'查询失败: {str(e)}'
         }), 400
 
-@app.route('/api/stock/limit-down', methods=['GET'])
+@api.route('/api/stock/limit-down', methods=['GET'])
 def get_limit_down_stocks():
     """
     获取跌停股票池
     参数: date - 日期 (format: 20241009)，可选，默认为今天或最近交易日
+          filter / sort / fields / page / page_size - 见 _query_pool
     """
     try:
-        # 获取日期参数
-        date_param = request.args.get('date', '')
+        # 获取日期参数，解析为不晚于该日期的最近交易日（周末、节假日自动往前推）
+        date_param = trade_calendar.resolve_pool_date(request.args.get('date', ''))
         
-        if date_param:
-            # 如果指定了日期，直接使用
-            target_date = datetime.strptime(date_param, '%Y%m%d')
-        else:
-            # 如果没有指定日期，从今天开始查找最近的交易日
-            target_date = datetime.now()
-        
-        # 尝试获取数据，如果是周末或节假日则往前推
-        max_attempts = 10
-        df = None
-        
-        for i in range(max_attempts):
-            current_date = target_date - timedelta(days=i)
-            
-            # 跳过周末
-            if current_date.weekday() >= 5:
-                continue
-            
-            date_str = current_date.strftime('%Y%m%d')
-            
-            try:
-                df = ak.stock_zt_pool_dtgc_em(date=date_str)
-                
-                if not df.empty:
-                    date_param = date_str
-                    break
-            except Exception as e:
-                print(f"尝试日期 {date_str} 失败: {e}")
-                continue
-        
-        if df is None or df.empty:
+        # 在缓存的列式视图上完成筛选、排序、分页与列裁剪
+        page = _query_pool('dt_pool', date_param)
+        
+        if page is None:
             return jsonify({
                 'success': False,
-                'message': f'未找到最近{max_attempts}天内的跌停股票数据'
+                'message': f'未找到{date_param}的跌停股票数据'
             }), 404
         
-        # 转换为列表格式并格式化数值
-        result = format_list_values(df.to_dict('records'))
-        
         # 格式化日期显示
         display_date = datetime.strptime(date_param, '%Y%m%d').strftime('%Y年%m月%d日')
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'count': len(result),
-            'data': result,
+            **page,
             'date': date_param,
             'display_date': display_date,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        return _pool_cache_headers(response, date_param)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'查询失败: {str(e)}'
+        }), 400
+
+@api.route('/api/pool/archive', methods=['GET'])
+def get_pool_archive_stats():
+    """
+    获取股票池存档的覆盖范围与最近一次回补结果
+    """
+    return jsonify({
+        'success': True,
+        'data': pool_archive.stats(),
+        'last_run': pool_archiver.last_run
+    })
+
+def _ladder_table(day):
+    """
+    计算连板天梯使用的涨停股票池表：已存档的交易日直接使用存档；
+    尚未存档的交易日（如盘中的当天）用上一交易日的存档加上当天的实时股票池
+    返回 (表, 是否全部来自存档, 当天数据的时间)，时间取存档写入时间或实时股票池的加载时间
+    """
+    table = pool_archive.table('zt_pool')
+    if table.day_index(day) is not None:
+        return table, True, pool_archive.written_at('zt_pool', day)
+    previous = trade_calendar.previous_trading_day(day)
+    frames = [(previous, pool_archive.read('zt_pool', previous))] if pool_archive.has('zt_pool', previous) else []
+    view = fetch_pool_view('zt_pool', day)
+    frames.append((day, fetch_zt_pool(day)))
+    return PoolTable(frames), False, view.loaded_at
+
+@api.route('/api/pool/ladder', methods=['GET'])
+def get_pool_ladder():
+    """
+    获取连板天梯：涨停股按连板数分组，附带各级相对上一交易日的晋级率
+    参数: date - 日期 (format: 20241009)，可选，默认为今天或最近交易日
+    """
+    try:
+        date_param = trade_calendar.resolve_pool_date(request.args.get('date', ''))
+        table, archived, updated_at = _ladder_table(date_param)
+        result = ladder(table, date_param)
+        if result is None or result['total'] == 0:
+            return jsonify({
+                'success': False,
+                'message': f'未找到{date_param}的涨停数据'
+            }), 404
+        
+        response = jsonify({
+            'success': True,
+            **result,
+            'timestamp': updated_at.strftime('%Y-%m-%d %H:%M:%S') if updated_at else None
+        })
+        if archived and request.args.get('date'):
+            immutable(response)
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'查询失败: {str(e)}'
+        }), 400
+
+@api.route('/api/pool/history', methods=['GET'])
+def get_pool_history():
+    """
+    获取个股在股票池存档中的历史：每次涨停 / 强势 / 跌停 / 炸板的记录与汇总
+    参数: code - 股票代码，如：600000
+          start_date / end_date - 日期范围 (format: 20240101)，可选
+    """
+    try:
+        stock_code = request.args.get('code', '').strip()
+        if not stock_code:
+            return jsonify({
+                'success': False,
+                'message': '请提供股票代码'
+            }), 400
+        
+        tables = {name: pool_archive.table(name) for name in ARCHIVED_POOLS}
+        result = code_history(
+            tables,
+            stock_code.zfill(6),
+            request.args.get('start_date', '19700101'),
+            request.args.get('end_date', '20500101')
+        )
+        return jsonify({
+            'success': True,
+            **result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'查询失败: {str(e)}'
+        }), 400
+
+@api.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """
+    获取每个存档交易日的涨停 / 跌停 / 炸板统计、炸板率与晋级率，以及滚动窗口的炸板率与晋级率
+    参数: start_date / end_date - 日期范围 (format: 20240101)，可选，默认全部存档
+          window - 滚动窗口（交易日），默认5
+    """
+    try:
+        window = int(request.args.get('window', 5))
+        if not 1 <= window <= POOL_STATS_MAX_WINDOW:
+            raise ValueError(f'window 需在 1 到 {POOL_STATS_MAX_WINDOW} 之间')
+        
+        result = daily_stats(
+            {name: pool_archive.table(name) for name in ARCHIVED_POOLS},
+            request.args.get('start_date', '19700101'),
+            request.args.get('end_date', '20500101'),
+            window
+        )
+        if not result['data']:
+            return jsonify({
+                'success': False,
+                'message': '所选范围内没有股票池存档'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            **result,
+            'count': len(result['data'])
         })
     except Exception as e:
         return jsonify({
@@ -396,18 +991,269 @@ def get_limit_down_stocks():
             'message': f'查询失败: {str(e)}'
         }), 400
 
-@app.route('/api/stock/download', methods=['GET'])
+def _current_analytics():
+    """
+    当前行情快照上的统计对象，快照未就绪时返回 (None, 503 响应)
+    """
+    analytics = market_analytics.current
+    if analytics is None:
+        return None, (jsonify({
+            'success': False,
+            'message': '行情快照尚未就绪，请稍后重试'
+        }), 503)
+    return analytics, None
+
+def _ranking(by, descending):
+    """
+    排行榜通用实现
+    参数: n - 返回条数，默认20，最多 ANALYTICS_MAX_N
+          fields - 返回字段，逗号分隔
+    """
+    analytics, error = _current_analytics()
+    if error:
+        return error
+    try:
+        n = int(request.args.get('n', 20))
+        if not 1 <= n <= ANALYTICS_MAX_N:
+            raise ValueError(f'n 需在 1 到 {ANALYTICS_MAX_N} 之间')
+        data = analytics.top(by, n, descending, parse_fields(request.args.get('fields')))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'by': by,
+        'order': 'desc' if descending else 'asc',
+        'count': len(data),
+        'data': data,
+        'timestamp': analytics.snapshot.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+@api.route('/api/market/top', methods=['GET'])
+def get_market_top():
+    """
+    按任意数值字段排行
+    参数: by - 排序字段，默认 涨跌幅
+          order - desc（默认）/ asc
+          n / fields - 见 _ranking
+    """
+    order = request.args.get('order', 'desc')
+    if order not in ('desc', 'asc'):
+        return jsonify({'success': False, 'message': f'不支持的排序方向: {order}'}), 400
+    return _ranking(request.args.get('by', '涨跌幅'), order == 'desc')
+
+@api.route('/api/market/gainers', methods=['GET'])
+def get_market_gainers():
+    """
+    涨幅榜，参数见 _ranking
+    """
+    return _ranking('涨跌幅', True)
+
+@api.route('/api/market/losers', methods=['GET'])
+def get_market_losers():
+    """
+    跌幅榜，参数见 _ranking
+    """
+    return _ranking('涨跌幅', False)
+
+@api.route('/api/market/turnover', methods=['GET'])
+def get_market_turnover():
+    """
+    成交榜
+    参数: by - 成交额（默认）/ 换手率
+          n / fields - 见 _ranking
+    """
+    by = request.args.get('by', '成交额')
+    if by not in ('成交额', '换手率'):
+        return jsonify({'success': False, 'message': f'不支持的排序字段: {by}'}), 400
+    return _ranking(by, True)
+
+@api.route('/api/market/industries', methods=['GET'])
+def get_market_industries():
+    """
+    行业汇总：股票数、平均/流通市值加权涨跌幅、总成交额、总市值、涨跌家数与领涨股，
+    以及全市场的涨跌家数统计
+    参数: sort - 排序字段，- 表示降序，默认 -平均涨跌幅
+    """
+    analytics, error = _current_analytics()
+    if error:
+        return error
+    if not industry_map.ready:
+        return jsonify({
+            'success': False,
+            'message': '行业分类尚未就绪，请稍后重试'
+        }), 503
+    
+    sort = request.args.get('sort', '-平均涨跌幅')
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in INDUSTRY_FIELDS:
+        return jsonify({'success': False, 'message': f'不支持的排序字段: {field}'}), 400
+    
+    # 汇总结果在快照版本内共享，这里只复制列表再排序，缺失值排在最后
+    rows = analytics.industries()
+    rows = sorted(
+        (row for row in rows if row[field] is not None), key=lambda row: row[field], reverse=descending
+    ) + [row for row in rows if row[field] is None]
+    return jsonify({
+        'success': True,
+        'count': len(rows),
+        'market': analytics.market(),
+        'data': rows,
+        'timestamp': analytics.snapshot.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+@api.route('/api/market/rank', methods=['GET'])
+def get_market_rank():
+    """
+    个股在全市场中的百分位与名次
+    参数: code - 股票代码
+          by - 字段，默认 涨跌幅
+    """
+    stock_code = request.args.get('code')
+    if not stock_code:
+        return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
+    
+    analytics, error = _current_analytics()
+    if error:
+        return error
+    by = request.args.get('by', '涨跌幅')
+    try:
+        rank = analytics.percentile(stock_code, by)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if rank is None:
+        return jsonify({
+            'success': False,
+            'message': '未找到该股票代码'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'code': stock_code,
+        'by': by,
+        'industry': industry_map.industry_of(stock_code),
+        **rank,
+        'timestamp': analytics.snapshot.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+@api.route('/api/screener', methods=['GET'])
+def screen_stocks():
+    """
+    选股：在全市场行情快照上按条件表达式筛选（不请求上游）
+    参数: expr - 条件表达式，如：涨跌幅 > 5 and 换手率 between 3 and 15 and 所属行业 in [半导体, 光伏设备]
+          indicators - 技术指标（可选，格式同历史行情），如：MA:5:20,CROSS:MA5:MA20
+          indicator_expr - 指标条件（可选），如：CROSS_MA5_MA20 = 1 and MA5 > MA20，
+                           在本地历史K线的最近一根已收盘K线上计算
+          period / adjust - 指标使用的K线周期与复权方式，默认 daily / 不复权
+          sort - 排序字段，逗号分隔，- 表示降序，如：-涨跌幅
+          fields - 返回字段，逗号分隔，默认为常用字段加表达式中引用的字段
+          page / page_size - 分页（从1开始），不传 page_size 时返回全部
+          format - records（默认）/ columnar（data 为 {columns, arrays}）
+    """
+    expr = request.args.get('expr', '').strip()
+    if not expr:
+        return jsonify({'success': False, 'message': '缺少条件表达式参数 expr'}), 400
+    
+    analytics, error = _current_analytics()
+    if error:
+        return error
+    try:
+        page, page_size = _page_args()
+        indicators, crosses = parse_indicators(request.args.get('indicators'))
+        result = screener.screen(
+            analytics,
+            expr,
+            sort=parse_sort(request.args.get('sort')),
+            fields=parse_fields(request.args.get('fields')),
+            page=page,
+            page_size=page_size,
+            columnar=_columnar_requested(),
+            indicator_expr=request.args.get('indicator_expr', '').strip() or None,
+            indicators=indicators,
+            crosses=crosses,
+            period=request.args.get('period', 'daily'),
+            adjust=request.args.get('adjust', ''),
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        **result,
+        'page': page,
+        'page_size': page_size or result['count'],
+        'timestamp': analytics.snapshot.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+def _export_format():
+    """
+    解析导出格式参数 format（xlsx / csv / csv.gz），不支持时返回 None
+    """
+    fmt = request.args.get('format', 'xlsx')
+    return fmt if fmt in EXPORT_FORMATS else None
+
+def _attachment_headers(filename):
+    """
+    生成下载文件的 Content-Disposition 参数（非 ASCII 文件名使用 filename*）
+    """
+    try:
+        filename.encode('ascii')
+        return {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='')}"}
+
+def _send_cached_export(cache_key, filename, fmt):
+    """
+    命中磁盘导出缓存时直接返回文件，否则返回 None
+    """
+    path = export_cache.lookup(export_cache.path(cache_key, fmt)) if cache_key else None
+    if path is None:
+        return None
+    return send_file(path, mimetype=EXPORT_FORMATS[fmt][1], as_attachment=True, download_name=filename)
+
+def _export_response(sheets, filename, fmt, cache_key=None):
+    """
+    生成导出响应
+    xlsx 使用只写模式生成（内存占用恒定）；csv / csv.gz 边生成边分块发送。
+    cache_key 不为空时同时写入磁盘导出缓存
+    """
+    mimetype = EXPORT_FORMATS[fmt][1]
+    cache_path = export_cache.path(cache_key, fmt) if cache_key else None
+    
+    if fmt == 'xlsx':
+        if cache_path:
+            export_cache.write_xlsx(cache_path, sheets)
+            return send_file(cache_path, mimetype=mimetype, as_attachment=True, download_name=filename)
+        output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        write_xlsx(sheets, output)
+        output.seek(0)
+        return send_file(output, mimetype=mimetype, as_attachment=True, download_name=filename)
+    
+    chunks = iter_csv(sheets, compress=(fmt == 'csv.gz'))
+    if cache_path:
+        chunks = export_cache.tee(chunks, cache_path)
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', **_attachment_headers(filename))
+    return response
+
+@api.route('/api/stock/download', methods=['GET'])
 def download_stock_data():
     """
-    下载股票历史数据为Excel
+    下载股票历史数据为Excel / CSV
     参数: 
         code - 股票代码（查询参数）
         days - 天数，默认7天
+        format - 导出格式 xlsx（默认）/ csv / csv.gz
     """
     stock_code = request.args.get('code')
     if not stock_code:
         return jsonify({'success': False, 'message': '缺少股票代码参数'}), 400
     
+    fmt = _export_format()
+    if fmt is None:
+        return jsonify({'success': False, 'message': '不支持的导出格式'}), 400
+    
     try:
         # 获取天数参数，默认7天
         days = int(request.args.get('days', 7))
@@ -416,14 +1262,17 @@ def download_stock_data():
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # 1. 获取基本信息
-        stock_info = ak.stock_individual_info_em(symbol=stock_code)
+        # 1. 获取实时数据（读取共享行情快照），代码不存在时直接返回，不再请求上游
+        snapshot = market_snapshot.current
+        if snapshot is None:
+            return jsonify({
+                'success': False,
+                'message': '行情快照尚未就绪，请稍后重试'
+            }), 503
         
-        # 2. 获取实时数据
-        df_spot = ak.stock_zh_a_spot_em()
-        realtime_data = df_spot[df_spot['代码'] == stock_code]
+        realtime_data = snapshot.get_frame(stock_code)
         
-        if realtime_data.empty:
+        if realtime_data is None:
             return jsonify({
                 'success': False,
                 'message': '未找到该股票代码'
@@ -431,78 +1280,80 @@ def download_stock_data():
         
         stock_name = realtime_data['名称'].values[0]
         
-        # 3. 获取历史数据
-        history_df = ak.stock_zh_a_hist(
-            symbol=stock_code,
-            period='daily',
-            start_date=start_date.strftime('%Y%m%d'),
-            end_date=end_date.strftime('%Y%m%d'),
-            adjust=''
-        )
+        # 生成文件名
+        period_text = f'近{days}天' if days <= 31 else f'近{days//30}个月'
+        filename = f"{stock_code}_{stock_name}_{period_text}数据_{datetime.now().strftime('%Y%m%d')}.{EXPORT_FORMATS[fmt][0]}"
+        
+        # 最近交易日已收盘时数据不再变化，相同代码和天数的导出按交易日缓存
+        trade_day = trade_calendar.latest_trading_day(datetime.now().strftime('%Y%m%d'))
+        cache_key = None
+        if trade_day <= trade_calendar.last_closed_day():
+            cache_key = ('stock', stock_code, days, trade_day)
+            cached = _send_cached_export(cache_key, filename, fmt)
+            if cached is not None:
+                return cached
+        
+        # 2. 并发获取基本信息、历史数据和今天的分时数据
+        #    （分时成交已有收盘后的完整存档时直接读取存档，不再拉取全天成交）
+        calls = {
+            'basic_info': (fetch_stock_info, stock_code),
+            'history': (
+                fetch_stock_hist, stock_code, 'daily',
+                start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d'), ''
+            ),
+        }
+        tick_day = trade_calendar.latest_trading_day(datetime.now().strftime('%Y%m%d'))
+        archived = tick_store.is_complete(tick_day, stock_code)
+        if not archived:
+            calls['intraday'] = (fetch_intraday, stock_code)
+        results = gather(calls)
+        if archived:
+            results['intraday'] = (to_frame(tick_store.read(tick_day, stock_code)), None)
+        
+        # 基本信息和历史数据是必需的，失败时整体报错
+        stock_info, error = results['basic_info']
+        if error is not None:
+            raise error
+        history_df, error = results['history']
+        if error is not None:
+            raise error
         
         # 格式化数值列（保留3位小数）
-        for col in stock_info.columns:
-            if col == 'value':
-                stock_info[col] = stock_info[col].apply(lambda x: format_numeric_value(x))
+        stock_info = format_frame(stock_info, exclude=['item'])
         
         # 格式化实时数据的数值列
-        for col in realtime_data.columns:
-            if col not in ['代码', '名称', '所属行业']:
-                realtime_data[col] = realtime_data[col].apply(lambda x: format_numeric_value(x))
+        realtime_data = format_frame(realtime_data, exclude=['代码', '名称', '所属行业'])
         
         # 格式化历史数据的数值列
         if not history_df.empty:
-            for col in history_df.columns:
-                if col != '日期':
-                    history_df[col] = history_df[col].apply(lambda x: format_numeric_value(x))
+            history_df = format_frame(history_df, exclude=['日期'])
         
-        # 4. 获取今天的分时数据
-        intraday_df = None
-        try:
-            intraday_df = ak.stock_intraday_em(symbol=stock_code)
-            if not intraday_df.empty:
-                # 格式化分时数据的数值列
-                for col in intraday_df.columns:
-                    if col not in ['时间']:
-                        intraday_df[col] = intraday_df[col].apply(lambda x: format_numeric_value(x))
-        except Exception as e:
-            print(f"获取分时数据失败: {e}")
-        
-        # 创建Excel文件
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # 工作表1: 基本信息
-            stock_info.to_excel(writer, sheet_name='基本信息', index=False)
-            
-            # 工作表2: 实时数据（添加当前时间）
-            # 添加查询时间列
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            realtime_data_copy = realtime_data.copy()
-            realtime_data_copy.insert(0, '查询时间', current_time)
-            realtime_data_copy.to_excel(writer, sheet_name='实时数据', index=False)
-            
-            # 工作表3: 今日分时数据
-            if intraday_df is not None and not intraday_df.empty:
-                intraday_df.to_excel(writer, sheet_name='今日分时数据', index=False)
-            
-            # 工作表4: 历史数据
-            if not history_df.empty:
-                sheet_name = f'近{days}天历史数据' if days <= 31 else f'近{days//30}个月历史数据'
-                history_df.to_excel(writer, sheet_name=sheet_name, index=False)
+        # 分时数据可选，获取失败时不生成该工作表
+        intraday_df, error = results['intraday']
+        if error is not None:
+            print(f"获取分时数据失败: {error}")
+        elif not intraday_df.empty:
+            # 格式化分时数据的数值列
+            intraday_df = format_frame(intraday_df, exclude=['时间'])
         
-        output.seek(0)
+        # 工作表1: 基本信息
+        sheets = [('基本信息', stock_info)]
         
-        # 生成文件名
-        period_text = f'近{days}天' if days <= 31 else f'近{days//30}个月'
-        filename = f"{stock_code}_{stock_name}_{period_text}数据_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        # 工作表2: 实时数据（添加查询时间列）
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        realtime_data.insert(0, '查询时间', current_time)
+        sheets.append(('实时数据', realtime_data))
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        # 工作表3: 今日分时数据
+        if intraday_df is not None and not intraday_df.empty:
+            sheets.append(('今日分时数据', intraday_df))
+        
+        # 工作表4: 历史数据
+        if not history_df.empty:
+            sheet_name = f'近{days}天历史数据' if days <= 31 else f'近{days//30}个月历史数据'
+            sheets.append((sheet_name, history_df))
+        
+        return _export_response(sheets, filename, fmt, cache_key)
         
     except Exception as e:
         return jsonify({
@@ -510,77 +1361,48 @@ def download_stock_data():
             'message': f'下载失败: {str(e)}'
         }), 400
 
-@app.route('/api/stock/download-limit-up', methods=['GET'])
+@api.route('/api/stock/download-limit-up', methods=['GET'])
 def download_limit_up_data():
     """
-    下载涨停股票池数据为Excel
+    下载涨停股票池数据为Excel / CSV
     参数: 
         date - 日期，格式 YYYYMMDD，可选
+        format - 导出格式 xlsx（默认）/ csv / csv.gz
     """
+    fmt = _export_format()
+    if fmt is None:
+        return jsonify({'success': False, 'message': '不支持的导出格式'}), 400
+    
     try:
-        # 获取日期参数
-        date_param = request.args.get('date', '')
+        # 获取日期参数，解析为不晚于该日期的最近交易日（周末、节假日自动往前推）
+        date_param = trade_calendar.resolve_pool_date(request.args.get('date', ''))
         
-        if date_param:
-            target_date = datetime.strptime(date_param, '%Y%m%d')
-        else:
-            target_date = datetime.now()
-        
-        # 尝试获取数据
-        max_attempts = 10
-        df = None
-        
-        for i in range(max_attempts):
-            current_date = target_date - timedelta(days=i)
-            
-            if current_date.weekday() >= 5:
-                continue
-            
-            date_str = current_date.strftime('%Y%m%d')
-            
-            try:
-                df = ak.stock_zt_pool_em(date=date_str)
-                
-                if not df.empty:
-                    date_param = date_str
-                    break
-            except Exception as e:
-                print(f"尝试日期 {date_str} 失败: {e}")
-                continue
-        
-        if df is None or df.empty:
+        filename = f"涨停股票池_{date_param}.{EXPORT_FORMATS[fmt][0]}"
+        
+        # 已收盘交易日的股票池不再变化，导出结果按交易日缓存
+        cache_key = None
+        if date_param <= trade_calendar.last_closed_day():
+            cache_key = ('limit_up', date_param)
+            cached = _send_cached_export(cache_key, filename, fmt)
+            if cached is not None:
+                return cached
+        
+        df = fetch_zt_pool(date_param)
+        
+        if df.empty:
             return jsonify({
                 'success': False,
-                'message': '未找到涨停数据'
+                'message': f'未找到{date_param}的涨停数据'
             }), 404
         
         # 格式化数值列
-        for col in df.columns:
-            if col not in ['代码', '名称', '所属行业', '首次封板时间', '最后封板时间', '涨停统计', '涨停开板']:
-                df[col] = df[col].apply(lambda x: format_numeric_value(x))
+        df = format_frame(df, exclude=['代码', '名称', '所属行业', '首次封板时间', '最后封板时间', '涨停统计', '涨停开板'])
         
         # 添加查询时间列
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         df.insert(0, '查询时间', current_time)
         
-        # 创建Excel文件
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='涨停股票池', index=False)
-        
-        output.seek(0)
-        
-        # 格式化日期显示
-        display_date = datetime.strptime(date_param, '%Y%m%d').strftime('%Y%m%d')
-        filename = f"涨停股票池_{display_date}.xlsx"
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return _export_response([('涨停股票池', df)], filename, fmt, cache_key)
         
     except Exception as e:
         return jsonify({
@@ -588,77 +1410,48 @@ def download_limit_up_data():
             'message': f'下载失败: {str(e)}'
         }), 400
 
-@app.route('/api/stock/download-limit-down', methods=['GET'])
+@api.route('/api/stock/download-limit-down', methods=['GET'])
 def download_limit_down_data():
     """
-    下载跌停股票池数据为Excel
+    下载跌停股票池数据为Excel / CSV
     参数: 
         date - 日期，格式 YYYYMMDD，可选
+        format - 导出格式 xlsx（默认）/ csv / csv.gz
     """
+    fmt = _export_format()
+    if fmt is None:
+        return jsonify({'success': False, 'message': '不支持的导出格式'}), 400
+    
     try:
-        # 获取日期参数
-        date_param = request.args.get('date', '')
+        # 获取日期参数，解析为不晚于该日期的最近交易日（周末、节假日自动往前推）
+        date_param = trade_calendar.resolve_pool_date(request.args.get('date', ''))
         
-        if date_param:
-            target_date = datetime.strptime(date_param, '%Y%m%d')
-        else:
-            target_date = datetime.now()
-        
-        # 尝试获取数据
-        max_attempts = 10
-        df = None
-        
-        for i in range(max_attempts):
-            current_date = target_date - timedelta(days=i)
-            
-            if current_date.weekday() >= 5:
-                continue
-            
-            date_str = current_date.strftime('%Y%m%d')
-            
-            try:
-                df = ak.stock_zt_pool_dtgc_em(date=date_str)
-                
-                if not df.empty:
-                    date_param = date_str
-                    break
-            except Exception as e:
-                print(f"尝试日期 {date_str} 失败: {e}")
-                continue
-        
-        if df is None or df.empty:
+        filename = f"跌停股票池_{date_param}.{EXPORT_FORMATS[fmt][0]}"
+        
+        # 已收盘交易日的股票池不再变化，导出结果按交易日缓存
+        cache_key = None
+        if date_param <= trade_calendar.last_closed_day():
+            cache_key = ('limit_down', date_param)
+            cached = _send_cached_export(cache_key, filename, fmt)
+            if cached is not None:
+                return cached
+        
+        df = fetch_dt_pool(date_param)
+        
+        if df.empty:
             return jsonify({
                 'success': False,
-                'message': '未找到跌停数据'
+                'message': f'未找到{date_param}的跌停股票数据'
             }), 404
         
         # 格式化数值列
-        for col in df.columns:
-            if col not in ['代码', '名称', '所属行业']:
-                df[col] = df[col].apply(lambda x: format_numeric_value(x))
+        df = format_frame(df, exclude=['代码', '名称', '所属行业'])
         
         # 添加查询时间列
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         df.insert(0, '查询时间', current_time)
         
-        # 创建Excel文件
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='跌停股票池', index=False)
-        
-        output.seek(0)
-        
-        # 格式化日期显示
-        display_date = datetime.strptime(date_param, '%Y%m%d').strftime('%Y%m%d')
-        filename = f"跌停股票池_{display_date}.xlsx"
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return _export_response([('跌停股票池', df)], filename, fmt, cache_key)
         
     except Exception as e:
         return jsonify({
@@ -666,16 +1459,97 @@ def download_limit_down_data():
             'message': f'下载失败: {str(e)}'
         }), 400
 
-if __name__ == '__main__':
-    import os
-    import socket
+class _TimedJSONProvider(DefaultJSONProvider):
+    """
+    JSON 序列化耗时计入 json 阶段
+    """
+
+    def dumps(self, obj, **kwargs):
+        with metrics.timed('json'):
+            return super().dumps(obj, **kwargs)
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.in_flight_route = _route_label()
+    metrics.requests_in_flight.inc(g.in_flight_route)
+    metrics.start_request_timing()
+    # 本请求所有上游调用的时间预算，以及降级返回的过期缓存数据记录
+    start_deadline()
+    track_stale()
+
+def _finish_request(response):
+    # 流式响应记录的是生成响应头之前的耗时
+    elapsed = time.perf_counter() - g.request_start
+    metrics.request_duration.observe(elapsed, request.method, _route_label(), str(response.status_code))
+    if metrics.SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing_header(elapsed)
+    return response
+
+def _end_request(error=None):
+    clear_deadline()
+    route = g.pop('in_flight_route', None)
+    if route is not None:
+        metrics.requests_in_flight.dec(route)
+
+def create_app():
+    """
+    应用工厂：创建 Flask 应用、注册路由并启动后台服务
+    """
+    # 上游请求的全局 socket 超时，避免单个慢请求长时间占用线程
+    socket.setdefaulttimeout(float(os.environ.get('SOCKET_TIMEOUT', 30)))
+    
+    app = Flask(__name__)
+    app.json = _TimedJSONProvider(app)
+    
+    # 配置CORS - 简化配置，允许所有来源
+    CORS(app, 
+         resources={r"/api/*": {"origins": "*"}},
+         allow_headers=["Content-Type", "Authorization"],
+         methods=["GET", "POST", "OPTIONS"],
+         supports_credentials=False)
     
-    # 设置全局 socket 超时
-    socket.setdefaulttimeout(30)
+    app.register_blueprint(api)
+    
+    # 请求耗时、在途请求数与 Server-Timing（after_request 按注册的逆序执行，
+    # 先注册保证在压缩之后执行，Server-Timing 包含压缩耗时）
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    
+    # 完整生成的响应统一添加 ETag（支持 304）并按 Accept-Encoding 压缩
+    app.after_request(encode_response)
+    
+    # 使用了过期缓存数据的响应加上 stale 标记（后注册先执行，在计算 ETag 之前）
+    app.after_request(mark_stale)
+    
+    # akshare 的 HTTP 请求改走共享连接池，并按主机限流
+    upstream.install()
+    
+    # 启动全市场行情快照的后台刷新
+    market_snapshot.start()
+    
+    # 关注列表的分时成交采集（未配置 TICK_WATCHLIST 时不启动）
+    tick_collector.start()
+    
+    # 启动时预热一次缓存，之后每个交易日开盘前、收盘后各预热一次
+    prewarmer.start()
+    
+    # 股票池存档：回补最近 POOL_ARCHIVE_DAYS 个交易日，之后每个交易日收盘后追加
+    pool_archiver.start()
+    
+    # 多进程部署时定期写入本进程的指标快照（未设置 PROMETHEUS_MULTIPROC_DIR 时不启动）
+    metrics.snapshot_writer.start()
+    
+    return app
+
+if __name__ == '__main__':
+    # 本地开发使用 Flask 自带的 Werkzeug 服务器；生产环境请使用 gunicorn（见 wsgi.py / gunicorn.conf.py）
+    app = create_app()
     
     # 生产环境使用环境变量PORT，本地开发使用5000
     port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('FLASK_ENV', 'development') == 'development'
     
-    # Render 部署时使用 Werkzeug 服务器（对于小项目足够）
     app.run(debug=False, host='0.0.0.0', port=port, threaded=True)
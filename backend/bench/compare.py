@@ -0,0 +1,60 @@
+"""
+对比两次基准测试结果，列出每项指标的变化，超过阈值的退化标记出来
+
+用法:
+    python bench/compare.py bench/results/<旧>.json bench/results/<新>.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# 指标名 → 数值越大越好
+E2E_METRICS = {'rps': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'response_bytes': False}
+MICRO_METRICS = {'median_ms': False}
+
+
+def _rows(old, new, metrics):
+    for name in sorted(set(old) & set(new)):
+        for metric, higher_is_better in metrics.items():
+            a, b = old[name].get(metric), new[name].get(metric)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            regression = -change if higher_is_better else change
+            yield name, metric, a, b, change, regression
+
+
+def compare(old, new, threshold):
+    rows = []
+    for suite, metrics in (('micro', MICRO_METRICS), ('e2e', E2E_METRICS)):
+        if suite in old and suite in new:
+            for row in _rows(old[suite]['results'], new[suite]['results'], metrics):
+                rows.append((suite,) + row)
+
+    regressions = 0
+    print(f"{old['meta'].get('commit')} → {new['meta'].get('commit')}")
+    for suite, name, metric, a, b, change, regression in rows:
+        flag = ''
+        if regression > threshold:
+            flag = '  <-- 退化'
+            regressions += 1
+        print(f'{suite:5s} {name:28s} {metric:14s} {a:>12} → {b:>12} {change:+7.1f}%{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比两次基准测试结果')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10, help='退化超过该百分比时标记')
+    args = parser.parse_args()
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    # 存在退化时以非零状态退出，便于在 CI 中使用
+    sys.exit(1 if compare(old, new, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+"""
+离线替身 akshare 模块：回放录制的 DataFrame，没有录制数据时生成确定性的合成数据，并可模拟上游延迟
+
+用法:
+    # 录制（需要网络与真实的 akshare），保存到 bench/fixtures/
+    python bench/fake_ak.py record --codes 600000,000001 --date 20241009
+
+    # 在导入 app 之前安装替身
+    from bench import fake_ak
+    fake_ak.install(latency_ms=30, jitter_ms=10)
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import types
+import zlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+INDUSTRIES = ('半导体', '光伏设备', '通信设备', '银行', '医疗器械', '汽车零部件', '软件开发', '化学制品', '电力', '白酒')
+
+
+def _rng(*parts):
+    """
+    按参数生成固定种子的随机数发生器，相同参数每次得到相同数据
+    """
+    return np.random.default_rng(zlib.crc32('|'.join(map(str, parts)).encode('utf-8')))
+
+
+def _codes(n):
+    prefixes = ('600', '601', '603', '000', '002', '300')
+    return [f'{prefixes[i % len(prefixes)]}{i // len(prefixes):03d}' for i in range(n)]
+
+
+def _weekdays(start, end):
+    days = pd.bdate_range(start, end)
+    return [d.date() for d in days]
+
+
+class FakeAkshare(types.ModuleType):
+    """
+    与 akshare 同名的函数集合
+
+    fixtures 目录下存在 <函数名>__<参数>.pkl 时回放录制数据，否则生成合成数据；
+    每次调用先按 latency_ms ± jitter_ms 休眠，模拟上游耗时
+    """
+
+    def __init__(self, fixtures=FIXTURE_DIR, latency_ms=0.0, jitter_ms=0.0, market_size=5000, pool_size=120):
+        super().__init__('akshare')
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.market_size = market_size
+        self.pool_size = pool_size
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._loaded = {}
+
+    # ---- 公共机制 ----
+
+    def _enter(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _fixture(self, name, *key):
+        """
+        读取录制数据，不存在时返回 None
+        """
+        path = os.path.join(self.fixtures, '__'.join((name,) + tuple(str(k) for k in key)) + '.pkl')
+        if path not in self._loaded:
+            self._loaded[path] = pd.read_pickle(path) if os.path.exists(path) else None
+        df = self._loaded[path]
+        return None if df is None else df.copy()
+
+    # ---- akshare 接口 ----
+
+    def tool_trade_date_hist_sina(self):
+        self._enter('tool_trade_date_hist_sina')
+        df = self._fixture('tool_trade_date_hist_sina')
+        if df is not None:
+            return df
+        # 合成日历：到明年年底为止的所有工作日
+        return pd.DataFrame({'trade_date': _weekdays('1990-12-19', f'{date.today().year + 1}-12-31')})
+
+    def stock_zh_a_spot_em(self):
+        self._enter('stock_zh_a_spot_em')
+        df = self._fixture('stock_zh_a_spot_em')
+        if df is not None:
+            return df
+        n = self.market_size
+        # 每分钟变化一次，便于观察行情推送的增量
+        rng = _rng('spot', datetime.now().strftime('%Y%m%d%H%M'))
+        close = rng.uniform(3, 80, n).round(2)
+        change = rng.normal(0, 2.5, n).clip(-10, 10).round(2)
+        price = (close * (1 + change / 100)).round(2)
+        volume = rng.integers(1_000, 2_000_000, n)
+        return pd.DataFrame({
+            '序号': np.arange(1, n + 1),
+            '代码': _codes(n),
+            '名称': [f'股票{i:04d}' for i in range(n)],
+            '最新价': price,
+            '涨跌幅': change,
+            '涨跌额': (price - close).round(2),
+            '成交量': volume,
+            '成交额': (volume * price * 100).round(0),
+            '振幅': rng.uniform(0, 12, n).round(2),
+            '最高': (price * 1.02).round(2),
+            '最低': (price * 0.98).round(2),
+            '今开': (close * (1 + rng.normal(0, 0.01, n))).round(2),
+            '昨收': close,
+            '量比': rng.uniform(0.2, 5, n).round(2),
+            '换手率': rng.uniform(0.1, 25, n).round(2),
+            '市盈率-动态': rng.uniform(-50, 200, n).round(2),
+            '市净率': rng.uniform(0.4, 15, n).round(2),
+            '总市值': rng.uniform(2e9, 2e12, n).round(0),
+            '流通市值': rng.uniform(1e9, 1e12, n).round(0),
+            '涨速': rng.normal(0, 0.5, n).round(2),
+            '5分钟涨跌': rng.normal(0, 0.8, n).round(2),
+            '60日涨跌幅': rng.normal(0, 20, n).round(2),
+            '年初至今涨跌幅': rng.normal(0, 30, n).round(2),
+        })
+
+    def stock_individual_info_em(self, symbol, timeout=None):
+        self._enter('stock_individual_info_em')
+        df = self._fixture('stock_individual_info_em', symbol)
+        if df is not None:
+            return df
+        rng = _rng('info', symbol)
+        return pd.DataFrame({
+            'item': ['最新', '股票代码', '股票简称', '总股本', '流通股', '总市值', '流通市值', '行业', '上市时间'],
+            'value': [
+                round(float(rng.uniform(3, 80)), 2), symbol, f'股票{symbol}', round(float(rng.uniform(1e8, 3e10)), 0),
+                round(float(rng.uniform(1e8, 3e10)), 0), round(float(rng.uniform(2e9, 2e12)), 0),
+                round(float(rng.uniform(1e9, 1e12)), 0), INDUSTRIES[int(rng.integers(len(INDUSTRIES)))], 20000101,
+            ],
+        })
+
+    def stock_zh_a_hist(self, symbol='000001', period='daily', start_date='19700101', end_date='20500101',
+                        adjust='', timeout=None):
+        self._enter('stock_zh_a_hist')
+        df = self._fixture('stock_zh_a_hist', symbol, period, adjust or 'bfq')
+        if df is None:
+            df = self._synthetic_hist(symbol, period, adjust)
+        days = pd.to_datetime(df['日期'])
+        mask = (days >= pd.Timestamp(start_date)) & (days <= pd.Timestamp(end_date))
+        return df[mask].reset_index(drop=True)
+
+    def _synthetic_hist(self, symbol, period, adjust):
+        key = ('hist', symbol, period, adjust)
+        cached = self._loaded.get(key)
+        if cached is not None:
+            return cached
+        daily = pd.DatetimeIndex(_weekdays('2005-01-04', date.today()))
+        if period == 'weekly':
+            dates = daily.to_series().groupby(daily.to_period('W')).max()
+        elif period == 'monthly':
+            dates = daily.to_series().groupby(daily.to_period('M')).max()
+        else:
+            dates = daily.to_series()
+        n = len(dates)
+        rng = _rng('hist', symbol, period)
+        change = rng.normal(0.0003, 0.02, n).clip(-0.1, 0.1)
+        close = (10 * np.cumprod(1 + change)).round(2)
+        prev = np.concatenate([[close[0]], close[:-1]])
+        open_ = (prev * (1 + rng.normal(0, 0.005, n))).round(2)
+        high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n))
+        low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n))
+        volume = rng.integers(10_000, 5_000_000, n)
+        df = pd.DataFrame({
+            '日期': [d.date() for d in dates],
+            '股票代码': symbol,
+            '开盘': open_,
+            '收盘': close,
+            '最高': high.round(2),
+            '最低': low.round(2),
+            '成交量': volume,
+            '成交额': (volume * close * 100).round(0),
+            '振幅': ((high - low) / prev * 100).round(2),
+            '涨跌幅': ((close - prev) / prev * 100).round(2),
+            '涨跌额': (close - prev).round(2),
+            '换手率': rng.uniform(0.1, 15, n).round(2),
+        })
+        self._loaded[key] = df
+        return df
+
+    def _pool(self, kind, day, columns):
+        rng = _rng(kind, day)
+        n = self.pool_size
+        # 涨停、炸板股票从较小的范围中抽取，相邻交易日有重合，连板晋级统计才有数据
+        universe = min(self.market_size, n * 4) if kind in ('zt', 'zb') else self.market_size
+        codes = [_codes(self.market_size)[i] for i in rng.choice(universe, n, replace=False)]
+        base = {
+            '序号': np.arange(1, n + 1),
+            '代码': codes,
+            '名称': [f'股票{code}' for code in codes],
+            '涨跌幅': rng.uniform(9.8, 20.1, n).round(2) if kind != 'dt' else -rng.uniform(9.8, 20.1, n).round(2),
+            '最新价': rng.uniform(3, 80, n).round(2),
+            '成交额': rng.uniform(5e7, 5e9, n).round(0),
+            '流通市值': rng.uniform(1e9, 2e11, n).round(0),
+            '总市值': rng.uniform(2e9, 4e11, n).round(0),
+            '换手率': rng.uniform(0.5, 40, n).round(2),
+            '所属行业': [INDUSTRIES[i] for i in rng.integers(len(INDUSTRIES), size=n)],
+        }
+        seal = [f'{h:02d}{m:02d}00' for h, m in zip(rng.choice([9, 10, 11, 13, 14], n), rng.integers(0, 59, n))]
+        extra = {
+            '封板资金': rng.uniform(1e6, 2e9, n).round(0),
+            '封单资金': rng.uniform(1e6, 2e9, n).round(0),
+            '首次封板时间': seal,
+            '最后封板时间': seal,
+            '炸板次数': rng.integers(0, 5, n),
+            '开板次数': rng.integers(0, 5, n),
+            '涨停统计': [f'{a}/{a + b}' for a, b in zip(rng.integers(1, 6, n), rng.integers(0, 4, n))],
+            '连板数': rng.choice([1, 1, 1, 1, 2, 2, 3, 4, 5, 7], n),
+            '连续跌停': rng.choice([1, 1, 1, 2, 3], n),
+            '涨停价': rng.uniform(3, 80, n).round(2),
+            '涨速': rng.normal(0, 0.5, n).round(2),
+            '是否新高': rng.choice(['是', '否'], n),
+            '量比': rng.uniform(0.3, 8, n).round(2),
+            '入选理由': rng.choice(['60日新高', '近期多次涨停', '60日新高且近期多次涨停'], n),
+            '动态市盈率': rng.uniform(-50, 200, n).round(2),
+            '板上成交额': rng.uniform(1e6, 5e8, n).round(0),
+            '振幅': rng.uniform(2, 20, n).round(2),
+        }
+        data = dict(base, **extra)
+        return pd.DataFrame({col: data[col] for col in columns})
+
+    def stock_zt_pool_em(self, date='20241009'):
+        self._enter('stock_zt_pool_em')
+        df = self._fixture('stock_zt_pool_em', date)
+        if df is not None:
+            return df
+        return self._pool('zt', date, [
+            '序号', '代码', '名称', '涨跌幅', '最新价', '成交额', '流通市值', '总市值', '换手率', '封板资金',
+            '首次封板时间', '最后封板时间', '炸板次数', '涨停统计', '连板数', '所属行业',
+        ])
+
+    def stock_zt_pool_strong_em(self, date='20241009'):
+        self._enter('stock_zt_pool_strong_em')
+        df = self._fixture('stock_zt_pool_strong_em', date)
+        if df is not None:
+            return df
+        return self._pool('strong', date, [
+            '序号', '代码', '名称', '涨跌幅', '最新价', '涨停价', '成交额', '流通市值', '总市值', '换手率',
+            '涨速', '是否新高', '量比', '涨停统计', '入选理由', '所属行业',
+        ])
+
+    def stock_zt_pool_dtgc_em(self, date='20241009'):
+        self._enter('stock_zt_pool_dtgc_em')
+        df = self._fixture('stock_zt_pool_dtgc_em', date)
+        if df is not None:
+            return df
+        return self._pool('dt', date, [
+            '序号', '代码', '名称', '涨跌幅', '最新价', '成交额', '流通市值', '总市值', '动态市盈率', '换手率',
+            '封单资金', '最后封板时间', '板上成交额', '连续跌停', '开板次数', '所属行业',
+        ])
+
+    def stock_zt_pool_zbgc_em(self, date='20241009'):
+        self._enter('stock_zt_pool_zbgc_em')
+        df = self._fixture('stock_zt_pool_zbgc_em', date)
+        if df is not None:
+            return df
+        return self._pool('zb', date, [
+            '序号', '代码', '名称', '涨跌幅', '最新价', '涨停价', '成交额', '流通市值', '总市值', '换手率',
+            '涨速', '首次封板时间', '炸板次数', '涨停统计', '振幅', '所属行业',
+        ])
+
+    def stock_board_industry_name_em(self):
+        self._enter('stock_board_industry_name_em')
+        df = self._fixture('stock_board_industry_name_em')
+        if df is not None:
+            return df
+        return pd.DataFrame({
+            '排名': np.arange(1, len(INDUSTRIES) + 1),
+            '板块名称': list(INDUSTRIES),
+            '板块代码': [f'BK{1000 + i}' for i in range(len(INDUSTRIES))],
+        })
+
+    def stock_board_industry_cons_em(self, symbol='半导体'):
+        self._enter('stock_board_industry_cons_em')
+        df = self._fixture('stock_board_industry_cons_em', symbol)
+        if df is not None:
+            return df
+        # 全市场代码按序号轮流分配到各行业
+        k = INDUSTRIES.index(symbol) if symbol in INDUSTRIES else 0
+        codes = _codes(self.market_size)[k::len(INDUSTRIES)]
+        return pd.DataFrame({
+            '序号': np.arange(1, len(codes) + 1),
+            '代码': codes,
+            '名称': [f'股票{i:04d}' for i in range(k, self.market_size, len(INDUSTRIES))],
+        })
+
+    def stock_intraday_em(self, symbol='000001'):
+        self._enter('stock_intraday_em')
+        df = self._fixture('stock_intraday_em', symbol)
+        if df is not None:
+            return df
+        rng = _rng('intraday', symbol, date.today())
+        times = pd.date_range('09:30', '11:30', freq='3s').append(pd.date_range('13:00', '15:00', freq='3s'))
+        n = len(times)
+        price = (10 * np.cumprod(1 + rng.normal(0, 0.0005, n))).round(2)
+        return pd.DataFrame({
+            '时间': times.strftime('%H:%M:%S'),
+            '成交价': price,
+            '手数': rng.integers(1, 2000, n),
+            '买卖盘性质': rng.choice(['买盘', '卖盘', '中性盘'], n),
+        })
+
+
+def install(**options):
+    """
+    用替身替换 sys.modules['akshare']，必须在导入 app / market_data 之前调用
+    """
+    fake = FakeAkshare(**options)
+    sys.modules['akshare'] = fake
+    return fake
+
+
+def record(codes, day, out=FIXTURE_DIR):
+    """
+    调用真实 akshare 录制回放数据
+    """
+    import akshare as ak
+
+    os.makedirs(out, exist_ok=True)
+
+    def save(df, name, *key):
+        path = os.path.join(out, '__'.join((name,) + key) + '.pkl')
+        df.to_pickle(path)
+        print(f'{path}: {len(df)} 行')
+
+    save(ak.tool_trade_date_hist_sina(), 'tool_trade_date_hist_sina')
+    save(ak.stock_zh_a_spot_em(), 'stock_zh_a_spot_em')
+    save(ak.stock_zt_pool_em(date=day), 'stock_zt_pool_em', day)
+    save(ak.stock_zt_pool_strong_em(date=day), 'stock_zt_pool_strong_em', day)
+    save(ak.stock_zt_pool_dtgc_em(date=day), 'stock_zt_pool_dtgc_em', day)
+    save(ak.stock_zt_pool_zbgc_em(date=day), 'stock_zt_pool_zbgc_em', day)
+    boards = ak.stock_board_industry_name_em()
+    save(boards, 'stock_board_industry_name_em')
+    for name in boards['板块名称']:
+        save(ak.stock_board_industry_cons_em(symbol=name), 'stock_board_industry_cons_em', name)
+    for code in codes:
+        save(ak.stock_individual_info_em(symbol=code), 'stock_individual_info_em', code)
+        save(ak.stock_intraday_em(symbol=code), 'stock_intraday_em', code)
+        for period in ('daily', 'weekly', 'monthly'):
+            for adjust in ('', 'qfq'):
+                df = ak.stock_zh_a_hist(symbol=code, period=period, start_date='19700101', end_date='20500101', adjust=adjust)
+                save(df, 'stock_zh_a_hist', code, period, adjust or 'bfq')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='录制 akshare 回放数据')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('record')
+    rec.add_argument('--codes', default='600000,000001')
+    rec.add_argument('--date', default=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'), help='股票池日期 YYYYMMDD')
+    rec.add_argument('--out', default=FIXTURE_DIR)
+    args = parser.parse_args()
+    record([c.strip() for c in args.codes.split(',') if c.strip()], args.date, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+本地压测脚本：以固定并发持续请求某个接口，统计吞吐量和延迟分位数
+
+用法:
+    python bench/loadtest.py --url http://127.0.0.1:5000/api/cache/stats --concurrency 64 --duration 20
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run_callable(fetch, concurrency, duration):
+    """
+    以固定并发持续调用 fetch()，fetch 抛出 OSError 计为一次错误
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                fetch()
+                local_latencies.append(time.perf_counter() - start)
+            except OSError:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'duration': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def run(url, concurrency, duration, timeout, data=None, headers=None):
+    """
+    压测一个接口；data 不为空时发送 POST 请求
+    """
+    def fetch():
+        req = urllib.request.Request(url, data=data, headers=headers or {})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+
+    return {'url': url, **run_callable(fetch, concurrency, duration)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='简单的 HTTP 压测工具')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/cache/stats')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+    print(json.dumps(run(args.url, args.concurrency, args.duration, args.timeout), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+微基准：数值格式化（逐值版本 vs 按列向量化版本）与 Excel / CSV 导出
+
+用法:
+    python bench/micro.py --rows 5000 --repeat 5
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_ak import FakeAkshare  # noqa: E402
+from exporters import iter_csv, write_xlsx  # noqa: E402
+from formatting import (  # noqa: E402
+    format_frame,
+    format_list_values,
+    format_numeric_value,
+    format_records,
+)
+
+
+def measure(fn, repeat, number=1):
+    """
+    重复执行 repeat 轮，每轮调用 number 次，返回每次调用耗时的最小值与中位数（毫秒）
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    samples.sort()
+    return {'min_ms': round(samples[0], 4), 'median_ms': round(samples[len(samples) // 2], 4)}
+
+
+def run(rows=5000, repeat=5):
+    ak = FakeAkshare()
+    history = ak.stock_zh_a_hist('600000').tail(rows).reset_index(drop=True)
+    pool = ak.stock_zt_pool_em('20241009')
+    values = history['收盘'].tolist()
+    records = history.to_dict('records')
+
+    results = {
+        'format_numeric_value': measure(lambda: [format_numeric_value(v) for v in values], repeat),
+        'format_list_values': measure(lambda: format_list_values(history.to_dict('records')), repeat),
+        'format_list_values_only': measure(lambda: format_list_values(records), repeat),
+        'format_records': measure(lambda: format_records(history), repeat),
+        'format_frame': measure(lambda: format_frame(history, exclude=['日期']), repeat),
+        'format_records_pool': measure(lambda: format_records(pool), repeat, number=20),
+    }
+
+    sheets = [('历史数据', format_frame(history, exclude=['日期'])), ('涨停股票池', pool)]
+    results['write_xlsx'] = measure(lambda: write_xlsx(sheets, io.BytesIO()), repeat)
+    results['to_excel_openpyxl'] = measure(lambda: _to_excel(sheets), repeat)
+    results['iter_csv'] = measure(lambda: b''.join(iter_csv(sheets)), repeat)
+    results['iter_csv_gzip'] = measure(lambda: b''.join(iter_csv(sheets, compress=True)), repeat)
+    return {'rows': len(history), 'pool_rows': len(pool), 'repeat': repeat, 'results': results}
+
+
+def _to_excel(sheets):
+    """
+    原先的导出方式：pandas.ExcelWriter + openpyxl（非只写模式），作为对照
+    """
+    import pandas as pd
+
+    with pd.ExcelWriter(io.BytesIO(), engine='openpyxl') as writer:
+        for name, df in sheets:
+            df.to_excel(writer, sheet_name=name, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='格式化与导出微基准')
+    parser.add_argument('--rows', type=int, default=5000, help='历史K线行数')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
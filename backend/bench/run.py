@@ -0,0 +1,77 @@
+"""
+基准测试入口：运行微基准和端到端压测，结果连同提交信息保存为 JSON
+
+用法:
+    python bench/run.py                       # 全部，结果写入 bench/results/
+    python bench/run.py --suite micro
+    python bench/compare.py bench/results/<旧>.json bench/results/<新>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(['git', *args], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def metadata():
+    return {
+        'commit': _git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运行基准测试并保存结果')
+    parser.add_argument('--suite', choices=('all', 'micro', 'e2e'), default='all')
+    parser.add_argument('--rows', type=int, default=5000, help='微基准的历史K线行数')
+    parser.add_argument('--repeat', type=int, default=5, help='微基准的重复轮数')
+    parser.add_argument('--latency', type=float, default=30, help='替身上游的平均延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=10, help='延迟抖动（毫秒）')
+    parser.add_argument('--duration', type=float, default=10, help='每个端到端场景的压测秒数')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--only', default='', help='只运行这些端到端场景，逗号分隔')
+    parser.add_argument('--out', default=None, help='结果文件路径，默认 bench/results/<时间>_<提交>.json')
+    args = parser.parse_args()
+
+    # 每次运行使用空的临时数据目录（交易日历、历史行情存储、导出缓存），必须在导入后端模块之前设置
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='bench-data-'))
+
+    report = {'meta': metadata()}
+    if args.suite in ('all', 'micro'):
+        from bench import micro
+        report['micro'] = micro.run(args.rows, args.repeat)
+    if args.suite in ('all', 'e2e'):
+        from bench import scenarios
+        only = {s.strip() for s in args.only.split(',') if s.strip()} or None
+        report['e2e'] = scenarios.run(args.latency, args.jitter, args.duration, args.concurrency, only=only)
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        out = os.path.join(RESULTS_DIR, f"{stamp}_{report['meta']['commit'] or 'nogit'}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(out)
+
+
+if __name__ == '__main__':
+    main()
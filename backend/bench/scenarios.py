@@ -0,0 +1,176 @@
+"""
+端到端压测：在进程内用替身 akshare 启动应用，依次压测每个 /api/stock/* 与 /api/market/* 接口
+
+用法:
+    python bench/scenarios.py --latency 30 --duration 10 --concurrency 16
+    python bench/scenarios.py --only history,limit_up
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+POOL_DATE = '20241009'
+POOL_ARCHIVE_START = '20240801'
+CODES = ['600000', '000001', '300001', '601002', '002003']
+
+# (名称, 方法, 路径, 请求体)
+SCENARIOS = [
+    ('info', 'GET', '/api/stock/info?code=600000', None),
+    ('realtime', 'GET', '/api/stock/realtime?code=600000', None),
+    ('search', 'GET', '/api/stock/search?q=6000', None),
+    ('history', 'GET', '/api/stock/history?code=600000&start_date=20240101&end_date=20241231', None),
+    ('history_10y', 'GET', '/api/stock/history?code=600000&start_date=20150101&end_date=20241231', None),
+    ('history_10y_columnar', 'GET',
+     '/api/stock/history?code=600000&start_date=20150101&end_date=20241231&format=columnar', None),
+    ('history_10y_indicators', 'GET',
+     '/api/stock/history?code=600000&start_date=20150101&end_date=20241231&indicators=MA:5:10:20,MACD,RSI:14,BOLL,KDJ,CROSS:DIF:DEA',
+     None),
+    ('compare', 'GET', '/api/stock/compare?codes=' + ','.join(CODES) + '&start_date=20150101&end_date=20241231', None),
+    ('compare_lttb', 'GET',
+     '/api/stock/compare?codes=' + ','.join(CODES) + '&start_date=20150101&end_date=20241231&points=500', None),
+    ('intraday', 'GET', '/api/stock/intraday?code=600000', None),
+    ('intraday_1min', 'GET', '/api/stock/intraday?code=600000&freq=1min', None),
+    ('info_batch', 'POST', '/api/stock/info/batch', {'codes': CODES}),
+    ('history_batch', 'POST', '/api/stock/history/batch',
+     {'codes': CODES, 'start_date': '20240101', 'end_date': '20241231'}),
+    ('limit_up', 'GET', f'/api/stock/limit-up/previous?date={POOL_DATE}', None),
+    ('limit_up_page', 'GET',
+     f'/api/stock/limit-up/previous?date={POOL_DATE}&sort=-连板数&page=1&page_size=20&fields=代码,名称,连板数,所属行业', None),
+    ('strong', 'GET', f'/api/stock/strong?date={POOL_DATE}', None),
+    ('limit_down', 'GET', f'/api/stock/limit-down?date={POOL_DATE}', None),
+    ('download', 'GET', '/api/stock/download?code=600000&days=30', None),
+    ('download_csv', 'GET', '/api/stock/download?code=600000&days=30&format=csv', None),
+    ('download_limit_up', 'GET', f'/api/stock/download-limit-up?date={POOL_DATE}', None),
+    ('download_limit_down', 'GET', f'/api/stock/download-limit-down?date={POOL_DATE}', None),
+    ('market_gainers', 'GET', '/api/market/gainers?n=50', None),
+    ('market_turnover', 'GET', '/api/market/turnover?by=换手率&n=50', None),
+    ('market_industries', 'GET', '/api/market/industries', None),
+    ('market_rank', 'GET', '/api/market/rank?code=600000&by=成交额', None),
+    ('screener', 'GET',
+     '/api/screener?expr=涨跌幅 > 3 and 换手率 between 3 and 15 and not 代码 startswith [30, 68]'
+     '&sort=-涨跌幅&page_size=50', None),
+    ('pool_ladder', 'GET', f'/api/pool/ladder?date={POOL_DATE}', None),
+    ('pool_history', 'GET', '/api/pool/history?code=600000', None),
+    ('pool_stats', 'GET', '/api/pool/stats?window=5', None),
+    ('stream_subscribe', 'SSE', '/api/stock/stream?codes=' + ','.join(CODES), None),
+]
+
+
+def start_app(latency_ms, jitter_ms):
+    """
+    安装替身 akshare，使用临时数据目录创建应用并在后台线程中启动，返回 (server, 基础 URL, 替身)
+    """
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='bench-data-'))
+    os.environ.setdefault('SERVER_TIMING', '0')
+    # 压测客户端读到第一个事件就断开，缩短心跳间隔让服务端尽快发现并释放连接
+    os.environ.setdefault('STREAM_HEARTBEAT', '1')
+    # 开发服务器每个连接一个线程，不受 gunicorn 线程数限制；断开后尚未释放的连接也计入订阅数
+    os.environ.setdefault('STREAM_MAX_SUBSCRIBERS', '10000')
+    # 预热会在压测期间产生额外的上游调用，冷启动耗时单独测量
+    os.environ.setdefault('PREWARM_ENABLED', '0')
+    # 股票池存档只回补压测用到的区间（见下方 backfill），不启动后台线程
+    os.environ.setdefault('POOL_ARCHIVE_DAYS', '0')
+
+    from bench import fake_ak
+
+    fake = fake_ak.install(latency_ms=latency_ms, jitter_ms=jitter_ms)
+
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from industry_map import industry_map
+    from pool_archive import pool_archive
+    from spot_snapshot import market_snapshot
+    from tick_store import TickCollector, tick_store
+
+    app = create_app()
+    market_snapshot.refresh()
+    industry_map.refresh()
+    # 分时接口只读存档，先为压测的股票采集一次
+    TickCollector(tick_store, codes=CODES).collect(final=True)
+    # 股票池统计只读存档，先回补 POOL_DATE 之前约两个月
+    pool_archive.backfill(POOL_ARCHIVE_START, POOL_DATE)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}', fake
+
+
+def _sse_fetch(url, timeout):
+    """
+    建立订阅并读到第一个事件（snapshot）后断开
+    """
+    def fetch():
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            while resp.readline() not in (b'\n', b''):
+                pass
+    return fetch
+
+
+def run(latency_ms=30, jitter_ms=10, duration=10, concurrency=16, timeout=30, only=None):
+    from bench.loadtest import run as load, run_callable
+
+    server, base, fake = start_app(latency_ms, jitter_ms)
+    results = {}
+    try:
+        for name, method, path, body in SCENARIOS:
+            if only and name not in only:
+                continue
+            url = base + urllib.parse.quote(path, safe='/?&=,-:')
+            data = json.dumps(body).encode('utf-8') if body is not None else None
+            headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+            calls_before = sum(fake.calls.values())
+            started = time.perf_counter()
+            if method == 'SSE':
+                fetch = _sse_fetch(url, timeout)
+                fetch()
+                cold_ms = (time.perf_counter() - started) * 1000
+                report = {'url': url, **run_callable(fetch, concurrency, duration)}
+            else:
+                # 第一次请求单独计时（缓存未命中、本地存储为空时的冷启动耗时）
+                req = urllib.request.Request(url, data=data, headers=headers)
+                with urllib.request.urlopen(req, timeout=timeout) as resp:
+                    size = len(resp.read())
+                cold_ms = (time.perf_counter() - started) * 1000
+                report = load(url, concurrency, duration, timeout, data=data, headers=headers)
+                report['response_bytes'] = size
+            report['cold_ms'] = round(cold_ms, 1)
+            report['upstream_calls'] = sum(fake.calls.values()) - calls_before
+            results[name] = report
+            print(f"{name:24s} rps={report['rps']:>8} p50={report['p50_ms']:>7}ms "
+                  f"p95={report['p95_ms']:>7}ms p99={report['p99_ms']:>7}ms errors={report['errors']}",
+                  file=sys.stderr)
+    finally:
+        server.shutdown()
+    return {
+        'latency_ms': latency_ms,
+        'jitter_ms': jitter_ms,
+        'duration': duration,
+        'concurrency': concurrency,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端接口压测（替身 akshare）')
+    parser.add_argument('--latency', type=float, default=30, help='替身上游的平均延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=10, help='延迟抖动（毫秒）')
+    parser.add_argument('--duration', type=float, default=10, help='每个场景的压测秒数')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--only', default='', help='只运行这些场景，逗号分隔')
+    args = parser.parse_args()
+    only = {s.strip() for s in args.only.split(',') if s.strip()} or None
+    report = run(args.latency, args.jitter, args.duration, args.concurrency, args.timeout, only)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
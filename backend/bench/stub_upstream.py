@@ -0,0 +1,135 @@
+"""
+本地上游桩服务：模拟行情接口的延迟、限流（429）和偶发错误，用于测试 upstream 模块
+
+用法:
+    python bench/stub_upstream.py --port 8900 --latency 50 --rate 100 --error-rate 0.05
+
+GET 任意路径返回 JSON；GET /_stats 返回累计的连接数、请求数、429 数和 5xx 数
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, latency_ms=50, jitter_ms=20, rate=0, burst=None, error_rate=0.0, retry_after=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.counters = {'connections': 0, 'requests': 0, 'throttled': 0, 'errors': 0, 'max_inflight': 0}
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """
+        服务端令牌桶：超出速率的请求返回 429
+        """
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            state.count('connections')
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/_stats':
+                self._send(200, state.snapshot())
+                return
+            state.count('requests')
+            with state.lock:
+                state.inflight += 1
+                state.counters['max_inflight'] = max(state.counters['max_inflight'], state.inflight)
+            try:
+                delay = state.latency_ms + random.uniform(-state.jitter_ms, state.jitter_ms)
+                time.sleep(max(0.0, delay) / 1000)
+                if not state.admit():
+                    state.count('throttled')
+                    headers = {'Retry-After': str(state.retry_after)} if state.retry_after is not None else None
+                    self._send(429, {'error': 'too many requests'}, headers)
+                elif random.random() < state.error_rate:
+                    state.count('errors')
+                    self._send(503, {'error': 'unavailable'})
+                else:
+                    self._send(200, {'path': self.path, 'data': {'f43': 1234, 'f57': '600000'}})
+            finally:
+                with state.lock:
+                    state.inflight -= 1
+
+    return Handler
+
+
+def start_stub(port=0, **options):
+    """
+    在后台线程中启动桩服务，返回 (server, 基础 URL, state)
+    """
+    state = StubState(**options)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}', state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟上游行情接口')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=50, help='平均延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=20, help='延迟抖动（毫秒）')
+    parser.add_argument('--rate', type=float, default=0, help='每秒允许的请求数，超出返回 429；0 表示不限')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 503 的比例')
+    parser.add_argument('--retry-after', type=float, default=None, help='429 响应附带的 Retry-After 秒数')
+    args = parser.parse_args()
+    server, url, _ = start_stub(
+        args.port, latency_ms=args.latency, jitter_ms=args.jitter, rate=args.rate,
+        error_rate=args.error_rate, retry_after=args.retry_after,
+    )
+    print(f'stub upstream listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
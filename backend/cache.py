@@ -0,0 +1,253 @@
+"""
+响应缓存：TTL 过期 + 按内存占用的 LRU 淘汰 + 并发请求合并 + 过期数据降级返回（stale-while-revalidate）
+"""
+import contextvars
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# 当前请求中返回过的过期缓存值的数据年龄（秒）；线程池中的任务通过 copy_context 共享同一个列表
+_stale_ages = contextvars.ContextVar('stale_ages', default=None)
+
+
+def track_stale():
+    """
+    在请求开始时调用，之后本请求中返回的过期缓存值都会被记录
+    """
+    _stale_ages.set([])
+
+
+def stale_age():
+    """
+    本请求中返回的最旧的过期缓存值的数据年龄（秒），没有时返回 None
+    """
+    ages = _stale_ages.get()
+    return max(ages) if ages else None
+
+
+def _record_stale(entry, now):
+    ages = _stale_ages.get()
+    if ages is not None:
+        ages.append(now - entry.created_at)
+
+
+def estimate_size(value):
+    """
+    估算缓存值占用的内存字节数
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires_at', 'created_at')
+
+    def __init__(self, value, size, ttl):
+        self.value = value
+        self.size = size
+        self.created_at = time.monotonic()
+        # ttl 为 None 表示不可变数据，永不过期
+        self.expires_at = None if ttl is None else self.created_at + ttl
+
+    def expired(self, now):
+        return self.expires_at is not None and now >= self.expires_at
+
+
+class _Pending:
+    """
+    正在进行中的上游请求，供并发的相同请求等待同一结果
+    """
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    线程安全的 TTL + LRU 缓存
+
+    - 每个键可以单独指定 TTL，ttl=None 表示永不过期；ttl 也可以是函数，按加载结果计算 TTL
+    - 总内存占用超过 max_bytes 时按最近最少使用顺序淘汰
+    - 同一个键同时有多个未命中时只触发一次加载，其余请求等待结果
+    - 过期不超过 max_stale 秒的值立即返回，同时在后台刷新（每个键只有一个刷新在进行）
+    - 重新加载失败时退回到仍在缓存中的过期值（最后一次成功的结果）
+    - 按命名空间（键的第一个元素）统计命中 / 未命中次数
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=10000, max_stale=0, refresh_workers=4):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+
+    def _count(self, key, field):
+        namespace = key[0] if isinstance(key, tuple) and key else key
+        stats = self._stats.setdefault(namespace, {
+            'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'expired': 0,
+            'stale': 0, 'refreshes': 0, 'fallbacks': 0,
+        })
+        stats[field] += 1
+
+    def get_or_load(self, key, loader, ttl=None, allow_stale=True):
+        """
+        读取缓存，未命中时调用 loader() 加载并写入缓存
+        loader 抛出的异常不会被缓存：有过期值时返回过期值，否则传递给所有等待中的请求
+        allow_stale=False 时不返回任何过期值（既不提前返回也不在加载失败时降级），
+        用于会把结果落盘、不能把旧数据当作新数据的调用方
+        """
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is not None:
+                if not entry.expired(now):
+                    self._data.move_to_end(key)
+                    self._count(key, 'hits')
+                    return entry.value
+                if allow_stale and self.max_stale and now - entry.expires_at <= self.max_stale:
+                    # 先返回过期值，后台刷新
+                    self._data.move_to_end(key)
+                    self._count(key, 'stale')
+                    if key not in self._inflight:
+                        self._count(key, 'refreshes')
+                        pending = self._inflight[key] = _Pending()
+                        self._refresher.submit(self._background_load, key, loader, ttl, pending)
+                    _record_stale(entry, now)
+                    return entry.value
+                # 过期太久的值不直接返回，但保留到重新加载成功，加载失败时使用
+                self._count(key, 'expired')
+
+            pending = self._inflight.get(key)
+            if pending is not None:
+                self._count(key, 'coalesced')
+                owner = False
+            else:
+                pending = _Pending()
+                self._inflight[key] = pending
+                self._count(key, 'misses')
+                owner = True
+
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                if not allow_stale:
+                    raise pending.error
+                return self._fallback(key, pending.error)
+            return pending.value
+
+        try:
+            return self._load(key, loader, ttl, pending)
+        except Exception as e:
+            if not allow_stale:
+                raise
+            return self._fallback(key, e)
+
+    def _load(self, key, loader, ttl, pending):
+        try:
+            value = loader()
+        except BaseException as e:
+            pending.error = e
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.event.set()
+            raise
+
+        pending.value = value
+        if callable(ttl):
+            ttl = ttl(value)
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._store(key, value, ttl)
+        pending.event.set()
+        return value
+
+    def _background_load(self, key, loader, ttl, pending):
+        try:
+            self._load(key, loader, ttl, pending)
+        except Exception as e:
+            print(f"缓存后台刷新失败 {key}: {e}")
+
+    def _fallback(self, key, error):
+        """
+        加载失败时返回仍在缓存中的过期值，没有时抛出原异常
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                raise error
+            self._count(key, 'fallbacks')
+        _record_stale(entry, time.monotonic())
+        return entry.value
+
+    def _store(self, key, value, ttl):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # 单个值超过缓存上限时不缓存
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = _Entry(value, size, ttl)
+        self._bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self):
+        now = time.monotonic()
+        # 优先清理已过期的条目
+        if self._bytes > self.max_bytes or len(self._data) > self.max_entries:
+            for key in [k for k, e in self._data.items() if e.expired(now)]:
+                self._remove(key)
+                self._count(key, 'expired')
+        while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+            key, entry = self._data.popitem(last=False)
+            self._bytes -= entry.size
+            self._count(key, 'evictions')
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        返回缓存统计信息
+        """
+        with self._lock:
+            namespaces = {}
+            for namespace, stats in self._stats.items():
+                lookups = stats['hits'] + stats['stale'] + stats['misses'] + stats['coalesced']
+                namespaces[namespace] = dict(
+                    stats,
+                    hit_ratio=round((stats['hits'] + stats['stale'] + stats['coalesced']) / lookups, 3) if lookups else None,
+                )
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'inflight': len(self._inflight),
+                'namespaces': namespaces,
+            }
@@ -0,0 +1,146 @@
+"""
+多股对比：把多只股票的历史K线对齐到同一个交易日索引，归一化到基准日，
+计算收益率相关系数矩阵与相对表现矩阵，并可用 LTTB 降采样到目标点数
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from formatting import round_array
+from metrics import timed_stage
+
+# 单次最多对比的股票数量
+COMPARE_MAX_CODES = int(os.environ.get('COMPARE_MAX_CODES', 20))
+# 降采样的目标点数上限
+COMPARE_MAX_POINTS = int(os.environ.get('COMPARE_MAX_POINTS', 5000))
+
+
+def align(frames, field='收盘'):
+    """
+    按所有股票出现过的日期的并集对齐
+
+    返回 (日期数组, 价格矩阵, 是否当天有K线的掩码)，矩阵每列一只股票；
+    停牌日沿用前一个交易日的价格，上市之前为 NaN
+    """
+    day_arrays = [pd.to_datetime(df['日期']).to_numpy().astype('datetime64[D]') for df in frames]
+    dates = np.unique(np.concatenate(day_arrays)) if day_arrays else np.empty(0, dtype='datetime64[D]')
+    prices = np.full((len(dates), len(frames)), np.nan)
+    observed = np.zeros(prices.shape, dtype=bool)
+    for j, (df, days) in enumerate(zip(frames, day_arrays)):
+        rows = np.searchsorted(dates, days)
+        prices[rows, j] = df[field].to_numpy(dtype=np.float64)
+        observed[rows, j] = True
+    # 向前填充：每个位置取该列最近一个有K线的行
+    last = np.where(observed, np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(last, axis=0, out=last)
+    return dates, prices[last, np.arange(len(frames))], observed
+
+
+def normalize(prices, base):
+    """
+    以第 base 行为基准换算为累计涨跌幅（%）；
+    基准日尚未上市的股票以上市后的第一个价格为基准
+    """
+    after = prices[base:]
+    first = np.argmax(~np.isnan(after), axis=0)
+    anchor = after[first, np.arange(prices.shape[1])]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (prices / anchor - 1) * 100
+    result[:base] = np.nan
+    return result
+
+
+def return_correlation(prices, observed):
+    """
+    日收益率的相关系数矩阵：每一对股票只使用两者都有收益率的日期（成对删除缺失值），
+    所有股票对通过几次矩阵乘法一起算出
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = prices[1:] / prices[:-1] - 1
+    valid = observed[1:] & ~np.isnan(returns)
+    mask = valid.astype(np.float64)
+    r = np.where(valid, returns, 0.0)
+    count = mask.T @ mask
+    # sums[i, j]：在 i、j 都有数据的日期上 i 的收益率之和（sq 为平方和）
+    sums = r.T @ mask
+    sq = (r * r).T @ mask
+    cross = r.T @ r
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = cross - sums * sums.T / count
+        var = sq - sums * sums / count
+        corr = cov / np.sqrt(var * var.T)
+    corr[count < 2] = np.nan
+    return np.clip(corr, -1, 1)
+
+
+def lttb(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留的下标（横轴为序号）
+
+    第一个和最后一个点总是保留；中间分成 threshold - 2 个桶，每个桶保留与
+    上一个已选点、下一个桶均值构成的三角形面积最大的点
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = max(min(int((i + 2) * every) + 1, n), end + 1)
+        avg_x = (end + next_end - 1) / 2
+        avg_y = values[end:next_end].mean()
+        xs = np.arange(start, end)
+        area = np.abs((a - avg_x) * (values[start:end] - values[a]) - (a - xs) * (avg_y - values[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _rounded(values):
+    return [None if v != v else v for v in round_array(values, 3).tolist()]
+
+
+@timed_stage('compare')
+def compare(codes, frames, base_date=None, points=None):
+    """
+    对比多只股票（frames 与 codes 一一对应，为 history_store.query 的结果）
+
+    base_date: 归一化基准日（YYYYMMDD），取不早于它的第一个交易日，默认区间第一天
+    points: 每条曲线最多返回的点数，超过时用 LTTB 降采样
+    """
+    dates, prices, observed = align(frames)
+    base = 0
+    if base_date:
+        base = int(np.searchsorted(dates, np.datetime64(f'{base_date[:4]}-{base_date[4:6]}-{base_date[6:8]}', 'D')))
+        if base >= len(dates):
+            raise ValueError(f'基准日 {base_date} 之后没有行情数据')
+    normalized = normalize(prices, base)
+    day_strings = np.datetime_as_string(dates, unit='D')
+
+    series = []
+    for j, code in enumerate(codes):
+        column = normalized[:, j]
+        valid = np.flatnonzero(~np.isnan(column))
+        keep = valid[lttb(column[valid], points)] if points else valid
+        series.append({
+            'code': code,
+            'return': _rounded(column[-1:])[0],
+            'points': [list(p) for p in zip(day_strings[keep].tolist(), _rounded(column[keep]))],
+        })
+
+    # 相对表现：行相对于列的超额收益（%），(1 + 行的收益) / (1 + 列的收益) - 1
+    growth = normalized[-1] / 100 + 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relative = (growth[:, None] / growth[None, :] - 1) * 100
+    return {
+        'base_date': day_strings[base].replace('-', '') if len(dates) else None,
+        'count': len(dates) - base,
+        'series': series,
+        'correlation': [_rounded(row) for row in return_correlation(prices[base:], observed[base:])],
+        'relative': [_rounded(row) for row in relative],
+    }
@@ -0,0 +1,7 @@
+"""
+后端运行配置
+"""
+import os
+
+# 本地数据目录（交易日历、历史行情等落盘数据）
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
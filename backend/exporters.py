@@ -0,0 +1,163 @@
+"""
+数据导出：常量内存的 xlsx 写入、流式 CSV / gzip CSV，以及按交易日落盘的导出缓存
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from config import DATA_DIR
+from metrics import timed_stage
+
+EXPORT_DIR = os.path.join(DATA_DIR, 'exports')
+
+# 导出格式: (扩展名, MIME 类型)
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+}
+
+# 每次写出的行数（CSV 分块大小）
+CHUNK_ROWS = 2000
+
+
+def _clean_values(df):
+    """
+    将 NaN 替换为 None，使空值写成空单元格（与 DataFrame.to_excel 一致）
+    """
+    return df.astype(object).where(df.notna(), None)
+
+
+@timed_stage('xlsx')
+def write_xlsx(sheets, fileobj):
+    """
+    以 openpyxl 只写模式生成 xlsx，内存占用与行数无关
+    sheets: [(工作表名, DataFrame), ...]
+    """
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    for sheet_name, df in sheets:
+        ws = wb.create_sheet(title=sheet_name)
+        header = []
+        for col in df.columns:
+            cell = WriteOnlyCell(ws, value=str(col))
+            cell.font = header_font
+            header.append(cell)
+        ws.append(header)
+        for start in range(0, len(df), CHUNK_ROWS):
+            for row in _clean_values(df.iloc[start:start + CHUNK_ROWS]).itertuples(index=False, name=None):
+                ws.append(row)
+    wb.save(fileobj)
+
+
+def iter_csv(sheets, compress=False):
+    """
+    逐块产出 CSV 字节；多个工作表依次输出，每段前有一行 [工作表名]，段与段之间空一行
+    compress=True 时输出 gzip 流
+    """
+    def chunks():
+        # 带 BOM，Excel 直接打开不会乱码
+        yield '\ufeff'.encode('utf-8')
+        multiple = len(sheets) > 1
+        for i, (sheet_name, df) in enumerate(sheets):
+            if multiple:
+                yield (('\n' if i else '') + f'[{sheet_name}]\n').encode('utf-8')
+            yield df.iloc[:0].to_csv(index=False).encode('utf-8')
+            for start in range(0, len(df), CHUNK_ROWS):
+                yield df.iloc[start:start + CHUNK_ROWS].to_csv(index=False, header=False).encode('utf-8')
+
+    if not compress:
+        yield from chunks()
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks():
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ExportCache:
+    """
+    导出文件的磁盘缓存，键中包含交易日；超过 max_age_days 的文件会被清理
+    """
+
+    def __init__(self, root=EXPORT_DIR, max_age_days=None):
+        self.root = root
+        self.max_age_days = max_age_days or int(os.environ.get('EXPORT_CACHE_DAYS', 7))
+        self._last_prune = 0
+        self._lock = threading.Lock()
+
+    def path(self, key_parts, fmt):
+        """
+        根据键生成缓存文件路径；键中含有非法字符时返回 None（不缓存）
+        """
+        parts = [str(p) for p in key_parts]
+        if not all(re.fullmatch(r'[0-9A-Za-z_\-]+', p) for p in parts):
+            return None
+        return os.path.join(self.root, '_'.join(parts) + '.' + EXPORT_FORMATS[fmt][0])
+
+    def lookup(self, path):
+        return path if path and os.path.exists(path) else None
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < 3600:
+                return
+            self._last_prune = now
+        cutoff = now - self.max_age_days * 86400
+        for name in os.listdir(self.root):
+            full = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(full) < cutoff:
+                    os.remove(full)
+            except OSError:
+                pass
+
+    def write_xlsx(self, path, sheets):
+        """
+        生成 xlsx 并原子写入缓存
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_xlsx(sheets, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._prune()
+        return path
+
+    def tee(self, chunks, path):
+        """
+        边向客户端输出边写入缓存；输出完整结束后才落盘
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                os.replace(tmp_path, path)
+                self._prune()
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+export_cache = ExportCache()
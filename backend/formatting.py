@@ -0,0 +1,164 @@
+"""
+数值格式化：逐值版本与按列向量化版本，两者输出完全一致
+"""
+import numpy as np
+import pandas as pd
+
+from metrics import timed_stage
+
+# 股票代码相关字段保持字符串格式，不进行数值转换
+CODE_COLUMNS = ('代码', '股票代码', 'code', 'stock_code', '证券代码')
+
+# 绝对值超过该阈值时 x * 10^decimals 可能损失精度，交给内置 round 处理
+_ROUND_EXACT_LIMIT = 2.0 ** 40
+
+# 这些推断类型的列无法转换为浮点数，格式化结果等于原值
+_PASSTHROUGH_TYPES = ('date', 'datetime', 'datetime64', 'time', 'timedelta', 'timedelta64', 'period')
+
+
+def format_numeric_value(value, decimals=3):
+    """
+    格式化数值，保留指定位数小数
+    """
+    if value is None or value == '' or value == '-':
+        return value
+
+    try:
+        # 尝试转换为浮点数
+        num = float(value)
+        # 保留指定位小数
+        return round(num, decimals)
+    except (ValueError, TypeError):
+        # 如果不是数值，返回原值
+        return value
+
+
+def format_dict_values(data, decimals=3):
+    """
+    格式化字典中的所有数值，但保留股票代码为字符串
+    """
+    if isinstance(data, dict):
+        result = {}
+        for k, v in data.items():
+            # 股票代码相关字段保持字符串格式，不进行数值转换
+            if k in CODE_COLUMNS:
+                result[k] = str(v).zfill(6) if v else v  # 确保6位，不足前面补0
+            else:
+                result[k] = format_numeric_value(v, decimals)
+        return result
+    return data
+
+
+def format_list_values(data_list, decimals=3):
+    """
+    格式化列表中所有字典的数值
+    """
+    if isinstance(data_list, list):
+        return [format_dict_values(item, decimals) for item in data_list]
+    return data_list
+
+
+def round_array(values, decimals=3):
+    """
+    对 float64 数组按位数四舍五入，结果与内置 round 逐元素一致
+
+    np.round 先乘以 10^decimals 再取整，在 .5 边界附近和超大数值上可能与
+    内置 round（按精确十进制值舍入）差一位，这些少数元素回退到内置 round。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scale = 10.0 ** decimals
+    with np.errstate(invalid='ignore', over='ignore'):
+        scaled = values * scale
+        result = np.rint(scaled) / scale
+        frac = np.abs(scaled - np.trunc(scaled))
+        suspect = (np.abs(frac - 0.5) < 1e-6) | (np.abs(values) >= _ROUND_EXACT_LIMIT)
+    if suspect.any():
+        idx = np.flatnonzero(suspect)
+        result[idx] = [round(float(v), decimals) for v in values[idx]]
+    return result
+
+
+def _format_code_column(series):
+    values = series.to_numpy()
+    if pd.api.types.infer_dtype(series, skipna=False) == 'string' and not series.isna().any():
+        # 全部为字符串：空字符串保持原样，其余补足6位
+        return np.where(values == '', values, series.str.zfill(6).to_numpy()).tolist()
+    return [str(v).zfill(6) if v else v for v in values.tolist()]
+
+
+def _format_object_column(series, decimals):
+    values = series.to_numpy()
+    inferred = pd.api.types.infer_dtype(series, skipna=False)
+    if inferred in _PASSTHROUGH_TYPES:
+        return values.tolist()
+    try:
+        # 整列都能转换为浮点数时走向量化路径（None 会被转成 NaN，需要还原）
+        floats = values.astype(np.float64)
+    except (ValueError, TypeError):
+        return [format_numeric_value(v, decimals) for v in values.tolist()]
+    rounded = round_array(floats, decimals).tolist()
+    none_mask = np.equal(values, None)
+    if none_mask.any():
+        for i in np.flatnonzero(none_mask):
+            rounded[i] = None
+    return rounded
+
+
+def format_column(series, decimals=3):
+    """
+    向量化格式化一列，返回 Python 对象列表，
+    结果等价于对该列每个值调用 format_numeric_value
+    """
+    kind = series.dtype.kind
+    if kind == 'f':
+        return round_array(series.to_numpy(), decimals).tolist()
+    if kind in 'iub':
+        # 整数转为浮点数后四舍五入结果不变
+        return series.to_numpy().astype(np.float64).tolist()
+    if kind == 'O':
+        return _format_object_column(series, decimals)
+    # 日期时间等类型无法转换为浮点数，保持原值
+    return series.tolist()
+
+
+@timed_stage('format')
+def format_columns(df, decimals=3):
+    """
+    按列格式化 DataFrame，返回与 df.columns 一一对应的值列表，
+    股票代码列保持字符串并补足6位
+    """
+    formatted = []
+    for i, col in enumerate(df.columns):
+        series = df.iloc[:, i]
+        if col in CODE_COLUMNS:
+            formatted.append(_format_code_column(series))
+        else:
+            formatted.append(format_column(series, decimals))
+    return formatted
+
+
+def format_records(df, decimals=3):
+    """
+    将 DataFrame 转换为格式化后的记录列表，
+    结果等价于 format_list_values(df.to_dict('records'))
+    """
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*format_columns(df, decimals))]
+
+
+@timed_stage('format')
+def format_frame(df, exclude=(), decimals=3):
+    """
+    按列格式化 DataFrame 中除 exclude 以外的所有列（用于 Excel 导出），
+    结果等价于对这些列执行 Series.apply(format_numeric_value)
+    """
+    df = df.copy()
+    for i, col in enumerate(df.columns):
+        if col in exclude:
+            continue
+        series = df.iloc[:, i]
+        if series.dtype.kind == 'f':
+            df.isetitem(i, round_array(series.to_numpy(), decimals))
+        else:
+            df.isetitem(i, pd.Series(format_column(series, decimals), index=df.index, dtype=object).infer_objects())
+    return df
@@ -0,0 +1,77 @@
+"""
+gunicorn 配置（生产环境）：gunicorn -c gunicorn.conf.py wsgi:app
+
+所有参数都可以通过环境变量覆盖。默认使用 gthread worker：接口大部分时间在等待上游 akshare，
+每个进程用固定数量的线程处理请求，而不是每个请求新建一个线程。
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# 进程数，默认 2 * CPU + 1，上限 8（每个进程各自维护行情快照和缓存）
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+# 每个进程的请求处理线程数（空闲的推送连接只是阻塞等待，线程开销很小）
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# 行情推送（SSE）：gthread worker 中每个推送连接一直占用一个请求线程。
+# 每个进程保留 STREAM_RESERVED_THREADS 个线程给普通请求，其余线程可用于推送，
+# 即每个进程最多 threads - STREAM_RESERVED_THREADS 个推送连接（默认 32 - 8 = 24），
+# 全部 worker 合计 workers × 该值；超出时返回 503，前端退回到定时轮询。
+# 需要支持更多同时在线的用户时调大 GUNICORN_THREADS，或直接设置 STREAM_MAX_SUBSCRIBERS
+stream_reserved_threads = int(os.environ.get('STREAM_RESERVED_THREADS', 8))
+os.environ.setdefault('STREAM_MAX_SUBSCRIBERS', str(max(threads - stream_reserved_threads, 1)))
+
+# 有界请求队列：每个进程最多同时持有的连接数，以及内核 listen 队列长度；
+# 超出后新连接在内核排队或被拒绝，而不是无限制地创建线程
+worker_connections = int(os.environ.get('GUNICORN_MAX_CONNECTIONS', threads * 4))
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 256))
+
+# 单个请求的最长处理时间，超时的 worker 会被重启
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# 收到 SIGTERM 后等待进行中请求完成的时间
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# 处理一定数量请求后回收 worker（0 为不回收，默认）。回收会丢掉进程内的缓存、行情快照、搜索索引与指标状态，
+# 并重新请求上游预热，高负载下按几千个请求回收几乎每分钟一次，会抵消缓存的效果；
+# 确实存在内存缓慢增长时再设置为数十万级别，并加抖动避免所有进程同时重启
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """
+    主进程启动时清空上一次运行留下的多进程指标快照
+    """
+    import metrics
+
+    metrics.clear_snapshots()
+
+
+def worker_exit(server, worker):
+    """
+    worker 退出时停止后台线程和上游线程池，保存请求统计与指标快照
+    """
+    import metrics
+    from market_data import background_executor, bulk_executor, executor
+    from pool_archive import pool_archiver
+    from prewarm import prewarmer, request_stats
+    from spot_snapshot import market_snapshot
+    from tick_store import tick_collector
+
+    market_snapshot.stop()
+    prewarmer.stop()
+    pool_archiver.stop()
+    tick_collector.stop()
+    # 保存本进程尚未写入文件的请求统计
+    request_stats.flush()
+    # 写入最后一次指标快照，已处理请求的计数不会因 worker 回收而丢失
+    metrics.snapshot_writer.stop()
+    for pool in (executor, bulk_executor, background_executor):
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,325 @@
+"""
+本地历史行情存储：每个 (代码, 周期, 复权方式) 一个内存映射的 NumPy 文件
+
+- 首次访问时一次性拉取全部历史K线并落盘，之后区间查询直接在本地按日期二分查找
+- 只落盘已收盘的K线；新交易日收盘后只增量拉取缺失的部分
+- 增量拉取时与本地重叠的一根K线做比对，不一致（如除权除息导致前复权价格变化）则整体重新拉取
+- 落盘的数据只来自成功的上游请求，不使用过期的缓存值；上游失败时不推进已校验日期
+- 多进程部署时拉取与写入通过每个文件的 flock 串行，一个进程拉取完成后其他进程直接读取结果
+"""
+import json
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR
+from market_data import fetch_stock_hist, invalidate_stock_hist
+from trade_calendar import trade_calendar
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HISTORY_DIR = os.path.join(DATA_DIR, 'history')
+
+PERIODS = ('daily', 'weekly', 'monthly')
+ADJUSTS = ('', 'qfq', 'hfq')
+
+# 每个进程最多保持打开的内存映射文件数，超出时关闭最近最少使用的
+HISTORY_MMAP_ENTRIES = int(os.environ.get('HISTORY_MMAP_ENTRIES', 256))
+
+# 比对重叠K线时参与比较的价格列
+_CHECK_COLUMNS = ('开盘', '收盘', '最高', '最低')
+
+
+def _to_day(date_str):
+    return np.datetime64(f'{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}', 'D')
+
+
+def _day_str(day):
+    return str(day).replace('-', '')
+
+
+def _period_start(date_str, period):
+    """
+    返回 date_str 所在周期（日 / 周 / 月）的第一天
+    """
+    day = datetime.strptime(date_str, '%Y%m%d')
+    if period == 'weekly':
+        day -= timedelta(days=day.weekday())
+    elif period == 'monthly':
+        day = day.replace(day=1)
+    return day.strftime('%Y%m%d')
+
+
+def _frame_to_array(df):
+    """
+    将 stock_zh_a_hist 的结果转换为结构化数组（去掉常量列 股票代码）
+    """
+    df = df.drop(columns=['股票代码'], errors='ignore')
+    fields = []
+    for col in df.columns:
+        if col == '日期':
+            fields.append((col, 'datetime64[D]'))
+        elif df[col].dtype.kind in 'iu':
+            fields.append((col, 'int64'))
+        else:
+            fields.append((col, 'float64'))
+    arr = np.empty(len(df), dtype=fields)
+    for col, _ in fields:
+        if col == '日期':
+            arr[col] = pd.to_datetime(df[col]).to_numpy().astype('datetime64[D]')
+        else:
+            arr[col] = df[col].to_numpy()
+    return arr
+
+
+def _array_to_frame(arr, stock_code):
+    """
+    将结构化数组还原为与 stock_zh_a_hist 相同列顺序的 DataFrame
+    """
+    data = {}
+    for name in arr.dtype.names:
+        if name == '日期':
+            data[name] = pd.to_datetime(arr[name]).date
+            data['股票代码'] = stock_code
+        else:
+            data[name] = np.array(arr[name])
+    return pd.DataFrame(data)
+
+
+def _rows_match(a, b):
+    for col in _CHECK_COLUMNS:
+        if col in a.dtype.names and not np.isclose(a[col], b[col], rtol=0, atol=1e-6, equal_nan=True):
+            return False
+    return True
+
+
+class HistoryStore:
+    """
+    本地历史K线存储
+    """
+
+    def __init__(self, root=HISTORY_DIR, max_mmaps=HISTORY_MMAP_ENTRIES):
+        self.root = root
+        self.max_mmaps = max_mmaps
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._mmaps = OrderedDict()
+        self._mmaps_lock = threading.Lock()
+
+    def _paths(self, stock_code, period, adjust):
+        if period not in PERIODS or adjust not in ADJUSTS or not stock_code.isdigit():
+            raise ValueError(f'不支持的参数: code={stock_code}, period={period}, adjust={adjust}')
+        directory = os.path.join(self.root, period, adjust or 'bfq')
+        return (
+            directory,
+            os.path.join(directory, f'{stock_code}.npy'),
+            os.path.join(directory, f'{stock_code}.json'),
+        )
+
+    def _lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _file_lock(self, stock_code, period, adjust):
+        """
+        跨进程的文件锁，同一个（代码，周期，复权方式）同时只有一个进程拉取和写入
+        """
+        directory, data_path, _ = self._paths(stock_code, period, adjust)
+        os.makedirs(directory, exist_ok=True)
+        with open(data_path[:-len('.npy')] + '.lock', 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _load(self, stock_code, period, adjust):
+        """
+        读取已落盘的数据（内存映射）和元信息，没有数据时返回 (None, None)
+        """
+        _, data_path, meta_path = self._paths(stock_code, period, adjust)
+        try:
+            mtime = os.stat(data_path).st_mtime_ns
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        with self._mmaps_lock:
+            cached = self._mmaps.get(data_path)
+            if cached is not None and cached[0] == mtime:
+                self._mmaps.move_to_end(data_path)
+                return cached[1], meta
+        # 仍在使用中的数组持有自己的映射，从这里淘汰不影响它们
+        cached = (mtime, np.load(data_path, mmap_mode='r'))
+        with self._mmaps_lock:
+            self._mmaps[data_path] = cached
+            self._mmaps.move_to_end(data_path)
+            while len(self._mmaps) > self.max_mmaps:
+                self._mmaps.popitem(last=False)
+        return cached[1], meta
+
+    def _save(self, stock_code, period, adjust, arr, meta):
+        directory, data_path, meta_path = self._paths(stock_code, period, adjust)
+        os.makedirs(directory, exist_ok=True)
+        # 临时文件名带进程号，多个进程不会写同一个临时文件
+        tmp_path = f'{data_path[:-len(".npy")]}.{os.getpid()}.tmp.npy'
+        with warnings.catch_warnings():
+            # 中文字段名需要 .npy 3.0 格式（UTF-8 表头），忽略版本提示
+            warnings.simplefilter('ignore', UserWarning)
+            np.save(tmp_path, arr)
+        os.replace(tmp_path, data_path)
+        tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def _closed(self, arr, closed_day):
+        return arr[arr['日期'] <= _to_day(closed_day)]
+
+    def _full_fetch(self, stock_code, period, adjust, closed_day, refresh=False):
+        if refresh:
+            # 丢弃共享缓存里可能已过时的全量数据
+            invalidate_stock_hist(stock_code, period, '19700101', '20500101', adjust)
+        df = fetch_stock_hist(stock_code, period, '19700101', '20500101', adjust, fresh=True)
+        if df.empty:
+            return None
+        arr = self._closed(_frame_to_array(df), closed_day)
+        self._save(stock_code, period, adjust, arr, {'checked_through': closed_day})
+        return arr
+
+    def _incremental_fetch(self, stock_code, period, adjust, arr, closed_day):
+        # 从倒数第二根K线所在周期开始拉取：它一定已收盘，可用来校验复权价格是否变化；
+        # 最后一根K线（周线、月线可能是未走完的周期）由新数据整体替换
+        anchor = arr[-2] if len(arr) >= 2 else arr[-1]
+        fetch_from = _period_start(_day_str(anchor['日期']), period)
+        df = fetch_stock_hist(stock_code, period, fetch_from, '20500101', adjust, fresh=True)
+        if df.empty:
+            return None
+        fresh = _frame_to_array(df)
+        overlap = fresh[fresh['日期'] == anchor['日期']]
+        if len(overlap) != 1 or fresh.dtype != arr.dtype or not _rows_match(overlap[0], anchor):
+            # 复权价格发生变化（新的除权除息）或数据结构变化，整体重新拉取
+            return self._full_fetch(stock_code, period, adjust, closed_day, refresh=True)
+        merged = np.concatenate([arr[arr['日期'] < fresh['日期'][0]], self._closed(fresh, closed_day)])
+        self._save(stock_code, period, adjust, merged, {'checked_through': closed_day})
+        return merged
+
+    def sync(self, stock_code, period='daily', adjust=''):
+        """
+        保证本地数据覆盖到最近一个已收盘交易日，返回内存映射的结构化数组
+        """
+        closed_day = trade_calendar.last_closed_day()
+        with self._lock((stock_code, period, adjust)):
+            arr, meta = self._load(stock_code, period, adjust)
+            if arr is None or len(arr) == 0 or meta.get('checked_through', '') < closed_day:
+                with self._file_lock(stock_code, period, adjust):
+                    # 等锁期间其他进程可能已经拉取完成，重新读取后再判断
+                    arr, meta = self._load(stock_code, period, adjust)
+                    if arr is None or len(arr) == 0:
+                        self._full_fetch(stock_code, period, adjust, closed_day)
+                    elif meta.get('checked_through', '') < closed_day:
+                        try:
+                            self._incremental_fetch(stock_code, period, adjust, arr, closed_day)
+                        except Exception as e:
+                            # 上游失败时继续使用本地数据，checked_through 不前进，下次访问再补
+                            print(f"历史行情增量拉取失败 {stock_code}: {e}")
+                arr, _ = self._load(stock_code, period, adjust)
+        return arr
+
+    def has(self, stock_code):
+        """
+        本地是否有该股票任一周期、复权方式的数据（不请求上游，用于识别已退市、不在当天行情中的股票）
+        """
+        if not stock_code.isdigit():
+            return False
+        return any(
+            os.path.exists(self._paths(stock_code, period, adjust)[1]) for period in PERIODS for adjust in ADJUSTS
+        )
+
+    def local(self, stock_code, period='daily', adjust=''):
+        """
+        只读取已落盘的数据（不请求上游），没有本地数据时返回 None
+        """
+        arr, _ = self._load(stock_code, period, adjust)
+        return arr
+
+    def invalidate(self, stock_code, period='daily', adjust=''):
+        _, data_path, meta_path = self._paths(stock_code, period, adjust)
+        with self._lock((stock_code, period, adjust)), self._file_lock(stock_code, period, adjust):
+            for path in (data_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._mmaps_lock:
+                self._mmaps.pop(data_path, None)
+        invalidate_stock_hist(stock_code, period, '19700101', '20500101', adjust)
+
+    def is_final(self, period='daily', end_date='20500101', adjust=''):
+        """
+        区间内的K线是否都已收盘且不会再变化（前复权价格会因除权除息改变，永远不是最终数据）
+        """
+        if adjust == 'qfq':
+            return False
+        closed_day = trade_calendar.last_closed_day()
+        # 周线、月线要求结束日期早于最近收盘日所在的周期，保证最后一根K线已走完
+        return end_date < _period_start(closed_day, period) or (period == 'daily' and end_date <= closed_day)
+
+    def is_complete(self, stock_code, period='daily', end_date='20500101', adjust=''):
+        """
+        区间内的K线是否为最终数据且本地已校验到 end_date（增量拉取失败时本地数据可能缺少最近的K线）
+        """
+        if not self.is_final(period, end_date, adjust):
+            return False
+        _, _, meta_path = self._paths(stock_code, period, adjust)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta.get('checked_through', '') >= end_date
+
+    def query(self, stock_code, period='daily', start_date='19700101', end_date='20500101', adjust='', _retry=True):
+        """
+        查询 [start_date, end_date] 区间的K线，返回与 stock_zh_a_hist 相同格式的 DataFrame
+        区间包含尚未收盘的当前周期时，最新一段从上游实时获取（走共享缓存）
+        """
+        arr = self.sync(stock_code, period, adjust)
+        if arr is None:
+            return pd.DataFrame()
+
+        dates = arr['日期']
+        lo = np.searchsorted(dates, _to_day(start_date), side='left')
+        hi = np.searchsorted(dates, _to_day(end_date), side='right')
+        local = arr[lo:hi]
+
+        today = datetime.now().strftime('%Y%m%d')
+        closed_day = trade_calendar.last_closed_day()
+        if end_date < today or closed_day >= today or not trade_calendar.is_trading_day(today) or len(arr) == 0:
+            return _array_to_frame(local, stock_code)
+
+        # 当前周期尚未收盘：从最后一根本地K线所在周期开始取实时数据替换末尾
+        tail_from = max(_period_start(_day_str(dates[-1]), period), start_date)
+        tail_df = fetch_stock_hist(stock_code, period, tail_from, end_date, adjust)
+        if tail_df.empty:
+            return _array_to_frame(local, stock_code)
+        tail = _frame_to_array(tail_df)
+        if period == 'daily':
+            overlap = tail[tail['日期'] == dates[-1]]
+            if _retry and len(overlap) == 1 and not _rows_match(overlap[0], arr[-1]):
+                # 盘中出现除权除息，本地复权数据已失效
+                self.invalidate(stock_code, period, adjust)
+                return self.query(stock_code, period, start_date, end_date, adjust, _retry=False)
+        local = local[local['日期'] < tail['日期'][0]]
+        return _array_to_frame(np.concatenate([local, tail.astype(local.dtype)]), stock_code)
+
+
+history_store = HistoryStore()
@@ -0,0 +1,116 @@
+"""
+响应编码：强 ETag 与 If-None-Match → 304、按 Accept-Encoding 协商 gzip / brotli 压缩、不可变数据的长缓存头、
+过期缓存数据的标记
+
+只处理完整生成的 GET 响应；流式响应（NDJSON、SSE、CSV 导出）和 send_file 返回的文件不在此处理
+"""
+import gzip
+import hashlib
+import os
+
+from flask import current_app, request
+
+from cache import stale_age
+from metrics import timed_stage
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只使用 gzip
+    brotli = None
+
+# 小于该字节数的响应不压缩
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+# 不可变数据（已收盘交易日的股票池、历史K线）的浏览器 / CDN 缓存时间（秒）
+IMMUTABLE_MAX_AGE = int(os.environ.get('IMMUTABLE_MAX_AGE', 30 * 24 * 3600))
+
+_COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def _negotiate(accept_encodings):
+    """
+    按客户端声明的权重选择压缩方式，权重相同时优先 brotli
+    """
+    candidates = [('gzip', accept_encodings.quality('gzip'))]
+    if brotli is not None:
+        candidates.insert(0, ('br', accept_encodings.quality('br')))
+    encoding, quality = max(candidates, key=lambda item: item[1])
+    return encoding if quality > 0 else None
+
+
+@timed_stage('compress')
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def immutable(response):
+    """
+    标记响应内容不会再变化，允许浏览器和 CDN 长时间缓存
+    """
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+def mark_stale(response):
+    """
+    after_request 钩子：本请求返回了过期的缓存数据（上游慢或失败时的降级结果）时，
+    JSON 对象响应中加入 stale 与 stale_age（数据年龄，秒），并且不允许长时间缓存
+    """
+    age = stale_age()
+    if age is None:
+        return response
+    response.headers['Warning'] = '110 - "Response is Stale"'
+    response.cache_control.public = False
+    response.cache_control.max_age = None
+    response.cache_control.immutable = False
+    response.cache_control.no_cache = True
+    if response.is_json and not response.is_streamed and not response.direct_passthrough:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data['stale'] = True
+            data['stale_age'] = round(age, 1)
+            response.set_data(current_app.json.dumps(data))
+    return response
+
+
+def encode_response(response):
+    """
+    after_request 钩子：为完整生成的 200 响应添加强 ETag，
+    If-None-Match 命中时返回 304，否则按协商结果压缩
+    """
+    if (
+        request.method not in ('GET', 'HEAD')
+        or response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+
+    data = response.get_data()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    encoding = None
+    if len(data) >= COMPRESS_MIN_SIZE and (response.mimetype or '').startswith(_COMPRESSIBLE_TYPES):
+        encoding = _negotiate(request.accept_encodings)
+
+    # 强 ETag 针对具体表示，压缩后的内容使用不同的 ETag
+    response.set_etag(digest if encoding is None else f'{digest}-{encoding}')
+    response.vary.add('Accept-Encoding')
+    if not response.cache_control:
+        # 未声明缓存策略的接口：允许保存，但每次使用前用 ETag 重新验证
+        response.cache_control.no_cache = True
+
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    if encoding is not None:
+        response.set_data(_compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,414 @@
+"""
+技术指标：MA、EMA、MACD、RSI、BOLL、KDJ 与交叉信号（通达信公式口径）
+
+指标在本地历史存储的完整序列上计算，查询区间开头的数值与从上市首日算起一致。
+每个 (代码, 周期, 复权方式) 的计算结果保存在内存中，本地存储追加了新K线时
+只计算新增的部分：滑动窗口类指标只取末尾一个窗口的数据，递推类指标从上一次的
+最后一个值继续递推。盘中尚未收盘的K线每次请求时在缓存结果的基础上临时补算，不写入缓存。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from formatting import round_array
+from history_store import history_store
+from metrics import timed_stage
+
+# 内存中保留计算结果的序列数（按最近使用淘汰）
+INDICATOR_CACHE_ENTRIES = int(os.environ.get('INDICATOR_CACHE_ENTRIES', 64))
+# 单个指标的窗口 / 周期上限
+INDICATOR_MAX_WINDOW = 500
+
+# 指标计算用到的价格列（也可以作为交叉信号的比较对象）
+_INPUT_COLUMNS = ('开盘', '收盘', '最高', '最低')
+
+# 分块递推时，块内衰减系数的倒数不超过 e^_EMA_DECAY_LIMIT（约 10^6），避免精度损失
+_EMA_DECAY_LIMIT = np.log(1e6)
+
+
+def _window(x, n, start, pad):
+    """
+    返回以 start..len(x)-1 为结尾、长度为 n 的滑动窗口（视图），
+    不足 n 根的窗口在前面用 pad 补齐
+    """
+    lo = start - n + 1
+    seg = x[lo:] if lo >= 0 else np.concatenate([np.full(-lo, pad), x])
+    return sliding_window_view(seg, n)
+
+
+def _ema(x, alpha, seed=None):
+    """
+    指数平滑 y[i] = alpha * x[i] + (1 - alpha) * y[i-1]
+
+    seed 为上一个值；为 None 或 NaN 时以第一个非 NaN 值作为初值（之前的位置为 NaN）。
+    按块向量化：块内 y 写成衰减系数加权的累加和，块与块之间串行衔接。
+    """
+    out = np.full(len(x), np.nan)
+    begin = 0
+    if seed is None or np.isnan(seed):
+        valid = np.flatnonzero(~np.isnan(x))
+        if len(valid) == 0:
+            return out
+        begin = valid[0] + 1
+        seed = out[valid[0]] = x[valid[0]]
+    beta = 1.0 - alpha
+    if beta <= 0:
+        out[begin:] = x[begin:]
+        return out
+    step = max(1, int(_EMA_DECAY_LIMIT / -np.log(beta)))
+    prev = seed
+    for s in range(begin, len(x), step):
+        chunk = x[s:s + step]
+        decay = beta ** np.arange(1, len(chunk) + 1)
+        out[s:s + len(chunk)] = decay * (prev + alpha * np.cumsum(chunk / decay))
+        prev = out[s + len(chunk) - 1]
+    return out
+
+
+def _last(prev, col, start):
+    """
+    上一次计算结果中 start 之前的最后一个值，没有时返回 None
+    """
+    return prev[col][start - 1] if start > 0 else None
+
+
+class Indicator:
+    """
+    指标基类：update 根据完整的输入序列和 start 之前的结果，返回 start 之后各列的数值
+
+    以下划线开头的列是递推所需的中间结果，只保存不返回
+    """
+    name = ''
+    defaults = ()
+
+    def __init__(self, *params):
+        self.params = params or self.defaults
+        self.key = (self.name,) + self.params
+
+    @property
+    def columns(self):
+        return [col for col in self.outputs() if not col.startswith('_')]
+
+    def _suffix(self):
+        return '' if self.params == self.defaults else '_' + '_'.join(str(p) for p in self.params)
+
+    def outputs(self):
+        raise NotImplementedError
+
+    def update(self, data, prev, start):
+        raise NotImplementedError
+
+
+class MA(Indicator):
+    name = 'MA'
+
+    def outputs(self):
+        return [f'MA{self.params[0]}']
+
+    def update(self, data, prev, start):
+        n = self.params[0]
+        return {f'MA{n}': _window(data['收盘'], n, start, np.nan).mean(axis=1)}
+
+
+class EMA(Indicator):
+    name = 'EMA'
+
+    def outputs(self):
+        return [f'EMA{self.params[0]}']
+
+    def update(self, data, prev, start):
+        n = self.params[0]
+        col = f'EMA{n}'
+        return {col: _ema(data['收盘'][start:], 2 / (n + 1), _last(prev, col, start))}
+
+
+class MACD(Indicator):
+    name = 'MACD'
+    defaults = (12, 26, 9)
+
+    def outputs(self):
+        s = self._suffix()
+        return [f'DIF{s}', f'DEA{s}', f'MACD{s}', '_fast', '_slow']
+
+    def update(self, data, prev, start):
+        fast, slow, signal = self.params
+        dif_col, dea_col, macd_col = self.columns
+        close = data['收盘'][start:]
+        ema_fast = _ema(close, 2 / (fast + 1), _last(prev, '_fast', start))
+        ema_slow = _ema(close, 2 / (slow + 1), _last(prev, '_slow', start))
+        dif = ema_fast - ema_slow
+        dea = _ema(dif, 2 / (signal + 1), _last(prev, dea_col, start))
+        return {dif_col: dif, dea_col: dea, macd_col: 2 * (dif - dea), '_fast': ema_fast, '_slow': ema_slow}
+
+
+class RSI(Indicator):
+    name = 'RSI'
+
+    def outputs(self):
+        return [f'RSI{self.params[0]}', '_up', '_abs']
+
+    def update(self, data, prev, start):
+        n = self.params[0]
+        close = data['收盘']
+        change = np.full(len(close) - start, np.nan)
+        lo = max(start, 1)
+        change[lo - start:] = close[lo:] - close[lo - 1:-1]
+        up = _ema(np.maximum(change, 0), 1 / n, _last(prev, '_up', start))
+        total = _ema(np.abs(change), 1 / n, _last(prev, '_abs', start))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(total > 0, up / total * 100, np.nan)
+        return {f'RSI{n}': rsi, '_up': up, '_abs': total}
+
+
+class BOLL(Indicator):
+    name = 'BOLL'
+    defaults = (20, 2)
+
+    def outputs(self):
+        s = self._suffix()
+        return [f'BOLL{s}', f'UB{s}', f'LB{s}']
+
+    def update(self, data, prev, start):
+        n, k = self.params
+        mid_col, up_col, low_col = self.outputs()
+        window = _window(data['收盘'], n, start, np.nan)
+        mid = window.mean(axis=1)
+        std = window.std(axis=1, ddof=1) if n > 1 else np.zeros_like(mid)
+        return {mid_col: mid, up_col: mid + k * std, low_col: mid - k * std}
+
+
+class KDJ(Indicator):
+    name = 'KDJ'
+    defaults = (9, 3, 3)
+
+    def outputs(self):
+        s = self._suffix()
+        return [f'K{s}', f'D{s}', f'J{s}']
+
+    def update(self, data, prev, start):
+        n, m1, m2 = self.params
+        k_col, d_col, j_col = self.outputs()
+        # 上市不足 n 根时用已有的K线计算最高价、最低价
+        high = _window(data['最高'], n, start, -np.inf).max(axis=1)
+        low = _window(data['最低'], n, start, np.inf).min(axis=1)
+        close = data['收盘'][start:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsv = np.where(high > low, (close - low) / (high - low) * 100, 50.0)
+        # K、D 的初值为 50
+        k = _ema(rsv, 1 / m1, _last(prev, k_col, start) if start else 50.0)
+        d = _ema(k, 1 / m2, _last(prev, d_col, start) if start else 50.0)
+        return {k_col: k, d_col: d, j_col: 3 * k - 2 * d}
+
+
+INDICATORS = {cls.name: cls for cls in (MA, EMA, MACD, RSI, BOLL, KDJ)}
+
+# 可以多个周期一起写的指标，如 MA:5:10:20
+_MULTI = ('MA', 'EMA', 'RSI')
+_MULTI_DEFAULTS = {'MA': (5, 10, 20), 'EMA': (12, 26), 'RSI': (6, 12, 24)}
+
+
+class Cross:
+    """
+    交叉信号：a 上穿 b 为 1，下穿为 -1，其余为 0（任一侧缺失时为 0）
+    """
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.column = f'CROSS_{a}_{b}'
+
+    def compute(self, columns):
+        for name in (self.a, self.b):
+            if name not in columns or name.startswith('_'):
+                raise ValueError(f'交叉信号的字段需为价格列或已请求的指标: {name}')
+        a, b = columns[self.a], columns[self.b]
+        signal = np.zeros(len(a), dtype=np.int64)
+        if len(a) > 1:
+            above, below = a[1:] > b[1:], a[1:] < b[1:]
+            signal[1:] = np.where(above & (a[:-1] <= b[:-1]), 1, np.where(below & (a[:-1] >= b[:-1]), -1, 0))
+        return signal
+
+
+def _number(text, spec):
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError(f'无效的指标参数: {spec}') from None
+    return int(value) if value.is_integer() else value
+
+
+def parse_indicators(expr):
+    """
+    解析 indicators 参数，返回 (指标列表, 交叉信号列表)
+
+    逗号分隔，参数用冒号分隔，如 "MA:5:10:20,MACD,RSI:14,BOLL:20:2,KDJ,CROSS:DIF:DEA"；
+    MA / EMA / RSI 的每个参数是一个周期，其余指标的参数依次替换默认值
+    """
+    indicators, crosses = {}, []
+    for spec in (part.strip() for part in (expr or '').split(',')):
+        if not spec:
+            continue
+        name, *args = spec.split(':')
+        name = name.strip().upper()
+        if name == 'CROSS':
+            if len(args) != 2 or not all(args):
+                raise ValueError(f'交叉信号需要两个字段: {spec}')
+            crosses.append(Cross(*args))
+            continue
+        cls = INDICATORS.get(name)
+        if cls is None:
+            raise ValueError(f'不支持的指标: {name}')
+        params = tuple(_number(arg, spec) for arg in args)
+        if name in _MULTI:
+            groups = [(p,) for p in params or _MULTI_DEFAULTS[name]]
+        else:
+            if len(params) > len(cls.defaults):
+                raise ValueError(f'指标参数过多: {spec}')
+            groups = [params + cls.defaults[len(params):]]
+        for group in groups:
+            # BOLL 的第二个参数是标准差倍数，其余参数都是周期
+            windows = group[:1] if name == 'BOLL' else group
+            if not all(isinstance(p, int) and 1 <= p <= INDICATOR_MAX_WINDOW for p in windows):
+                raise ValueError(f'指标周期需为 1 到 {INDICATOR_MAX_WINDOW} 之间的整数: {spec}')
+            if name == 'BOLL' and group[1] <= 0:
+                raise ValueError(f'BOLL 的标准差倍数需大于 0: {spec}')
+            indicator = cls(*group)
+            indicators.setdefault(indicator.key, indicator)
+    return list(indicators.values()), crosses
+
+
+class _Series:
+    """
+    一个 (代码, 周期, 复权方式) 在本地存储上的全部指标结果
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dates = None
+        self.closes = None
+        self.results = {}
+
+    def sync(self, dates, data):
+        """
+        本地存储只在末尾追加时保留已有结果；历史数据被改写（如前复权重新拉取）时全部丢弃
+        """
+        n = 0 if self.dates is None else len(self.dates)
+        if n == 0 or len(dates) < n or dates[n - 1] != self.dates[-1] \
+                or not np.array_equal(data['收盘'][:n], self.closes, equal_nan=True):
+            self.results = {}
+        self.dates = np.array(dates)
+        self.closes = data['收盘'].copy()
+
+    def get(self, indicator, data):
+        """
+        返回该指标在完整序列上的各列，缓存的结果比序列短时只计算新增部分
+        """
+        outputs = indicator.outputs()
+        prev = self.results.get(indicator.key) or {col: np.empty(0) for col in outputs}
+        start = len(prev[outputs[0]])
+        if start < len(data['收盘']):
+            tail = indicator.update(data, prev, start)
+            prev = {col: np.concatenate([prev[col], tail[col]]) for col in outputs}
+            self.results[indicator.key] = prev
+        return prev
+
+
+class IndicatorEngine:
+    """
+    按 (代码, 周期, 复权方式) 缓存指标结果，最多保留 max_entries 个序列
+    """
+
+    def __init__(self, store=None, max_entries=INDICATOR_CACHE_ENTRIES):
+        self._store = store or history_store
+        self.max_entries = max_entries
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_entries:
+                self._series.popitem(last=False)
+            return series
+
+    @staticmethod
+    def _inputs(source):
+        return {col: np.asarray(source[col], dtype=np.float64) for col in _INPUT_COLUMNS}
+
+    @timed_stage('indicators')
+    def compute(self, stock_code, period, adjust, indicators, crosses, df):
+        """
+        计算 df（history_store.query 的结果）每一行的指标，
+        返回 (列名列表, 与列名对应的值列表)，缺失值为 None
+        """
+        arr = self._store.sync(stock_code, period, adjust)
+        stored_dates = arr['日期'] if arr is not None else np.empty(0, dtype='datetime64[D]')
+        rows = pd.to_datetime(df['日期']).to_numpy().astype('datetime64[D]')
+
+        # df 的末尾可能是本地存储中没有的盘中K线（周线、月线会替换存储中最后一根未走完的K线）
+        pos = np.searchsorted(stored_dates, rows)
+        stored = (pos < len(stored_dates)) & (stored_dates[np.minimum(pos, len(stored_dates) - 1)] == rows) \
+            if len(stored_dates) else np.zeros(len(rows), dtype=bool)
+        live_from = len(rows) if stored.all() else int(np.argmin(stored))
+        cut = int(pos[live_from - 1]) + 1 if live_from > 0 else int(np.searchsorted(stored_dates, rows[0]))
+
+        data = self._inputs(arr) if arr is not None else {col: np.empty(0) for col in _INPUT_COLUMNS}
+        series = self._entry((stock_code, period, adjust))
+        with series.lock:
+            series.sync(stored_dates, data)
+            cached = [series.get(indicator, data) for indicator in indicators]
+
+        if live_from < len(rows):
+            # 盘中K线：在 cut 之前的缓存结果上继续计算，不写入缓存
+            live = self._inputs(df.iloc[live_from:])
+            data = {col: np.concatenate([data[col][:cut], live[col]]) for col in _INPUT_COLUMNS}
+            for i, indicator in enumerate(indicators):
+                prev = {col: values[:cut] for col, values in cached[i].items()}
+                tail = indicator.update(data, prev, cut)
+                cached[i] = {col: np.concatenate([prev[col], tail[col]]) for col in indicator.outputs()}
+        positions = np.concatenate([pos[:live_from], cut + np.arange(len(rows) - live_from)]).astype(np.int64)
+
+        # 交叉信号在完整序列上计算，区间第一行也能与前一根K线比较
+        full = dict(data)
+        for result in cached:
+            full.update(result)
+        names, values = [], []
+        for indicator in indicators:
+            for col in indicator.columns:
+                names.append(col)
+                rounded = round_array(full[col][positions], 3)
+                column = rounded.astype(object)
+                column[np.isnan(rounded)] = None
+                values.append(column.tolist())
+        for cross in crosses:
+            names.append(cross.column)
+            values.append(cross.compute(full)[positions].tolist())
+        return names, values
+
+    def latest(self, stock_code, period, adjust, indicators, crosses):
+        """
+        只读本地存储（不请求上游），返回最近一根已收盘K线的日期与各指标 / 交叉信号的值，
+        本地没有数据时返回 None
+
+        用于对大量股票批量计算，结果不写入缓存，不会挤掉常用股票的序列
+        """
+        arr = self._store.local(stock_code, period, adjust)
+        if arr is None or len(arr) == 0:
+            return None
+        data = self._inputs(arr)
+        full = dict(data)
+        for indicator in indicators:
+            full.update(indicator.update(data, {col: np.empty(0) for col in indicator.outputs()}, 0))
+        values = {col: float(full[col][-1]) for indicator in indicators for col in indicator.columns}
+        for cross in crosses:
+            values[cross.column] = float(cross.compute(full)[-1])
+        return str(arr['日期'][-1]), values
+
+indicator_engine = IndicatorEngine()
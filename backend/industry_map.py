@@ -0,0 +1,172 @@
+"""
+行业分类：东方财富行业板块及其成分股，拉取一次后落盘，过期后在后台线程中刷新
+
+全市场行情快照（stock_zh_a_spot_em）不含行业字段，行业汇总通过这里的 代码 → 行业 映射完成
+多进程部署时刷新通过文件锁串行：一个进程拉取并落盘，其他进程等锁后直接读取文件
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import akshare as ak
+
+from config import DATA_DIR
+from market_data import background_executor, imap_unordered
+from upstream import upstream
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+INDUSTRY_FILE = os.path.join(DATA_DIR, 'industry_map.json')
+
+# 本地行业分类超过该天数后重新拉取
+INDUSTRY_MAX_AGE_DAYS = int(os.environ.get('INDUSTRY_MAX_AGE_DAYS', 7))
+# 拉取成分股时的并发数
+INDUSTRY_CONCURRENCY = int(os.environ.get('INDUSTRY_CONCURRENCY', 4))
+# 拉取失败后至少间隔多少秒再重试
+INDUSTRY_RETRY_SECONDS = float(os.environ.get('INDUSTRY_RETRY_SECONDS', 600))
+
+
+def _load_boards():
+    """
+    从上游拉取全部行业板块的成分股，返回 {行业: [代码, ...]}
+    """
+    names = upstream.call(ak.stock_board_industry_name_em)['板块名称'].tolist()
+
+    def members(name):
+        return upstream.call(ak.stock_board_industry_cons_em, symbol=name)['代码'].astype(str).tolist()
+
+    boards = {}
+    for name, codes, error in imap_unordered(members, names, INDUSTRY_CONCURRENCY, background_executor):
+        if error is not None:
+            print(f"行业成分股获取失败 {name}: {error}")
+        else:
+            boards[name] = codes
+    return boards
+
+
+class IndustryMap:
+    """
+    代码 → 行业映射
+
+    首次使用时读取本地文件；文件不存在或过期时在后台线程中重新拉取，
+    拉取期间继续使用旧数据（没有旧数据时 ready 为 False）
+    """
+
+    def __init__(self, path=INDUSTRY_FILE, loader=None):
+        self.path = path
+        self._loader = loader or _load_boards
+        self._mapping = {}
+        self._updated = None
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._refreshing = False
+        self._last_attempt = None
+        self._thread = None
+
+    @property
+    def ready(self):
+        self._ensure_loaded()
+        return bool(self._mapping)
+
+    def mapping(self):
+        """
+        返回当前的 代码 → 行业 字典（只读）
+        """
+        self._ensure_loaded()
+        return self._mapping
+
+    def industry_of(self, code):
+        return self.mapping().get(code)
+
+    def _apply(self, boards, updated):
+        mapping = {}
+        for name, codes in boards.items():
+            for code in codes:
+                mapping.setdefault(code, name)
+        self._mapping = mapping
+        self._updated = updated
+        self.version += 1
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['industries'], data['updated']
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _write_file(self, boards, updated):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updated': updated, 'industries': boards}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _stale(self, updated=None):
+        updated = updated or self._updated
+        if updated is None:
+            return True
+        oldest = (datetime.now() - timedelta(days=INDUSTRY_MAX_AGE_DAYS)).strftime('%Y%m%d')
+        return updated < oldest
+
+    def _ensure_loaded(self):
+        if self._loaded and not self._stale():
+            return
+        with self._lock:
+            if not self._loaded:
+                boards, updated = self._read_file()
+                if boards:
+                    self._apply(boards, updated)
+                self._loaded = True
+            retry_due = self._last_attempt is None or time.monotonic() - self._last_attempt >= INDUSTRY_RETRY_SECONDS
+            if self._stale() and not self._refreshing and retry_due:
+                self._refreshing = True
+                self._last_attempt = time.monotonic()
+                self._thread = threading.Thread(target=self._refresh, name='industry-map', daemon=True)
+                self._thread.start()
+
+    def wait_ready(self, timeout=None):
+        """
+        还没有行业分类时等待正在进行的后台拉取完成（最多 timeout 秒），返回是否已有行业分类
+        """
+        self._ensure_loaded()
+        thread = self._thread
+        if thread is not None and not self._mapping:
+            thread.join(timeout)
+        return bool(self._mapping)
+
+    def refresh(self):
+        """
+        同步拉取行业分类并落盘，失败时抛出异常
+        等锁期间其他进程已经写入未过期的文件时直接使用文件
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            boards, updated = self._read_file()
+            if not boards or self._stale(updated):
+                boards = self._loader()
+                if not boards:
+                    return
+                updated = datetime.now().strftime('%Y%m%d')
+                self._write_file(boards, updated)
+        with self._lock:
+            self._loaded = True
+            self._apply(boards, updated)
+
+    def _refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"行业分类加载失败: {e}")
+        finally:
+            self._refreshing = False
+
+industry_map = IndustryMap()
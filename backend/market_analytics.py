@@ -0,0 +1,268 @@
+"""
+全市场横截面统计：基于共享行情快照的涨跌幅榜、成交榜、行业汇总与个股分位
+
+每个快照版本只构建一次统计对象：数值列的 float64 副本、排序后的值、行业汇总和排行榜
+都在首次使用时计算并保存，之后的请求直接复用。排行榜用 argpartition 取出前 N 个
+再对这 N 个排序，不做全量排序。
+"""
+import os
+import threading
+
+import numpy as np
+
+from formatting import CODE_COLUMNS, format_dict_values, round_array
+from industry_map import industry_map
+from pool_query import INDUSTRY_COLUMN
+from spot_snapshot import market_snapshot
+
+# 排行榜默认返回的字段
+DEFAULT_FIELDS = ('代码', '名称', '最新价', '涨跌幅', '涨跌额', '成交额', '换手率')
+# 排行榜单次最多返回的行数
+ANALYTICS_MAX_N = int(os.environ.get('ANALYTICS_MAX_N', 200))
+
+# 行业汇总的数值字段（用于排序校验）
+INDUSTRY_FIELDS = (
+    '股票数', '平均涨跌幅', '加权涨跌幅', '成交额', '总市值', '上涨家数', '下跌家数', '平盘家数',
+)
+
+
+class MarketAnalytics:
+    """
+    一个快照版本上的横截面统计（只读，线程安全）
+    """
+
+    def __init__(self, snapshot, industries=None):
+        self.snapshot = snapshot
+        self._industries_of = industries or {}
+        self._numeric = {}
+        self._text = {}
+        self._sorted = {}
+        self._top = {}
+        self._industry_rows = None
+        self._market = None
+        self._lock = threading.Lock()
+
+    def numeric(self, col):
+        """
+        数值列的 float64 副本（缺失值为 NaN）
+        """
+        values = self._numeric.get(col)
+        if values is not None:
+            return values
+        if col not in self.snapshot.columns:
+            raise ValueError(f'未知字段: {col}')
+        if col in CODE_COLUMNS:
+            raise ValueError(f'字段 {col} 不是数值')
+        try:
+            values = np.asarray(self.snapshot.columns[col], dtype=np.float64)
+        except (ValueError, TypeError):
+            raise ValueError(f'字段 {col} 不是数值') from None
+        with self._lock:
+            self._numeric[col] = values
+        return values
+
+    def text(self, col):
+        """
+        文本列的字符串数组（缺失值为空字符串）；所属行业 由行业分类映射得到
+        """
+        values = self._text.get(col)
+        if values is not None:
+            return values
+        if col == INDUSTRY_COLUMN:
+            source = [self._industries_of.get(code) for code in self.snapshot.codes]
+        elif col in self.snapshot.columns:
+            source = self.snapshot.columns[col]
+        else:
+            raise ValueError(f'未知字段: {col}')
+        values = np.array(['' if v is None or v != v else str(v) for v in source], dtype=str)
+        with self._lock:
+            self._text[col] = values
+        return values
+
+    def _check_fields(self, fields):
+        for col in fields:
+            if col not in self.snapshot.columns:
+                raise ValueError(f'未知字段: {col}')
+
+    def top(self, by, n, descending=True, fields=None):
+        """
+        按 by 列取前 n 行（缺失值不参与排名）
+        """
+        fields = fields or [col for col in DEFAULT_FIELDS if col in self.snapshot.columns]
+        self._check_fields(fields)
+        key = (by, n, descending)
+        rows = self._top.get(key)
+        if rows is None:
+            values = self.numeric(by)
+            valid = np.flatnonzero(~np.isnan(values))
+            keys = -values[valid] if descending else values[valid]
+            n = min(n, len(keys))
+            if n == 0:
+                rows = valid[:0]
+            else:
+                if n < len(keys):
+                    part = np.argpartition(keys, n - 1)[:n]
+                else:
+                    part = np.arange(len(keys))
+                rows = valid[part[np.argsort(keys[part], kind='stable')]]
+            with self._lock:
+                self._top[key] = rows
+        return [format_dict_values(self.snapshot.row_at(i, fields)) for i in rows]
+
+    def _sorted_values(self, col):
+        values = self._sorted.get(col)
+        if values is None:
+            values = self.numeric(col)
+            values = np.sort(values[~np.isnan(values)])
+            with self._lock:
+                self._sorted[col] = values
+        return values
+
+    def percentile(self, code, by):
+        """
+        个股在全市场中的位置：百分位（0~100，越大越靠前）与从大到小的名次，
+        代码不存在时返回 None，该字段缺失时百分位与名次为 None
+        """
+        i = self.snapshot.index.get(code)
+        if i is None:
+            return None
+        value = self.numeric(by)[i]
+        ordered = self._sorted_values(by)
+        if np.isnan(value) or len(ordered) == 0:
+            return {'value': None, 'percentile': None, 'rank': None, 'total': len(ordered)}
+        below = int(np.searchsorted(ordered, value, side='left'))
+        not_above = int(np.searchsorted(ordered, value, side='right'))
+        return {
+            'value': round(float(value), 3),
+            # 相同值取中间位置
+            'percentile': round((below + (not_above - below) / 2) / len(ordered) * 100, 2),
+            'rank': len(ordered) - not_above + 1,
+            'total': len(ordered),
+        }
+
+    def _group_ids(self):
+        """
+        每只股票的行业编号（没有行业的为 -1）与行业名称列表
+        """
+        names = sorted(set(self._industries_of.values()))
+        id_of = {name: i for i, name in enumerate(names)}
+        ids = np.fromiter(
+            (id_of.get(self._industries_of.get(code), -1) for code in self.snapshot.codes),
+            dtype=np.int64, count=len(self.snapshot),
+        )
+        return ids, names
+
+    @staticmethod
+    def _aggregate(ids, k, change, amount, cap, float_cap):
+        """
+        按编号 0..k-1 分组汇总（bincount），返回各字段的数组
+        """
+        valid = ~np.isnan(change)
+        chg = np.where(valid, change, 0.0)
+        weight = np.where(valid & ~np.isnan(float_cap), float_cap, 0.0)
+        count = np.bincount(ids, minlength=k)
+        counted = np.bincount(ids, weights=valid, minlength=k)
+        weight_sum = np.bincount(ids, weights=weight, minlength=k)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(ids, weights=chg, minlength=k) / counted
+            weighted = np.bincount(ids, weights=chg * weight, minlength=k) / weight_sum
+        return {
+            '股票数': count,
+            '平均涨跌幅': mean,
+            '加权涨跌幅': weighted,
+            '成交额': np.bincount(ids, weights=np.nan_to_num(amount), minlength=k),
+            '总市值': np.bincount(ids, weights=np.nan_to_num(cap), minlength=k),
+            '上涨家数': np.bincount(ids, weights=valid & (change > 0), minlength=k),
+            '下跌家数': np.bincount(ids, weights=valid & (change < 0), minlength=k),
+            '平盘家数': np.bincount(ids, weights=valid & (change == 0), minlength=k),
+        }
+
+    @staticmethod
+    def _records(stats, k):
+        columns = {}
+        for name, values in stats.items():
+            if name in ('股票数', '上涨家数', '下跌家数', '平盘家数'):
+                columns[name] = values.astype(np.int64).tolist()
+            else:
+                rounded = round_array(values, 3)
+                columns[name] = [None if v != v else v for v in rounded.tolist()]
+        return [{name: columns[name][i] for name in stats} for i in range(k)]
+
+    def market(self):
+        """
+        全市场汇总（涨跌家数、平均涨跌幅、成交额等，每个快照版本只计算一次）
+        """
+        if self._market is not None:
+            return self._market
+        ids = np.zeros(len(self.snapshot), dtype=np.int64)
+        result = self._records(self._aggregate(ids, 1, *self._aggregate_inputs()), 1)[0]
+        with self._lock:
+            self._market = result
+        return result
+
+    def _aggregate_inputs(self):
+        def column(col):
+            return self.numeric(col) if col in self.snapshot.columns else np.full(len(self.snapshot), np.nan)
+        return column('涨跌幅'), column('成交额'), column('总市值'), column('流通市值')
+
+    def industries(self):
+        """
+        行业汇总（每个快照版本只计算一次），每个行业附带领涨股
+        """
+        if self._industry_rows is not None:
+            return self._industry_rows
+        ids, names = self._group_ids()
+        k = len(names)
+        grouped = ids >= 0
+        change, amount, cap, float_cap = self._aggregate_inputs()
+        stats = self._aggregate(
+            ids[grouped], k, change[grouped], amount[grouped], cap[grouped], float_cap[grouped]
+        )
+        rows = self._records(stats, k)
+
+        # 领涨股：按 (行业, 涨跌幅降序) 排序后取每个行业的第一只
+        positions = np.flatnonzero(grouped & ~np.isnan(change))
+        order = positions[np.lexsort((-change[positions], ids[positions]))]
+        group_of = ids[order]
+        first = order[np.r_[True, group_of[1:] != group_of[:-1]]] if len(order) else order
+        leaders = {int(ids[i]): i for i in first}
+
+        for g, row in enumerate(rows):
+            row['行业'] = names[g]
+            i = leaders.get(g)
+            row['领涨股'] = format_dict_values(self.snapshot.row_at(i, ['代码', '名称', '涨跌幅'])) if i is not None else None
+        rows = [row for row in rows if row['股票数'] > 0]
+        with self._lock:
+            self._industry_rows = rows
+        return rows
+
+
+class SharedAnalytics:
+    """
+    进程内共享的统计对象：快照或行业分类更新后，下一次访问时重建
+    """
+
+    def __init__(self, snapshot_source=None, industries=None):
+        self._source = snapshot_source or market_snapshot
+        self._industries = industries or industry_map
+        self._current = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        snapshot = self._source.current
+        if snapshot is None:
+            return None
+        # 先读版本号再读映射：两者之间发生更新时，下一次访问会再重建一次
+        key = (snapshot.version, self._industries.version)
+        mapping = self._industries.mapping()
+        if self._key != key:
+            with self._lock:
+                if self._key != key:
+                    self._current = MarketAnalytics(snapshot, mapping)
+                    self._key = key
+        return self._current
+
+
+market_analytics = SharedAnalytics()
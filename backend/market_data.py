@@ -0,0 +1,221 @@
+"""
+akshare 数据访问层：所有行情接口调用统一经过共享缓存，HTTP 请求经过 upstream 的连接池与限流
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from datetime import datetime
+
+import akshare as ak
+
+from cache import TTLCache
+from pool_query import PoolView
+from trade_calendar import trade_calendar
+from upstream import remaining, upstream
+
+# 缓存总内存上限，默认 256MB；过期不超过 CACHE_MAX_STALE 秒的数据先返回再后台刷新
+cache = TTLCache(
+    max_bytes=int(os.environ.get('CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    max_stale=float(os.environ.get('CACHE_MAX_STALE', 300)),
+)
+
+# 各接口的缓存有效期（秒）
+CACHE_TTL = {
+    'stock_info': int(os.environ.get('CACHE_TTL_STOCK_INFO', 600)),
+    'stock_hist': int(os.environ.get('CACHE_TTL_STOCK_HIST', 60)),
+    'stock_hist_qfq': int(os.environ.get('CACHE_TTL_STOCK_HIST_QFQ', 6 * 3600)),
+    'zt_pool': int(os.environ.get('CACHE_TTL_POOL', 30)),
+    'strong_pool': int(os.environ.get('CACHE_TTL_POOL', 30)),
+    'dt_pool': int(os.environ.get('CACHE_TTL_POOL', 30)),
+}
+
+
+# 上游调用共享线程池（有界），以及单次调用的默认超时（秒）
+UPSTREAM_WORKERS = int(os.environ.get('UPSTREAM_WORKERS', 16))
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 15))
+# 三个互相独立的线程池，批量任务和后台任务占满自己的线程池时不会让交互请求的并发调用排队超时：
+# executor - 请求内的 gather；bulk_executor - 请求内的批量任务（批量查询、多股对比）；
+# background_executor - 后台任务（股票池存档、预热、分时采集、行业分类）
+UPSTREAM_BULK_WORKERS = int(os.environ.get('UPSTREAM_BULK_WORKERS', 8))
+UPSTREAM_BACKGROUND_WORKERS = int(os.environ.get('UPSTREAM_BACKGROUND_WORKERS', 4))
+executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream')
+bulk_executor = ThreadPoolExecutor(max_workers=UPSTREAM_BULK_WORKERS, thread_name_prefix='upstream-bulk')
+background_executor = ThreadPoolExecutor(max_workers=UPSTREAM_BACKGROUND_WORKERS, thread_name_prefix='upstream-background')
+
+
+def gather(calls, timeout=None):
+    """
+    在共享线程池中并发执行多个相互独立的上游调用
+
+    calls: {名称: (函数, 参数...)}
+    返回 {名称: (结果, 异常)}，单个调用失败或超时不影响其他调用
+    """
+    timeout = UPSTREAM_TIMEOUT if timeout is None else timeout
+    # 不超过当前请求剩余的上游时间预算
+    left = remaining()
+    if left is not None:
+        timeout = max(0, min(timeout, left))
+    # 任务在调用方的上下文中执行，耗时计入当前请求的 Server-Timing
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, fn, *args) for name, (fn, *args) in calls.items()
+    }
+    deadline = time.monotonic() + timeout
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = (future.result(timeout=max(0, deadline - time.monotonic())), None)
+        except FutureTimeoutError:
+            future.cancel()
+            results[name] = (None, TimeoutError(f'{name} 请求超时'))
+        except Exception as e:
+            results[name] = (None, e)
+    return results
+
+
+def imap_unordered(fn, items, concurrency, pool=None):
+    """
+    在线程池中对 items 逐个调用 fn，同时最多 concurrency 个在途，
+    按完成顺序产出 (item, 结果, 异常)
+    pool 默认为请求内批量任务的 bulk_executor，后台任务传入 background_executor
+    """
+    pool = pool or bulk_executor
+    items = iter(items)
+    pending = {}
+
+    def submit_next():
+        for item in items:
+            pending[pool.submit(contextvars.copy_context().run, fn, item)] = item
+            return True
+        return False
+
+    for _ in range(concurrency):
+        if not submit_next():
+            break
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            error = future.exception()
+            yield item, (None if error else future.result()), error
+            submit_next()
+
+
+def _today_str():
+    return datetime.now().strftime('%Y%m%d')
+
+
+def _pool_closed(date):
+    return date < _today_str() or date <= trade_calendar.last_closed_day()
+
+
+def _pool_ttl(name, date):
+    # 已收盘交易日（包括收盘数据落定后的当天）的股票池不会再变化，永久缓存；
+    # 空结果可能是上游暂时没有数据，只按盘中的有效期缓存，之后重新拉取确认
+    if _pool_closed(date):
+        return lambda value: CACHE_TTL[name] if len(value) == 0 else None
+    return CACHE_TTL[name]
+
+
+def fetch_stock_info(stock_code):
+    """
+    个股基本信息（stock_individual_info_em）
+    """
+    df = cache.get_or_load(
+        ('stock_info', stock_code),
+        lambda: upstream.call(ak.stock_individual_info_em, symbol=stock_code),
+        CACHE_TTL['stock_info'],
+    )
+    return df.copy()
+
+
+def fetch_stock_hist(symbol, period='daily', start_date='19700101', end_date='20500101', adjust='', fresh=False):
+    """
+    历史行情（stock_zh_a_hist）
+    结束日期早于今天的K线已收盘不再变化；前复权数据会因除权除息而改变，只做长时间缓存
+    fresh=True 时不返回过期的缓存值（上游失败时抛出异常），供需要落盘的本地存储使用
+    """
+    if end_date >= _today_str():
+        ttl = CACHE_TTL['stock_hist']
+    elif adjust == 'qfq':
+        ttl = CACHE_TTL['stock_hist_qfq']
+    else:
+        ttl = None
+    df = cache.get_or_load(
+        ('stock_hist', symbol, period, start_date, end_date, adjust),
+        lambda: upstream.call(
+            ak.stock_zh_a_hist,
+            symbol=symbol,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            adjust=adjust
+        ),
+        ttl,
+        allow_stale=not fresh,
+    )
+    return df.copy()
+
+
+def invalidate_stock_hist(symbol, period, start_date, end_date, adjust=''):
+    """
+    丢弃某个历史行情查询的缓存
+    """
+    cache.invalidate(('stock_hist', symbol, period, start_date, end_date, adjust))
+
+
+def fetch_zt_pool(date):
+    """
+    涨停股票池（stock_zt_pool_em）
+    """
+    df = cache.get_or_load(
+        ('zt_pool', date), lambda: upstream.call(ak.stock_zt_pool_em, date=date), _pool_ttl('zt_pool', date)
+    )
+    return df.copy()
+
+
+def fetch_strong_pool(date):
+    """
+    强势股票池（stock_zt_pool_strong_em）
+    """
+    df = cache.get_or_load(
+        ('strong_pool', date), lambda: upstream.call(ak.stock_zt_pool_strong_em, date=date), _pool_ttl('strong_pool', date)
+    )
+    return df.copy()
+
+
+def fetch_dt_pool(date):
+    """
+    跌停股票池（stock_zt_pool_dtgc_em）
+    """
+    df = cache.get_or_load(
+        ('dt_pool', date), lambda: upstream.call(ak.stock_zt_pool_dtgc_em, date=date), _pool_ttl('dt_pool', date)
+    )
+    return df.copy()
+
+
+POOL_FETCHERS = {
+    'zt_pool': fetch_zt_pool,
+    'strong_pool': fetch_strong_pool,
+    'dt_pool': fetch_dt_pool,
+}
+
+
+def fetch_pool_view(name, date):
+    """
+    股票池的按列只读视图（服务端筛选 / 排序 / 分页使用），与股票池使用相同的缓存有效期
+    """
+    def load():
+        if not _pool_closed(date):
+            # 视图过期时股票池数据也要重新拉取，避免基于旧数据构建视图
+            cache.invalidate((name, date))
+        return PoolView(POOL_FETCHERS[name](date))
+
+    return cache.get_or_load(('pool_view', name, date), load, _pool_ttl(name, date))
+
+
+def fetch_intraday(stock_code):
+    """
+    当日分时成交（stock_intraday_em），盘中持续变化，不缓存
+    """
+    return upstream.call(ak.stock_intraday_em, symbol=stock_code)
@@ -0,0 +1,351 @@
+"""
+运行指标：延迟直方图、计数器与仪表，按 Prometheus 文本格式导出
+
+- 每个路由的请求耗时与在途请求数（app.create_app 中注册的请求钩子记录）
+- 每个 akshare 函数的调用耗时与失败次数（upstream.call 记录）
+- 格式化、Excel 生成等阶段的耗时（timed 记录）
+- 同一请求内各阶段的累计耗时写入 Server-Timing 响应头
+
+设置 PROMETHEUS_MULTIPROC_DIR 时（gunicorn 多 worker 部署）每个进程定期把指标快照写入该目录，
+/metrics 合并所有进程的快照后导出：计数器与直方图按标签求和（已退出进程的快照保留，总数不会回退），
+仪表附加 pid 标签按进程分别导出（只包括仍在运行的进程）
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# 是否在响应中添加 Server-Timing 头
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') not in ('0', 'false', 'False', '')
+
+# 默认的延迟分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# 多进程模式的快照目录，未设置时只导出当前进程的指标
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+# 多进程模式下每个进程写入快照的间隔（秒）
+MULTIPROC_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self, items=None, label_names=None):
+        items = self.items() if items is None else items
+        label_names = label_names or self.label_names
+        return self._header() + [f'{self.name}{_labels(label_names, k)} {_number(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    仪表：通过 inc / dec 维护，或由 collect 回调在导出时读取（返回 {标签元组: 值}）
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self._collect = collect
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def items(self):
+        if self._collect is not None:
+            items = sorted(self._collect().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [(k, v) for k, v in items if v is not None]
+
+    def render(self, items=None, label_names=None):
+        items = self.items() if items is None else items
+        label_names = label_names or self.label_names
+        return self._header() + [f'{self.name}{_labels(label_names, k)} {_number(v)}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签元组 → [各分桶计数..., 总和, 次数]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def items(self):
+        with self._lock:
+            return sorted((k, list(v)) for k, v in self._series.items())
+
+    def render(self, items=None, label_names=None):
+        items = self.items() if items is None else items
+        label_names = label_names or self.label_names
+        lines = self._header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(label_names, labels, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(label_names, labels, [("le", "+Inf")])} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(label_names, labels)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(label_names, labels)} {series[-1]}')
+        return lines
+
+
+registry = []
+
+
+def render():
+    """
+    按 Prometheus 文本格式导出所有指标（多进程模式下合并所有进程的快照）
+    """
+    lines = []
+    if MULTIPROC_DIR:
+        flush()
+        merged = _merge_snapshots()
+        for metric in registry:
+            label_names = metric.label_names + ('pid',) if metric.kind == 'gauge' else metric.label_names
+            lines.extend(metric.render(sorted(merged[metric.name].items()), label_names))
+    else:
+        for metric in registry:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def flush(final=False):
+    """
+    多进程模式下写入本进程的指标快照；final 为 True 时（进程退出）只保留计数器与直方图
+    """
+    if not MULTIPROC_DIR:
+        return
+    snapshot = {
+        metric.name: [[list(labels), value] for labels, value in metric.items()]
+        for metric in registry if not (final and metric.kind == 'gauge')
+    }
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    path = os.path.join(MULTIPROC_DIR, f'{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def clear_snapshots():
+    """
+    删除快照目录中的所有快照（gunicorn 主进程启动时调用，避免导出上一次运行的数据）
+    """
+    if not MULTIPROC_DIR or not os.path.isdir(MULTIPROC_DIR):
+        return
+    for filename in os.listdir(MULTIPROC_DIR):
+        if filename.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(MULTIPROC_DIR, filename))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_snapshots():
+    """
+    读取所有进程的快照，返回 {指标名: {标签元组: 值}}；仪表的标签末尾附加 pid
+    """
+    merged = {metric.name: {} for metric in registry}
+    for filename in os.listdir(MULTIPROC_DIR):
+        pid = filename[:-len('.json')]
+        if not filename.endswith('.json') or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(MULTIPROC_DIR, filename), 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _alive(int(pid))
+        for metric in registry:
+            target = merged[metric.name]
+            for labels, value in snapshot.get(metric.name, ()):
+                labels = tuple(labels)
+                if metric.kind == 'gauge':
+                    if alive:
+                        target[labels + (pid,)] = value
+                elif metric.kind == 'histogram':
+                    current = target.get(labels)
+                    target[labels] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target[labels] = target.get(labels, 0) + value
+    return merged
+
+
+class SnapshotWriter:
+    """
+    多进程模式下定期写入本进程指标快照的后台线程
+    """
+
+    def __init__(self, interval=MULTIPROC_FLUSH_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if not MULTIPROC_DIR or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止定期写入，并写入最后一次快照（不含仪表）
+        """
+        self._stop.set()
+        flush(final=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                flush()
+            except OSError as e:
+                print(f"写入指标快照失败: {e}")
+
+
+snapshot_writer = SnapshotWriter()
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', '请求处理耗时（秒）', ('method', 'route', 'status')
+)
+requests_in_flight = Gauge('http_requests_in_flight', '正在处理的请求数', ('route',))
+upstream_duration = Histogram(
+    'upstream_call_duration_seconds', 'akshare 函数调用耗时（秒）', ('function',)
+)
+upstream_errors = Counter('upstream_call_errors_total', 'akshare 函数调用失败次数', ('function',))
+stage_duration = Histogram('stage_duration_seconds', '处理阶段耗时（秒）', ('stage',))
+
+
+# 当前请求各阶段的累计耗时，供 Server-Timing 使用；线程池中的任务通过 copy_context 继承
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def start_request_timing():
+    _request_timings.set({})
+
+
+def request_timings():
+    return _request_timings.get() or {}
+
+
+def record_stage(name, elapsed):
+    """
+    将一段耗时计入当前请求的 Server-Timing（不在请求内时忽略）
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        # 可能有多个线程同时写入同一个请求的计时，这里只做简单累加，允许极少量误差
+        timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def observe_upstream(function, elapsed, failed=False):
+    upstream_duration.observe(elapsed, function)
+    if failed:
+        upstream_errors.inc(function)
+    record_stage('upstream', elapsed)
+
+
+@contextmanager
+def timed(stage):
+    """
+    记录一个处理阶段的耗时（阶段直方图 + Server-Timing）
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage)
+        record_stage(stage, elapsed)
+
+
+def timed_stage(stage):
+    """
+    timed 的装饰器版本
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(total):
+    """
+    生成 Server-Timing 头：各阶段累计耗时与请求总耗时（毫秒）
+    """
+    parts = [f'{name};dur={elapsed * 1000:.1f}' for name, elapsed in request_timings().items()]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
@@ -0,0 +1,210 @@
+"""
+股票池统计：基于股票池存档的连板天梯、个股涨停历史，以及每日 / 滚动的炸板率与晋级率
+
+所有统计都在存档合并表上用 bincount、排序合并等向量化操作完成，不再逐日请求上游：
+- 炸板率 = 炸板股数 / (涨停股数 + 炸板股数)
+- 晋级率 = 今天仍在涨停股池中的昨日涨停股 / 昨日涨停股数；天梯中第 k 板的晋级率为
+  昨日 k-1 板今天晋级到 k 板的数量 / 昨日 k-1 板的数量（只在两个存档日是相邻交易日时计算）
+"""
+import os
+
+import numpy as np
+
+from formatting import format_records, round_array
+from metrics import timed_stage
+from pool_archive import ARCHIVED_POOLS
+from trade_calendar import trade_calendar
+
+# 滚动统计的最大窗口（交易日）
+POOL_STATS_MAX_WINDOW = int(os.environ.get('POOL_STATS_MAX_WINDOW', 250))
+
+# 连板天梯中每只股票返回的字段
+LADDER_FIELDS = ('代码', '名称', '最新价', '涨跌幅', '封板资金', '首次封板时间', '最后封板时间', '炸板次数', '所属行业')
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = numerator / denominator
+    return [None if v != v else v for v in round_array(values * 100, 2).tolist()]
+
+
+def _records(table, rows, fields=None):
+    """
+    表中若干行的格式化记录，日期保持 YYYYMMDD 字符串
+    """
+    frame = table.frame.iloc[rows]
+    frame = frame[[col for col in fields if col in frame.columns]] if fields else frame.dropna(axis=1, how='all')
+    records = format_records(frame.drop(columns='日期', errors='ignore'))
+    if fields is None:
+        records = [{'日期': day, **record} for record, day in zip(records, table.days[table.day[rows]].tolist())]
+    return records
+
+
+def _streaks(table, rows):
+    return np.nan_to_num(table.numeric('连板数')[rows], nan=1).astype(np.int64)
+
+
+def _previous_rows(table, i):
+    """
+    第 i 个存档日的上一个交易日的行，上一个交易日没有存档时返回 None
+    """
+    if i is None or i == 0 or table.days[i - 1] != trade_calendar.previous_trading_day(table.days[i]):
+        return None
+    return table.rows_of_day(i - 1)
+
+
+@timed_stage('pool_stats')
+def ladder(table, day):
+    """
+    某个交易日的连板天梯：按连板数从高到低分组，每组附带从上一交易日晋级的比率
+    table 中没有该交易日时返回 None
+    """
+    i = table.day_index(day)
+    if i is None:
+        return None
+    rows = table.rows_of_day(i)
+    streak = _streaks(table, rows)
+    codes = table.codes[rows]
+
+    prev_rows = _previous_rows(table, i)
+    top = int(streak.max()) if len(streak) else 0
+    promoted = base = None
+    if prev_rows is not None:
+        prev_streak = _streaks(table, prev_rows)
+        prev_codes = table.codes[prev_rows]
+        # 排序合并：今天每只股票在昨天涨停股池中的连板数（不在为 0）
+        order = np.argsort(prev_codes)
+        pos = np.minimum(np.searchsorted(prev_codes[order], codes), max(len(order) - 1, 0))
+        matched = (prev_codes[order][pos] == codes) if len(order) else np.zeros(len(codes), dtype=bool)
+        yesterday = np.where(matched, prev_streak[order][pos], 0)
+        size = max(top, int(prev_streak.max()) if len(prev_streak) else 0) + 2
+        promoted = np.bincount(streak[matched & (streak == yesterday + 1)], minlength=size)
+        base = np.bincount(prev_streak, minlength=size)
+
+    records = _records(table, rows, LADDER_FIELDS)
+    levels = []
+    for k in sorted(set(streak.tolist()), reverse=True):
+        members = np.flatnonzero(streak == k)
+        level = {'连板数': k, '数量': len(members), '晋级率': None, 'stocks': [records[j] for j in members]}
+        if promoted is not None and k >= 2:
+            level['晋级率'] = _ratio(np.array([promoted[k]]), np.array([base[k - 1]]))[0]
+        levels.append(level)
+    return {
+        'date': day,
+        'prev_date': str(table.days[i - 1]) if prev_rows is not None else None,
+        'total': len(rows),
+        'max_streak': top,
+        'levels': levels,
+    }
+
+
+@timed_stage('pool_stats')
+def code_history(tables, code, start_date='19700101', end_date='20500101'):
+    """
+    个股在各股票池存档中出现的记录（按交易日升序）与汇总
+    tables: 股票池 → PoolTable
+    """
+    result = {}
+    for name in ARCHIVED_POOLS:
+        table = tables[name]
+        rows = table.rows_of_code(code)
+        days = table.days[table.day[rows]]
+        result[name] = _records(table, rows[(days >= start_date) & (days <= end_date)])
+    zt_streaks = [r.get('连板数') for r in result['zt_pool'] if r.get('连板数') is not None]
+    return {
+        'code': code,
+        'summary': {
+            '涨停次数': len(result['zt_pool']),
+            '最高连板': int(max(zt_streaks)) if zt_streaks else 0,
+            '炸板次数': len(result['zb_pool']),
+            '跌停次数': len(result['dt_pool']),
+            '强势次数': len(result['strong_pool']),
+        },
+        'pools': result,
+    }
+
+
+def _rolling_sum(values, window):
+    cumsum = np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+    start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    return cumsum[1:] - cumsum[start]
+
+
+@timed_stage('pool_stats')
+def daily_stats(tables, start_date='19700101', end_date='20500101', window=5):
+    """
+    每个存档交易日的涨停 / 跌停 / 炸板 / 强势股数、最高连板、炸板率、晋级率，
+    以及最近 window 个交易日的滚动炸板率与晋级率（窗口内分子、分母分别求和后相除）
+    """
+    zt = tables['zt_pool']
+    days = zt.days
+    n = len(days)
+
+    def counts(name):
+        # 各股票池的交易日序号映射到涨停股池的交易日上（涨停股池没有的交易日不统计）
+        table = tables[name]
+        pos = np.searchsorted(days, table.days)
+        valid = (pos < n) & (days[np.minimum(pos, max(n - 1, 0))] == table.days) if n else np.zeros(len(table.days), dtype=bool)
+        mapped = np.where(valid, pos, -1)[table.day]
+        return np.bincount(mapped[mapped >= 0], minlength=n)[:n], np.isin(days, table.days[valid])
+
+    zt_count = np.bincount(zt.day, minlength=n)[:n]
+    zb_count, zb_present = counts('zb_pool')
+    dt_count, dt_present = counts('dt_pool')
+    strong_count, strong_present = counts('strong_pool')
+
+    streak = np.nan_to_num(zt.numeric('连板数'), nan=1)
+    max_streak = np.zeros(n)
+    np.maximum.at(max_streak, zt.day, streak)
+    multi = np.bincount(zt.day, weights=streak >= 2, minlength=n)[:n]
+    resealed = np.bincount(zt.day, weights=np.nan_to_num(zt.numeric('炸板次数')) > 0, minlength=n)[:n]
+
+    # 晋级：代码编号 + 交易日序号组成键，昨天的键集合中包含 (今天 - 1, 代码) 的行即为晋级
+    _, code_ids = np.unique(zt.codes, return_inverse=True)
+    stride = code_ids.max() + 1 if len(code_ids) else 1
+    keys = zt.day * stride + code_ids
+    promoted_rows = np.isin(keys - stride, keys) & (zt.day > 0)
+    promoted = np.bincount(zt.day[promoted_rows], minlength=n)[:n].astype(np.float64)
+    consecutive = np.zeros(n, dtype=bool)
+    if n:
+        previous = np.array([trade_calendar.previous_trading_day(day) for day in days[1:].tolist()], dtype='U8')
+        consecutive[1:] = previous == days[:-1]
+    prev_count = np.r_[0, zt_count[:-1]].astype(np.float64) if n else np.zeros(0)
+    promoted[~consecutive] = 0
+    prev_count[~consecutive] = 0
+
+    broken_total = (zt_count + zb_count).astype(np.float64)
+    zb_valid = zb_present.astype(np.float64)
+    rolling_zb = _rolling_sum(zb_count * zb_valid, window)
+    rolling_zb_total = _rolling_sum(broken_total * zb_valid, window)
+    rolling_promoted = _rolling_sum(promoted, window)
+    rolling_prev = _rolling_sum(prev_count, window)
+
+    zb_rate = _ratio(np.where(zb_present, zb_count, np.nan), broken_total)
+    promotion_rate = _ratio(np.where(consecutive, promoted, np.nan), prev_count)
+    rolling_zb_rate = _ratio(rolling_zb, rolling_zb_total)
+    rolling_promotion_rate = _ratio(rolling_promoted, rolling_prev)
+
+    selected = np.flatnonzero((days >= start_date) & (days <= end_date))
+    rows = []
+    for i in selected.tolist():
+        rows.append({
+            '日期': str(days[i]),
+            '涨停数': int(zt_count[i]),
+            '炸板数': int(zb_count[i]) if zb_present[i] else None,
+            '跌停数': int(dt_count[i]) if dt_present[i] else None,
+            '强势股数': int(strong_count[i]) if strong_present[i] else None,
+            '连板数': int(multi[i]),
+            '回封数': int(resealed[i]),
+            '最高连板': int(max_streak[i]),
+            '炸板率': zb_rate[i],
+            '晋级率': promotion_rate[i],
+            f'{window}日炸板率': rolling_zb_rate[i],
+            f'{window}日晋级率': rolling_promotion_rate[i],
+        })
+    summary = {
+        '交易日数': len(selected),
+        '炸板率': _ratio(np.array([(zb_count * zb_valid)[selected].sum()]), np.array([(broken_total * zb_valid)[selected].sum()]))[0],
+        '晋级率': _ratio(np.array([promoted[selected].sum()]), np.array([prev_count[selected].sum()]))[0],
+    }
+    return {'window': window, 'summary': summary, 'data': rows}
@@ -0,0 +1,348 @@
+"""
+股票池存档：已收盘交易日的涨停 / 强势 / 跌停 / 炸板股票池按 股票池 / 交易日 分区落盘，
+后台线程回补配置的日期范围，并在每个交易日收盘后追加当天
+
+目录结构: data/pools/<股票池>/<YYYYMMDD>.json（{columns, arrays}）
+空股票池可能是上游暂时没有数据：同时写入 <YYYYMMDD>.empty 标记（内容为连续拉到空结果的次数），
+之后的回补间隔 POOL_ARCHIVE_RETRY 秒重新拉取，连续 POOL_ARCHIVE_EMPTY_CHECKS 次为空才确认并删除标记
+查询时每个股票池的全部存档合并为一张按交易日排列的表，按交易日、按代码建立索引
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR
+from formatting import CODE_COLUMNS
+from market_data import background_executor, imap_unordered
+from trade_calendar import trade_calendar
+from upstream import upstream
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+POOL_ARCHIVE_DIR = os.path.join(DATA_DIR, 'pools')
+
+# 存档的股票池 → akshare 函数名（炸板股池用于计算炸板率）
+ARCHIVED_POOLS = {
+    'zt_pool': 'stock_zt_pool_em',
+    'strong_pool': 'stock_zt_pool_strong_em',
+    'dt_pool': 'stock_zt_pool_dtgc_em',
+    'zb_pool': 'stock_zt_pool_zbgc_em',
+}
+
+# 回补最近多少个交易日（0 表示不启动后台存档）；POOL_ARCHIVE_START（YYYYMMDD）指定时从该日开始回补
+POOL_ARCHIVE_DAYS = int(os.environ.get('POOL_ARCHIVE_DAYS', 30))
+POOL_ARCHIVE_START = os.environ.get('POOL_ARCHIVE_START', '')
+# 后台检查间隔（秒）、拉取并发数，以及拉取失败的交易日多久之后再重试（秒）
+POOL_ARCHIVE_INTERVAL = float(os.environ.get('POOL_ARCHIVE_INTERVAL', 600))
+POOL_ARCHIVE_CONCURRENCY = int(os.environ.get('POOL_ARCHIVE_CONCURRENCY', 4))
+POOL_ARCHIVE_RETRY = float(os.environ.get('POOL_ARCHIVE_RETRY', 3600))
+# 空股票池连续拉取多少次都为空才确认为空，不再重新拉取
+POOL_ARCHIVE_EMPTY_CHECKS = int(os.environ.get('POOL_ARCHIVE_EMPTY_CHECKS', 3))
+
+
+def _load_pool(name, day):
+    return upstream.call(getattr(ak, ARCHIVED_POOLS[name]), date=day)
+
+
+class PoolTable:
+    """
+    一个股票池在全部存档交易日上的合并表（只读），行按交易日升序、日内保持上游顺序
+
+    days: 交易日（YYYYMMDD）数组；day: 每行的交易日序号；codes: 每行的代码；
+    frame: 合并后的 DataFrame（首列为 日期）
+    """
+
+    def __init__(self, frames):
+        frames = [(day, df) for day, df in sorted(frames, key=lambda item: item[0])]
+        self.days = np.array([day for day, _ in frames], dtype='U8')
+        parts = [df.assign(日期=day) for day, df in frames if len(df)]
+        if parts:
+            frame = pd.concat(parts, ignore_index=True)
+            self.frame = frame[['日期'] + [col for col in frame.columns if col != '日期']]
+        else:
+            self.frame = pd.DataFrame({'日期': [], '代码': []})
+        self.day = np.searchsorted(self.days, self.frame['日期'].to_numpy(dtype='U8')).astype(np.int64)
+        self.codes = self.frame['代码'].astype(str).str.zfill(6).to_numpy(dtype='U6')
+        # 按交易日：第 i 个交易日的行为 offsets[i]:offsets[i + 1]
+        self.offsets = np.searchsorted(self.day, np.arange(len(self.days) + 1))
+        self._numeric = {}
+        self._by_code = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def day_index(self, day):
+        """
+        交易日的序号，没有存档时返回 None
+        """
+        i = int(np.searchsorted(self.days, day))
+        return i if i < len(self.days) and self.days[i] == day else None
+
+    def rows_of_day(self, i):
+        return np.arange(self.offsets[i], self.offsets[i + 1])
+
+    def rows_of_code(self, code):
+        """
+        某只股票出现过的所有行（按交易日升序）
+        """
+        if self._by_code is None:
+            uniq, inverse = np.unique(self.codes, return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(uniq) + 1))
+            by_code = {code: order[bounds[k]:bounds[k + 1]] for k, code in enumerate(uniq.tolist())}
+            with self._lock:
+                self._by_code = by_code
+        return self._by_code.get(code, np.empty(0, dtype=np.int64))
+
+    def numeric(self, col):
+        """
+        数值列的 float64 数组（缺失值和列不存在的交易日为 NaN）
+        """
+        values = self._numeric.get(col)
+        if values is None:
+            if col in CODE_COLUMNS:
+                raise ValueError(f'字段 {col} 不是数值')
+            if col not in self.frame.columns:
+                values = np.full(len(self), np.nan)
+            else:
+                values = pd.to_numeric(self.frame[col], errors='coerce').to_numpy(dtype=np.float64)
+            with self._lock:
+                self._numeric[col] = values
+        return values
+
+
+class PoolArchive:
+    """
+    按 (股票池, 交易日) 分区的股票池存档，只保存已收盘交易日
+    """
+
+    def __init__(self, root=POOL_ARCHIVE_DIR, loader=None):
+        self.root = root
+        self._loader = loader or _load_pool
+        self._tables = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name, day):
+        if name not in ARCHIVED_POOLS or not (day.isdigit() and len(day) == 8):
+            raise ValueError(f'不支持的参数: pool={name}, date={day}')
+        return os.path.join(self.root, name, f'{day}.json')
+
+    def has(self, name, day):
+        return os.path.exists(self._path(name, day))
+
+    def _empty_marker(self, name, day):
+        return self._path(name, day)[:-len('.json')] + '.empty'
+
+    def _empty_checks(self, name, day):
+        """
+        尚未确认的空股票池已连续拉到空结果的次数及最近一次拉取的时间，没有标记时返回 None
+        """
+        path = self._empty_marker(name, day)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return int(f.read() or 0), os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None
+
+    def needs_fetch(self, name, day):
+        """
+        没有存档，或存档是尚未确认的空股票池且距上次拉取已超过 POOL_ARCHIVE_RETRY 秒
+        """
+        if not self.has(name, day):
+            return True
+        checks = self._empty_checks(name, day)
+        return checks is not None and time.time() - checks[1] >= POOL_ARCHIVE_RETRY
+
+    def written_at(self, name, day):
+        """
+        一天的存档写入时间，没有存档时返回 None
+        """
+        try:
+            return datetime.fromtimestamp(os.path.getmtime(self._path(name, day)))
+        except OSError:
+            return None
+
+    def days(self, name):
+        try:
+            files = os.listdir(os.path.join(self.root, name))
+        except OSError:
+            return []
+        return sorted(f[:8] for f in files if f.endswith('.json') and f[:8].isdigit())
+
+    def read(self, name, day):
+        """
+        读取一天的股票池，没有存档时返回 None
+        """
+        try:
+            with open(self._path(name, day), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return pd.DataFrame(dict(zip(data['columns'], data['arrays'])), columns=data['columns'])
+
+    def write(self, name, day, df):
+        path = self._path(name, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'columns': [str(col) for col in df.columns],
+                'arrays': [df[col].tolist() for col in df.columns],
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def fetch(self, name, day):
+        """
+        从上游拉取一天的股票池并存档（上游返回 None 时按空股票池保存）
+        空股票池在连续拉取 POOL_ARCHIVE_EMPTY_CHECKS 次之前保留 .empty 标记，之后的回补会重新拉取
+        """
+        df = self._loader(name, day)
+        if df is None:
+            df = pd.DataFrame()
+        marker = self._empty_marker(name, day)
+        if df.empty:
+            checks = self._empty_checks(name, day)
+            if checks is not None:
+                count = checks[0] + 1
+            else:
+                # 已有存档但没有标记说明已确认为空
+                count = POOL_ARCHIVE_EMPTY_CHECKS if self.has(name, day) else 1
+            if count < POOL_ARCHIVE_EMPTY_CHECKS:
+                # 先写标记再写存档，中途退出时不会留下没有标记的空存档
+                os.makedirs(os.path.dirname(marker), exist_ok=True)
+                with open(marker, 'w', encoding='utf-8') as f:
+                    f.write(str(count))
+                self.write(name, day, df)
+                return df
+        self.write(name, day, df)
+        if os.path.exists(marker):
+            os.remove(marker)
+        return df
+
+    def backfill(self, start_date, end_date, names=None):
+        """
+        补齐 [start_date, end_date] 内已收盘交易日中缺失的存档，返回 {'added': 数量, 'errors': {...}}
+        最近失败过的 (股票池, 交易日) 在 POOL_ARCHIVE_RETRY 秒内不再重试
+        """
+        end_date = min(end_date, trade_calendar.last_closed_day())
+        now = time.monotonic()
+        missing = [
+            (name, day)
+            for day in trade_calendar.trading_days_between(start_date, end_date)
+            for name in (names or ARCHIVED_POOLS)
+            if self.needs_fetch(name, day) and now - self._failed.get((name, day), -POOL_ARCHIVE_RETRY) >= POOL_ARCHIVE_RETRY
+        ]
+        added, errors = 0, {}
+        for (name, day), _, error in imap_unordered(
+            lambda key: self.fetch(*key), missing, POOL_ARCHIVE_CONCURRENCY, background_executor
+        ):
+            if error is not None:
+                self._failed[(name, day)] = time.monotonic()
+                errors[f'{name}:{day}'] = str(error)
+            else:
+                self._failed.pop((name, day), None)
+                added += 1
+        return {'added': added, 'errors': errors}
+
+    def table(self, name):
+        """
+        股票池全部存档的合并表；目录有变化（新增交易日，包括其他进程写入的）时重建
+        """
+        try:
+            key = os.stat(os.path.join(self.root, name)).st_mtime_ns
+        except OSError:
+            key = None
+        cached = self._tables.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with self._lock:
+            cached = self._tables.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            table = PoolTable([(day, self.read(name, day)) for day in self.days(name)])
+            self._tables[name] = (key, table)
+        return table
+
+    def stats(self):
+        result = {}
+        for name in ARCHIVED_POOLS:
+            days = self.days(name)
+            result[name] = {
+                'days': len(days),
+                'first': days[0] if days else None,
+                'last': days[-1] if days else None,
+            }
+        return result
+
+
+class PoolArchiver:
+    """
+    后台存档：启动后回补最近 days 个交易日（或从 start 开始），之后每 interval 秒检查一次，
+    收盘数据落定后追加当天
+
+    多进程部署时通过文件锁保证只有一个进程在拉取
+    """
+
+    def __init__(self, archive, days=POOL_ARCHIVE_DAYS, start=POOL_ARCHIVE_START, interval=POOL_ARCHIVE_INTERVAL):
+        self.archive = archive
+        self.days = days
+        self.start_date = start
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock_file = None
+        self.last_run = None
+
+    def _acquire(self):
+        if fcntl is None:
+            return True
+        os.makedirs(self.archive.root, exist_ok=True)
+        self._lock_file = open(os.path.join(self.archive.root, '.archiver.lock'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def start(self):
+        if (self.days <= 0 and not self.start_date) or self._thread is not None or not self._acquire():
+            return
+        self._thread = threading.Thread(target=self._run, name='pool-archiver', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def date_range(self):
+        end = trade_calendar.last_closed_day()
+        if self.start_date:
+            return self.start_date, end
+        start = end
+        for _ in range(max(self.days, 1) - 1):
+            start = trade_calendar.previous_trading_day(start)
+        return start, end
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_run = self.archive.backfill(*self.date_range())
+            except Exception as e:
+                print(f"股票池存档失败: {e}")
+            self._stop.wait(self.interval)
+
+
+pool_archive = PoolArchive()
+pool_archiver = PoolArchiver(pool_archive)
@@ -0,0 +1,257 @@
+"""
+股票池查询：涨停 / 强势 / 跌停股票池的按列只读视图，在服务端完成筛选、排序、分页与列裁剪
+
+视图在股票池数据加载后构建一次并缓存：每列只格式化一次，数值列预先转换为 float64，
+每列的排序名次与排序结果按需计算后保存，所属行业建立 行业 → 行号 索引
+"""
+import os
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from formatting import CODE_COLUMNS, format_columns
+from metrics import timed, timed_stage
+
+INDUSTRY_COLUMN = '所属行业'
+
+# 分页时单页最多的行数
+POOL_MAX_PAGE_SIZE = int(os.environ.get('POOL_MAX_PAGE_SIZE', 500))
+
+# 筛选条件：列名 运算符 值，多个候选值用 | 分隔
+_CONDITION = re.compile(r'^(?P<column>.+?)(?P<op>!\^=|\^=|>=|<=|!=|=|>|<)(?P<value>.*)$')
+
+_COMPARE = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+
+def _split(expr):
+    return [part.strip() for part in (expr or '').split(',') if part.strip()]
+
+
+def parse_filter(expr):
+    """
+    解析筛选表达式，如 "所属行业=半导体|光伏设备,连板数>=2,封板资金>=1e8,代码!^=30"
+    返回 [(列名, 运算符, 值), ...]
+    """
+    conditions = []
+    for part in _split(expr):
+        match = _CONDITION.match(part)
+        if match is None:
+            raise ValueError(f'无效的筛选条件: {part}')
+        conditions.append((match['column'].strip(), match['op'], match['value'].strip()))
+    return conditions
+
+
+def parse_sort(expr):
+    """
+    解析排序表达式，如 "-连板数,封板资金"（- 表示降序）
+    返回 [(列名, 是否降序), ...]
+    """
+    keys = []
+    for part in _split(expr):
+        descending = part.startswith('-')
+        keys.append((part[1:].strip() if descending else part, descending))
+    return keys
+
+
+def parse_fields(expr):
+    """
+    解析返回字段列表，如 "代码,名称,连板数"；为空时返回 None（全部字段）
+    """
+    return list(dict.fromkeys(_split(expr))) or None
+
+
+def _numeric_column(series):
+    """
+    可以整列转换为浮点数的列返回 float64 数组，否则返回 None
+    """
+    if series.name in CODE_COLUMNS:
+        return None
+    kind = series.dtype.kind
+    if kind in 'iufb':
+        return series.to_numpy().astype(np.float64)
+    if kind == 'O':
+        try:
+            return series.to_numpy().astype(np.float64)
+        except (ValueError, TypeError):
+            return None
+    return None
+
+
+def _is_missing(value):
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+
+class PoolView:
+    """
+    一个股票池的只读列式视图
+
+    values: 列名 → 格式化后的值（object 数组，响应直接使用）
+    numeric: 数值列 → float64 数组（筛选、排序使用）
+    text: 非数值列 → 字符串数组（缺失值为空字符串）
+    loaded_at: 视图构建（即数据加载）的时间，响应的 timestamp 使用它，数据不变时响应体不变
+    """
+
+    @timed_stage('pool_view')
+    def __init__(self, df, decimals=3):
+        self.columns = list(df.columns)
+        self.size = len(df)
+        self.loaded_at = datetime.now()
+        self.values = {}
+        self.numeric = {}
+        self.text = {}
+        for i, (col, formatted) in enumerate(zip(self.columns, format_columns(df, decimals))):
+            values = np.empty(self.size, dtype=object)
+            values[:] = formatted
+            self.values[col] = values
+            numbers = _numeric_column(df.iloc[:, i])
+            if numbers is not None:
+                self.numeric[col] = numbers
+            else:
+                self.text[col] = np.array(['' if _is_missing(v) else str(v) for v in formatted], dtype=object)
+
+        self.industries = {}
+        if INDUSTRY_COLUMN in self.text:
+            self.industries = {
+                name: np.asarray(rows) for name, rows in df.groupby(INDUSTRY_COLUMN, sort=False).indices.items()
+            }
+
+        self._ranks = {}
+        self._orders = {}
+        self._lock = threading.Lock()
+        self.nbytes = 2 * int(df.memory_usage(index=True, deep=True).sum()) + sum(
+            a.nbytes for a in self.numeric.values()
+        )
+
+    def __len__(self):
+        return self.size
+
+    def _check_column(self, col):
+        if col not in self.values:
+            raise ValueError(f'未知字段: {col}')
+
+    def _rank(self, col):
+        """
+        列的稠密排序名次（相同值名次相同）与缺失值的名次（排在最后），首次使用时计算并保存
+        """
+        cached = self._ranks.get(col)
+        if cached is not None:
+            return cached
+        if col in self.numeric:
+            values = self.numeric[col]
+            missing = np.isnan(values)
+        else:
+            values = self.text[col]
+            missing = values == ''
+        uniques, inverse = np.unique(values[~missing], return_inverse=True)
+        rank = np.full(self.size, len(uniques), dtype=np.int64)
+        rank[~missing] = inverse
+        cached = (rank, len(uniques))
+        with self._lock:
+            self._ranks[col] = cached
+        return cached
+
+    def _sort_key(self, col, descending):
+        rank, missing_rank = self._rank(col)
+        if not descending:
+            return rank
+        # 降序时缺失值仍然排在最后
+        return np.where(rank == missing_rank, missing_rank, missing_rank - 1 - rank)
+
+    def _order(self, col, descending):
+        """
+        按单列排序后的全部行号（稳定排序），首次使用时计算并保存
+        """
+        key = (col, descending)
+        order = self._orders.get(key)
+        if order is None:
+            order = np.argsort(self._sort_key(col, descending), kind='stable')
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+    def _condition_mask(self, col, op, raw):
+        self._check_column(col)
+        options = raw.split('|')
+        if op in ('^=', '!^='):
+            if col not in self.text:
+                raise ValueError(f'字段 {col} 为数值，不支持前缀匹配')
+            prefixes = tuple(options)
+            mask = np.fromiter((s.startswith(prefixes) for s in self.text[col]), dtype=bool, count=self.size)
+            return ~mask if op == '!^=' else mask
+        if op in ('=', '!='):
+            if col == INDUSTRY_COLUMN and self.industries:
+                mask = np.zeros(self.size, dtype=bool)
+                for name in options:
+                    rows = self.industries.get(name)
+                    if rows is not None:
+                        mask[rows] = True
+            elif col in self.numeric:
+                mask = np.isin(self.numeric[col], [self._number(col, v) for v in options])
+            else:
+                mask = np.isin(self.text[col], options)
+            return ~mask if op == '!=' else mask
+        if col not in self.numeric:
+            raise ValueError(f'字段 {col} 不是数值，不支持 {op}')
+        with np.errstate(invalid='ignore'):
+            return _COMPARE[op](self.numeric[col], self._number(col, raw))
+
+    @staticmethod
+    def _number(col, raw):
+        try:
+            return float(raw)
+        except ValueError:
+            raise ValueError(f'字段 {col} 的筛选值不是数值: {raw}') from None
+
+    def select(self, filters=()):
+        """
+        返回满足全部筛选条件的行掩码，没有条件时返回 None
+        """
+        mask = None
+        for col, op, raw in filters:
+            condition = self._condition_mask(col, op, raw)
+            mask = condition if mask is None else mask & condition
+        return mask
+
+    def query(self, filters=(), sort=(), fields=None, page=1, page_size=None, columnar=False):
+        """
+        筛选 → 排序 → 分页 → 列裁剪，返回 (满足条件的总行数, 当前页记录列表)
+        page_size 为 None 时返回全部行；columnar=True 时当前页为 {columns, arrays}
+        """
+        with timed('pool_query'):
+            return self._query(filters, sort, fields, page, page_size, columnar)
+
+    def _query(self, filters, sort, fields, page, page_size, columnar):
+        fields = fields or self.columns
+        for col in fields:
+            self._check_column(col)
+        for col, _ in sort:
+            self._check_column(col)
+
+        mask = self.select(filters)
+        if len(sort) == 1:
+            # 单列排序直接使用缓存的全表排序结果，按掩码过滤即可
+            rows = self._order(*sort[0])
+            if mask is not None:
+                rows = rows[mask[rows]]
+        else:
+            rows = np.arange(self.size) if mask is None else np.flatnonzero(mask)
+            if sort:
+                keys = [self._sort_key(col, descending)[rows] for col, descending in reversed(sort)]
+                rows = rows[np.lexsort(keys)]
+
+        total = len(rows)
+        if page_size is not None:
+            start = (page - 1) * page_size
+            rows = rows[start:start + page_size]
+
+        columns = [self.values[col][rows].tolist() for col in fields]
+        if columnar:
+            return total, {'columns': list(fields), 'arrays': columns}
+        return total, [dict(zip(fields, row)) for row in zip(*columns)]
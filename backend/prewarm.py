@@ -0,0 +1,261 @@
+"""
+缓存预热：进程启动后以及每个交易日开盘前、收盘后，提前加载最近交易日的股票池、
+全市场行情快照及其统计、访问最多的股票的历史K线，使重启后的第一批请求与平时一样快
+
+访问最多的股票由历史行情类接口的请求记录统计（按天衰减），多个 worker 进程的计数
+合并保存在 data/popular_history.json，重启后仍然有效
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from config import DATA_DIR
+from history_store import history_store
+from industry_map import industry_map
+from market_analytics import market_analytics
+from market_data import POOL_FETCHERS, background_executor, fetch_pool_view, imap_unordered
+from spot_snapshot import market_snapshot
+from stock_search import stock_index
+from trade_calendar import trade_calendar
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+POPULAR_FILE = os.path.join(DATA_DIR, 'popular_history.json')
+
+# 是否启用预热（启动时一次 + 交易日定时）
+PREWARM_ENABLED = os.environ.get('PREWARM_ENABLED', '1') not in ('0', 'false', 'False', '')
+# 交易日的预热时刻（HH:MM，逗号分隔）：开盘前一次；收盘数据落定（15:30）之后一次
+PREWARM_TIMES = [t.strip() for t in os.environ.get('PREWARM_TIMES', '09:00,15:35').split(',') if t.strip()]
+# 总是预热日线（不复权）的股票代码，逗号分隔；请求统计为空时（如新部署的实例）也有预热对象
+PREWARM_CODES = [c.strip() for c in os.environ.get('PREWARM_CODES', '').split(',') if c.strip()]
+# 按请求统计预热历史K线的股票（代码 + 周期 + 复权方式）数量与并发数
+PREWARM_TOP_N = int(os.environ.get('PREWARM_TOP_N', 50))
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', 4))
+# 等待行情快照、行业分类首次加载的最长秒数
+PREWARM_SNAPSHOT_TIMEOUT = float(os.environ.get('PREWARM_SNAPSHOT_TIMEOUT', 60))
+# 请求计数每天的衰减系数，以及写入文件的间隔（秒）
+POPULAR_DECAY = float(os.environ.get('POPULAR_DECAY', 0.8))
+POPULAR_FLUSH_INTERVAL = float(os.environ.get('POPULAR_FLUSH_INTERVAL', 60))
+
+
+class RequestStats:
+    """
+    历史行情请求计数：(代码, 周期, 复权方式) → 衰减后的请求次数
+
+    请求线程只累加进程内的增量；flush 时在文件锁内与文件中的计数合并，
+    多个 worker 进程的统计汇总到同一个文件
+    """
+
+    def __init__(self, path=POPULAR_FILE, decay=POPULAR_DECAY):
+        self.path = path
+        self.decay = decay
+        self._pending = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @staticmethod
+    def _key(stock_code, period, adjust):
+        return f'{stock_code}:{period}:{adjust}'
+
+    def record(self, stock_code, period='daily', adjust=''):
+        key = self._key(stock_code, period, adjust)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['counts'], data['updated']
+        except (OSError, ValueError, KeyError):
+            return {}, None
+
+    def _decayed(self, counts, updated, today):
+        if not updated or updated >= today:
+            return counts
+        days = (datetime.strptime(today, '%Y%m%d') - datetime.strptime(updated, '%Y%m%d')).days
+        factor = self.decay ** days
+        # 衰减到很小的计数直接丢弃，文件不会无限增长
+        return {key: count * factor for key, count in counts.items() if count * factor >= 0.01}
+
+    def flush(self):
+        """
+        将进程内的增量合并进文件（按天衰减旧计数），返回合并后的计数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        today = datetime.now().strftime('%Y%m%d')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            counts, updated = self._read_file()
+            counts = self._decayed(counts, updated, today)
+            for key, count in pending.items():
+                counts[key] = counts.get(key, 0) + count
+            if pending or updated != today:
+                tmp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'updated': today, 'counts': counts}, f)
+                os.replace(tmp_path, self.path)
+        self._counts = counts
+        self._loaded = True
+        return counts
+
+    def top(self, n):
+        """
+        请求次数最多的 n 个 (代码, 周期, 复权方式)
+        """
+        if not self._loaded:
+            counts, updated = self._read_file()
+            self._counts = self._decayed(counts, updated, datetime.now().strftime('%Y%m%d'))
+            self._loaded = True
+        counts = dict(self._counts)
+        with self._lock:
+            for key, count in self._pending.items():
+                counts[key] = counts.get(key, 0) + count
+        ranked = sorted(counts.items(), key=lambda item: -item[1])[:n]
+        return [tuple(key.split(':', 2)) for key, _ in ranked]
+
+
+class Prewarmer:
+    """
+    预热任务：启动时运行一次，之后每个交易日在 PREWARM_TIMES 各运行一次
+
+    股票池和行情统计在每个 worker 进程的内存中，每个进程各自预热；历史K线落盘共享，
+    多进程部署时通过文件锁只由一个进程预热
+    """
+
+    def __init__(self, requests, times=PREWARM_TIMES, top_n=PREWARM_TOP_N, codes=None):
+        self.requests = requests
+        self.codes = PREWARM_CODES if codes is None else codes
+        self.times = sorted(times)
+        self.top_n = top_n
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock_file = None
+        self._done = set()
+        self.last_run = None
+
+    def _acquire(self):
+        if self._lock_file is not None or fcntl is None:
+            return True
+        os.makedirs(DATA_DIR, exist_ok=True)
+        lock_file = open(os.path.join(DATA_DIR, '.prewarm.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        if not PREWARM_ENABLED or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='prewarm', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _warm_pools(self):
+        day = trade_calendar.resolve_pool_date()
+        errors = {}
+        for name, _, error in imap_unordered(
+            lambda name: fetch_pool_view(name, day), POOL_FETCHERS, len(POOL_FETCHERS), background_executor
+        ):
+            if error is not None:
+                errors[name] = str(error)
+        return {'date': day, 'errors': errors}
+
+    def _warm_market(self):
+        # 快照由 market_snapshot 的后台线程加载，这里只等待它就绪，再构建当前版本的统计
+        if not market_snapshot.ready:
+            market_snapshot.wait_for_update(0, PREWARM_SNAPSHOT_TIMEOUT)
+        industry_map.wait_ready(PREWARM_SNAPSHOT_TIMEOUT)
+        analytics = market_analytics.current
+        if analytics is None:
+            return {'ready': False}
+        analytics.market()
+        analytics.industries()
+        # 股票搜索索引每天从快照构建一次（计算拼音首字母较慢），不留给第一次搜索
+        stock_index.current
+        return {'ready': True, 'version': analytics.snapshot.version}
+
+    def _warm_history(self):
+        if not self._acquire():
+            return {'skipped': True}
+        series = list(dict.fromkeys([(code, 'daily', '') for code in self.codes] + self.requests.top(self.top_n)))
+        errors = {}
+        for key, _, error in imap_unordered(
+            lambda key: history_store.sync(*key), series, PREWARM_CONCURRENCY, background_executor
+        ):
+            if error is not None:
+                errors[':'.join(key)] = str(error)
+        return {'count': len(series), 'errors': errors}
+
+    def warm(self):
+        """
+        运行一次全部预热任务，单项失败不影响其他项，返回各项结果
+        """
+        started = time.monotonic()
+        result = {'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        for name, job in (('pools', self._warm_pools), ('market', self._warm_market), ('history', self._warm_history)):
+            try:
+                result[name] = job()
+            except Exception as e:
+                result[name] = {'error': str(e)}
+                print(f"缓存预热失败 {name}: {e}")
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        self.last_run = result
+        return result
+
+    def due(self, now=None):
+        """
+        今天已到时间且尚未运行的预热时刻（非交易日没有）
+        """
+        now = now or datetime.now()
+        today = now.strftime('%Y%m%d')
+        if not trade_calendar.is_trading_day(today):
+            return []
+        current = now.strftime('%H:%M')
+        return [t for t in self.times if t <= current and (today, t) not in self._done]
+
+    def _run(self):
+        # 启动之前已经过去的时刻不再补跑，启动时的预热已经覆盖
+        now = datetime.now()
+        self._done.update((now.strftime('%Y%m%d'), t) for t in self.due(now))
+        self.warm()
+        last_flush = time.monotonic()
+        while not self._stop.wait(min(POPULAR_FLUSH_INTERVAL, 30)):
+            try:
+                now = datetime.now()
+                due = self.due(now)
+                if due:
+                    self._done.update((now.strftime('%Y%m%d'), t) for t in due)
+                    self.warm()
+                if time.monotonic() - last_flush >= POPULAR_FLUSH_INTERVAL:
+                    self.requests.flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                print(f"缓存预热失败: {e}")
+
+    def stats(self):
+        return {
+            'enabled': PREWARM_ENABLED,
+            'times': self.times,
+            'codes': self.codes,
+            'last_run': self.last_run,
+            'popular': [':'.join(key) for key in self.requests.top(self.top_n)],
+        }
+
+
+request_stats = RequestStats()
+prewarmer = Prewarmer(request_stats)
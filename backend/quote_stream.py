@@ -0,0 +1,174 @@
+"""
+行情推送：多个客户端订阅同一份全市场快照，只推送变化的字段
+
+每次快照更新时，扇出线程对所有被订阅的代码（去重后）各计算一次增量，
+再分发给订阅了这些代码的客户端；上游开销只与快照刷新有关，与客户端数量无关
+"""
+import os
+import threading
+
+from formatting import format_dict_values
+from spot_snapshot import market_snapshot
+
+# 单个订阅最多的代码数
+STREAM_MAX_CODES = int(os.environ.get('STREAM_MAX_CODES', 50))
+# 没有数据变化时发送心跳的间隔（秒），避免代理断开空闲连接
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15))
+# 每个进程最多的推送连接数：gthread worker 中每个连接占用一个请求线程，
+# 默认为请求线程数减去留给普通请求的 STREAM_RESERVED_THREADS 个（gunicorn.conf.py 中按同样方式设置）
+STREAM_MAX_SUBSCRIBERS = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', max(
+    int(os.environ.get('GUNICORN_THREADS', 32)) - int(os.environ.get('STREAM_RESERVED_THREADS', 8)), 1
+)))
+
+
+def _same(a, b):
+    # NaN（停牌、缺失字段）与 NaN 视为未变化
+    return a == b or (a != a and b != b)
+
+
+class Subscription:
+    """
+    一个客户端的订阅
+
+    待发送的增量按代码合并（后到的字段覆盖先到的），客户端读取慢时不会无限积压
+    """
+
+    def __init__(self, codes):
+        self.codes = frozenset(codes)
+        self.closed = False
+        self._pending = {}
+        self._version = 0
+        self._cond = threading.Condition()
+
+    def push(self, changes, version):
+        with self._cond:
+            for code, fields in changes.items():
+                self._pending.setdefault(code, {}).update(fields)
+            self._version = version
+            self._cond.notify()
+
+    def take(self, timeout):
+        """
+        取出合并后的增量，超时没有数据时返回 (None, 版本号)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self.closed, timeout)
+            if not self._pending:
+                return None, self._version
+            pending, self._pending = self._pending, {}
+            return pending, self._version
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class QuoteHub:
+    """
+    进程内唯一的扇出中心：一个后台线程等待快照更新并向所有订阅分发增量
+    """
+
+    def __init__(self, snapshot_source=None, max_subscribers=STREAM_MAX_SUBSCRIBERS):
+        self._source = snapshot_source or market_snapshot
+        self.max_subscribers = max_subscribers
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._last = {}  # 代码 → 上次推送时的格式化行
+        self._version = 0
+        self._thread = None
+
+    def subscribe(self, codes):
+        """
+        订阅一组代码，返回 (订阅, 当前完整行情, 快照中不存在的代码)；
+        本进程的订阅数已达上限时返回 None
+        """
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+        sub = Subscription(codes)
+        snapshot = self._source.current
+        rows, missing = {}, []
+        for code in sub.codes:
+            row = snapshot.get_row(code) if snapshot is not None else None
+            if row is None:
+                missing.append(code)
+            else:
+                rows[code] = format_dict_values(row)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+            self._subscriptions.add(sub)
+            for code, row in rows.items():
+                self._last.setdefault(code, row)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='quote-hub', daemon=True)
+                self._thread.start()
+        return sub, rows, sorted(missing)
+
+    def unsubscribe(self, sub):
+        sub.close()
+        with self._lock:
+            self._subscriptions.discard(sub)
+            watched = set().union(*(s.codes for s in self._subscriptions)) if self._subscriptions else set()
+            for code in list(self._last):
+                if code not in watched:
+                    del self._last[code]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscriptions),
+                'max_subscribers': self.max_subscribers,
+                'codes': len(self._last),
+                'version': self._version,
+            }
+
+    def _diff(self, snapshot, codes):
+        """
+        对每个被订阅的代码计算一次增量
+        """
+        changes = {}
+        for code in codes:
+            row = snapshot.get_row(code)
+            if row is None:
+                continue
+            row = format_dict_values(row)
+            previous = self._last.get(code)
+            if previous is None:
+                delta = row
+            else:
+                delta = {k: v for k, v in row.items() if k not in previous or not _same(previous[k], v)}
+            if delta:
+                changes[code] = delta
+            self._last[code] = row
+        return changes
+
+    def publish(self, snapshot):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            codes = set().union(*(s.codes for s in subscriptions)) if subscriptions else set()
+            changes = self._diff(snapshot, codes)
+            self._version = snapshot.version
+        if not changes:
+            return changes
+        for sub in subscriptions:
+            mine = {code: changes[code] for code in sub.codes if code in changes}
+            if mine:
+                sub.push(mine, snapshot.version)
+        return changes
+
+    def _run(self):
+        version = self._source.current.version if self._source.current is not None else 0
+        while True:
+            snapshot = self._source.wait_for_update(version, timeout=STREAM_HEARTBEAT)
+            if snapshot is None or snapshot.version <= version:
+                continue
+            version = snapshot.version
+            try:
+                self.publish(snapshot)
+            except Exception as e:
+                print(f"行情推送失败: {e}")
+
+
+quote_hub = QuoteHub()
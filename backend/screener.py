@@ -0,0 +1,544 @@
+"""
+选股：在全市场行情快照上按条件表达式筛选，如
+    涨跌幅 > 5 and 换手率 between 3 and 15 and 所属行业 in [半导体, 光伏设备]
+
+表达式只解析一次，编译成在列数组上计算布尔掩码的函数，按规范化后的表达式文本缓存
+（空白、关键字大小写、全角符号、括号与 in 列表的顺序不影响缓存键）；同一快照版本上
+同一表达式的掩码也只计算一次，之后的请求只做排序与分页。筛选全部在内存中的快照上完成，
+不请求上游。
+
+可选的指标条件只对通过行情条件的股票计算，读取本地历史存储中最近一根已收盘K线的
+指标值，本地没有历史数据的股票不满足指标条件
+"""
+import operator
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from formatting import format_columns, round_array
+from indicators import indicator_engine
+from market_analytics import DEFAULT_FIELDS
+from metrics import timed_stage
+from pool_query import INDUSTRY_COLUMN
+
+# 缓存的已编译表达式数量（按最近使用淘汰）
+SCREENER_CACHE_SIZE = int(os.environ.get('SCREENER_CACHE_SIZE', 256))
+# 表达式的最大长度
+SCREENER_MAX_LENGTH = int(os.environ.get('SCREENER_MAX_LENGTH', 2000))
+# 指标条件最多计算的股票数（通过行情条件的股票超过该数量时需要先缩小范围）
+SCREENER_INDICATOR_MAX_CODES = int(os.environ.get('SCREENER_INDICATOR_MAX_CODES', 500))
+
+# 括号的最大嵌套层数
+_MAX_DEPTH = 32
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?!\w)
+  | (?P<string>'[^']*'|"[^"]*")
+  | (?P<op>>=|<=|!=|==|=|>|<)
+  | (?P<punct>[()\[\],])
+  | (?P<word>\w+(?:-\w+)*)
+)''', re.VERBOSE)
+
+_KEYWORDS = ('and', 'or', 'not', 'in', 'between', 'startswith', 'contains')
+
+_COMPARE = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': operator.eq,
+    '!=': operator.ne,
+}
+
+# 取反后的比较运算符；缺失值（NaN）对任何比较都不成立，取反时同样不成立
+_NEGATED = {'>': '<=', '>=': '<', '<': '>=', '<=': '>', '=': '!=', '!=': '='}
+
+
+def _tokenize(text):
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f'表达式第 {pos + 1} 个字符无法识别: {text[pos:pos + 10]}')
+        kind = match.lastgroup
+        value = match[kind]
+        if kind == 'word' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        elif kind == 'op' and value == '==':
+            value = '='
+        elif kind == 'string':
+            value = value[1:-1]
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    递归下降解析，语法树为元组：
+        ('or', [子句...]) / ('and', [子句...]) / ('not', 子句)
+        ('cmp', 字段, 运算符, 操作数)        操作数: ('field', 名称) / ('number', 文本) / ('string', 文本)
+        ('between', 字段, 下限, 上限, 是否取反)
+        ('in' / 'startswith' / 'contains', 字段, (字面量...), 是否取反)
+    """
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or {'word': '字段名', 'number': '数值'}.get(kind, kind or '表达式')
+            found = token[1] if token[0] is not None else '表达式结尾'
+            raise ValueError(f'表达式语法错误：此处应为 {expected}，实际为 {found}')
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError('表达式为空')
+        node = self.or_expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f'表达式语法错误：多余的 {self.peek()[1]}')
+        return node
+
+    def or_expr(self):
+        parts = [self.and_expr()]
+        while self.accept('keyword', 'or'):
+            parts.append(self.and_expr())
+        return parts[0] if len(parts) == 1 else ('or', parts)
+
+    def and_expr(self):
+        parts = [self.not_expr()]
+        while self.accept('keyword', 'and'):
+            parts.append(self.not_expr())
+        return parts[0] if len(parts) == 1 else ('and', parts)
+
+    def not_expr(self):
+        if self.accept('keyword', 'not'):
+            return ('not', self.not_expr())
+        if self.accept('punct', '('):
+            self.depth += 1
+            if self.depth > _MAX_DEPTH:
+                raise ValueError(f'括号嵌套超过 {_MAX_DEPTH} 层')
+            node = self.or_expr()
+            self.take('punct', ')')
+            self.depth -= 1
+            return node
+        return self.condition()
+
+    def literal(self):
+        kind, value = self.peek()
+        if kind not in ('number', 'string', 'word'):
+            self.take('number')
+        self.pos += 1
+        return ('number' if kind == 'number' else 'string', value)
+
+    def literals(self):
+        if not self.accept('punct', '['):
+            return (self.literal(),)
+        values = [self.literal()]
+        while self.accept('punct', ','):
+            values.append(self.literal())
+        self.take('punct', ']')
+        # 列表是集合：去重并排序，顺序不同的写法共用同一个缓存键
+        return tuple(sorted(set(values)))
+
+    def condition(self):
+        _, field = self.take('word')
+        negate = self.accept('keyword', 'not')
+        kind, value = self.peek()
+        if kind == 'keyword' and value == 'between':
+            self.pos += 1
+            low = self.take('number')[1]
+            self.take('keyword', 'and')
+            return ('between', field, low, self.take('number')[1], negate)
+        if kind == 'keyword' and value in ('in', 'startswith', 'contains'):
+            self.pos += 1
+            return (value, field, self.literals(), negate)
+        if negate:
+            raise ValueError(f'表达式语法错误：not 之后应为 between / in / startswith / contains，实际为 {value}')
+        _, op = self.take('op')
+        kind, value = self.peek()
+        if kind == 'word':
+            operand = ('field', value)
+        elif kind in ('number', 'string'):
+            operand = (kind, value)
+        else:
+            self.take('number')
+        self.pos += 1
+        return ('cmp', field, op, operand)
+
+
+def _render_literal(literal):
+    kind, value = literal
+    if kind == 'number':
+        return value
+    return f'"{value}"' if "'" in value else f"'{value}'"
+
+
+def render(node, parent=None):
+    """
+    语法树 → 规范化的表达式文本（缓存键）
+    """
+    kind = node[0]
+    if kind in ('or', 'and'):
+        text = f' {kind} '.join(render(child, kind) for child in node[1])
+        # and 中的 or 子句、not 之后的复合子句需要括号
+        return f'({text})' if parent == 'not' or (parent == 'and' and kind == 'or') else text
+    if kind == 'not':
+        return f'not {render(node[1], "not")}'
+    if kind == 'cmp':
+        _, field, op, operand = node
+        return f'{field} {op} {operand[1] if operand[0] == "field" else _render_literal(operand)}'
+    negate = 'not ' if node[-1] else ''
+    if kind == 'between':
+        return f'{node[1]} {negate}between {node[2]} and {node[3]}'
+    values = ', '.join(_render_literal(v) for v in node[2])
+    return f'{node[1]} {negate}{kind} {values if len(node[2]) == 1 else f"[{values}]"}'
+
+
+def _fields(node):
+    kind = node[0]
+    if kind in ('or', 'and'):
+        return [field for child in node[1] for field in _fields(child)]
+    if kind == 'not':
+        return _fields(node[1])
+    if kind == 'cmp' and node[3][0] == 'field':
+        return [node[1], node[3][1]]
+    return [node[1]]
+
+
+def _column(source, field):
+    """
+    字段的数值数组，非数值字段返回字符串数组（未知字段抛出 ValueError）
+    """
+    try:
+        return source.numeric(field)
+    except ValueError:
+        return source.text(field)
+
+
+def _number(field, text):
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f'字段 {field} 的比较值不是数值: {text}') from None
+
+
+def _literal_values(field, values, literals):
+    if values.dtype.kind == 'f':
+        return [_number(field, value) for _, value in literals]
+    return [value for _, value in literals]
+
+
+def _compile(node, negate=False):
+    """
+    语法树 → 函数 source → 布尔掩码；source 提供 numeric(col) / text(col) 与 len()
+
+    not 在编译时按德摩根定律下推到比较条件上（and / or 互换、比较运算符取反），
+    不对掩码直接取反，缺失值在 not 之后仍然不满足条件
+    """
+    kind = node[0]
+    if kind in ('or', 'and'):
+        parts = [_compile(child, negate) for child in node[1]]
+        combine = np.logical_or if (kind == 'or') != negate else np.logical_and
+
+        def evaluate(source):
+            mask = parts[0](source)
+            for part in parts[1:]:
+                mask = combine(mask, part(source))
+            return mask
+        return evaluate
+    if kind == 'not':
+        return _compile(node[1], not negate)
+    if kind == 'cmp':
+        _, field, op, operand = node
+        return _compile_compare(field, _NEGATED[op] if negate else op, operand)
+    negate = negate != node[-1]
+    if kind == 'between':
+        _, field, low, high, _ = node
+        low, high = _number(field, low), _number(field, high)
+
+        def evaluate(source):
+            values = source.numeric(field)
+            with np.errstate(invalid='ignore'):
+                if negate:
+                    return (values < low) | (values > high)
+                return (values >= low) & (values <= high)
+        return evaluate
+    _, field, literals, _ = node
+    if kind == 'in':
+        def evaluate(source):
+            values = _column(source, field)
+            mask = np.isin(values, _literal_values(field, values, literals))
+            if not negate:
+                return mask
+            mask = ~mask
+            if values.dtype.kind == 'f':
+                mask &= ~np.isnan(values)
+            return mask
+        return evaluate
+    patterns = [value for _, value in literals]
+
+    def evaluate(source):
+        values = _column(source, field)
+        if values.dtype.kind == 'f':
+            raise ValueError(f'字段 {field} 为数值，不支持 {kind}')
+        if kind == 'startswith':
+            mask = np.zeros(len(values), dtype=bool)
+            for pattern in patterns:
+                mask |= np.char.startswith(values, pattern)
+        else:
+            mask = np.zeros(len(values), dtype=bool)
+            for pattern in patterns:
+                mask |= np.char.find(values, pattern) >= 0
+        return ~mask if negate else mask
+    return evaluate
+
+
+def _compile_compare(field, op, operand):
+    compare = _COMPARE[op]
+    ordered = op not in ('=', '!=')
+
+    def evaluate(source):
+        values = _column(source, field)
+        if operand[0] == 'field':
+            other = _column(source, operand[1])
+            if (values.dtype.kind == 'f') != (other.dtype.kind == 'f'):
+                raise ValueError(f'字段 {field} 与 {operand[1]} 的类型不同，不能比较')
+        elif values.dtype.kind == 'f':
+            other = _number(field, operand[1])
+        else:
+            other = operand[1]
+        if ordered and values.dtype.kind != 'f':
+            raise ValueError(f'字段 {field} 不是数值，不支持 {op}')
+        with np.errstate(invalid='ignore'):
+            mask = compare(values, other)
+        if op == '!=' and values.dtype.kind == 'f':
+            # 缺失值不满足任何比较条件（包括另一侧字段缺失）
+            mask &= ~np.isnan(values)
+            if operand[0] == 'field':
+                mask &= ~np.isnan(other)
+        return mask
+    return evaluate
+
+
+class Expression:
+    """
+    编译后的表达式：text 为规范化文本，fields 为引用的字段（按出现顺序），
+    evaluate(source) 返回布尔掩码
+    """
+
+    def __init__(self, text):
+        if len(text) > SCREENER_MAX_LENGTH:
+            raise ValueError(f'表达式长度超过 {SCREENER_MAX_LENGTH} 个字符')
+        tree = _Parser(unicodedata.normalize('NFKC', text)).parse()
+        self.text = render(tree)
+        self.fields = list(dict.fromkeys(_fields(tree)))
+        self.evaluate = _compile(tree)
+
+
+class _Frame:
+    """
+    行情快照的列，外加与快照行号对齐的指标列（只在候选行上有值，其余为 NaN）
+    """
+
+    def __init__(self, analytics, numeric=None, text=None, integer=()):
+        self.analytics = analytics
+        self.extra_numeric = numeric or {}
+        self.extra_text = text or {}
+        self.integer = set(integer)
+
+    def __len__(self):
+        return len(self.analytics.snapshot)
+
+    def numeric(self, col):
+        if col in self.extra_numeric:
+            return self.extra_numeric[col]
+        if col in self.extra_text:
+            raise ValueError(f'字段 {col} 不是数值')
+        return self.analytics.numeric(col)
+
+    def text(self, col):
+        if col in self.extra_text:
+            return self.extra_text[col]
+        return self.analytics.text(col)
+
+    def formatted(self, fields, rows):
+        """
+        各字段在 rows 上的格式化值列表：快照列与 format_columns 口径相同，
+        指标值保留3位小数、交叉信号为整数，缺失的指标值与文本为 None
+        """
+        columns = self.analytics.snapshot.columns
+        plain = [col for col in fields if col in columns]
+        frame = pd.DataFrame({col: columns[col][rows] for col in plain}, columns=plain)
+        result = dict(zip(plain, format_columns(frame)))
+        for col in fields:
+            if col in self.extra_numeric:
+                values = round_array(self.extra_numeric[col][rows], 3)
+                missing = np.isnan(values)
+                values = np.where(missing, 0, values).astype(np.int64 if col in self.integer else np.float64).astype(object)
+                values[missing] = None
+            elif col in self.extra_text or col == INDUSTRY_COLUMN:
+                values = self.text(col)[rows].astype(object)
+                values[values == ''] = None
+            elif col not in result:
+                raise ValueError(f'未知字段: {col}')
+            else:
+                continue
+            result[col] = values.tolist()
+        return [result[col] for col in fields]
+
+    def sort_key(self, col, rows, descending):
+        """
+        rows 上的排序键（缺失值总是排在最后）
+        """
+        values = _column(self, col)[rows]
+        if values.dtype.kind == 'f':
+            return -values if descending else values
+        missing = values == ''
+        uniques, rank = np.unique(values, return_inverse=True)
+        rank = rank.reshape(-1)
+        if descending:
+            rank = len(uniques) - 1 - rank
+        return np.where(missing, len(uniques), rank)
+
+
+class Screener:
+    """
+    表达式编译缓存与按快照版本缓存的筛选结果
+    """
+
+    def __init__(self, cache_size=SCREENER_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._compiled = OrderedDict()
+        self._aliases = OrderedDict()
+        self._masks = (None, {})
+        self._lock = threading.Lock()
+
+    def _remember(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def compile(self, text):
+        """
+        返回编译后的 Expression；原始文本与规范化文本都作为缓存键，
+        写法不同但规范化后相同的表达式共用一个编译结果
+        """
+        key = self._aliases.get(text)
+        expression = self._compiled.get(key) if key is not None else None
+        if expression is None:
+            expression = Expression(text)
+            expression = self._compiled.get(expression.text) or expression
+            self._remember(self._compiled, expression.text, expression)
+            self._remember(self._aliases, text, expression.text)
+        return expression
+
+    def mask(self, analytics, expression):
+        """
+        表达式在快照上的掩码，同一快照版本内只计算一次
+        """
+        owner, masks = self._masks
+        if owner is not analytics:
+            with self._lock:
+                if self._masks[0] is not analytics:
+                    self._masks = (analytics, {})
+                owner, masks = self._masks
+        mask = masks.get(expression.text)
+        if mask is None:
+            mask = np.asarray(expression.evaluate(_Frame(analytics)), dtype=bool)
+            masks[expression.text] = mask
+        return mask
+
+    @staticmethod
+    def _indicator_frame(analytics, rows, period, adjust, indicators, crosses):
+        """
+        候选行的指标值（本地历史存储，不请求上游），返回 (_Frame, 没有本地数据的股票数)
+        """
+        if len(rows) > SCREENER_INDICATOR_MAX_CODES:
+            raise ValueError(
+                f'满足行情条件的股票有 {len(rows)} 只，超过指标筛选上限 {SCREENER_INDICATOR_MAX_CODES}，请先缩小范围'
+            )
+        size = len(analytics.snapshot)
+        columns = [col for indicator in indicators for col in indicator.columns] + [c.column for c in crosses]
+        numeric = {col: np.full(size, np.nan) for col in columns}
+        dates = np.full(size, '', dtype=object)
+        missing = 0
+        codes = analytics.snapshot.codes
+        for i in rows.tolist():
+            latest = indicator_engine.latest(codes[i], period, adjust, indicators, crosses)
+            if latest is None:
+                missing += 1
+                continue
+            dates[i], values = latest
+            for col, value in values.items():
+                numeric[col][i] = value
+        frame = _Frame(analytics, numeric, {'K线日期': dates.astype(str)}, [c.column for c in crosses])
+        return frame, missing
+
+    @timed_stage('screener')
+    def screen(self, analytics, expr, sort=(), fields=None, page=1, page_size=None, columnar=False,
+               indicator_expr=None, indicators=(), crosses=(), period='daily', adjust=''):
+        """
+        筛选 → 指标条件（可选）→ 排序 → 分页 → 列裁剪，返回结果字典：
+        expr / indicator_expr（规范化文本）、count、data，使用指标条件时附带 indicator 统计
+        page_size 为 None 时返回全部行；columnar=True 时 data 为 {columns, arrays}
+        """
+        expression = self.compile(expr)
+        rows = np.flatnonzero(self.mask(analytics, expression))
+        frame = _Frame(analytics)
+        result = {'expr': expression.text}
+        default_fields = [col for col in DEFAULT_FIELDS if col in analytics.snapshot.columns] + expression.fields
+
+        if indicator_expr or indicators or crosses:
+            if not (indicators or crosses):
+                raise ValueError('指标条件需要同时指定 indicators')
+            frame, missing = self._indicator_frame(analytics, rows, period, adjust, indicators, crosses)
+            result['indicator'] = {'candidates': len(rows), 'missing': missing}
+            default_fields += ['K线日期'] + list(frame.extra_numeric)
+            if indicator_expr:
+                condition = self.compile(indicator_expr)
+                result['indicator_expr'] = condition.text
+                rows = rows[np.asarray(condition.evaluate(frame), dtype=bool)[rows]]
+
+        fields = fields or list(dict.fromkeys(default_fields))
+        if sort:
+            keys = [frame.sort_key(col, rows, descending) for col, descending in reversed(sort)]
+            rows = rows[np.lexsort(keys)]
+
+        total = len(rows)
+        if page_size is not None:
+            start = (page - 1) * page_size
+            rows = rows[start:start + page_size]
+        page_columns = frame.formatted(fields, rows)
+        result['count'] = total
+        if columnar:
+            result['data'] = {'columns': list(fields), 'arrays': page_columns}
+        else:
+            result['data'] = [dict(zip(fields, row)) for row in zip(*page_columns)]
+        return result
+
+
+screener = Screener()
@@ -0,0 +1,168 @@
+"""
+全市场实时行情快照：后台线程定时刷新，按列存储并建立 代码→行号 索引
+"""
+import os
+import threading
+from datetime import datetime, time as dt_time
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from trade_calendar import trade_calendar
+from upstream import upstream
+
+# 交易时段（含收盘后几分钟，保证拿到收盘数据）
+TRADING_SESSIONS = [
+    (dt_time(9, 15), dt_time(11, 32)),
+    (dt_time(13, 0), dt_time(15, 2)),
+]
+# 收盘后补一次刷新的时间点，之后快照冻结到下一个交易时段
+SESSION_CLOSE = dt_time(15, 2)
+
+
+def is_trading_time(now=None):
+    """
+    判断当前是否处于交易时段
+    """
+    now = now or datetime.now()
+    if not trade_calendar.is_trading_day(now.strftime('%Y%m%d')):
+        return False
+    current = now.time()
+    return any(start <= current <= end for start, end in TRADING_SESSIONS)
+
+
+def last_session_close(now=None):
+    """
+    返回不晚于 now 的最近一次收盘时刻，用于判断快照是否已包含收盘数据
+    """
+    now = now or datetime.now()
+    if now.time() >= SESSION_CLOSE and trade_calendar.is_trading_day(now.strftime('%Y%m%d')):
+        return datetime.combine(now.date(), SESSION_CLOSE)
+    return None
+
+
+class Snapshot:
+    """
+    一次刷新得到的不可变快照
+    columns: 列名 → numpy 数组；index: 股票代码 → 行号
+    """
+    __slots__ = ('columns', 'column_names', 'codes', 'index', 'updated_at', 'version')
+
+    def __init__(self, df, version):
+        self.column_names = list(df.columns)
+        self.columns = {col: df[col].to_numpy() for col in self.column_names}
+        self.codes = self.columns['代码'].astype(str)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.updated_at = datetime.now()
+        self.version = version
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get_row(self, code):
+        """
+        按代码 O(1) 读取一行，返回普通 dict；代码不存在时返回 None
+        """
+        i = self.index.get(code)
+        if i is None:
+            return None
+        return self.row_at(i)
+
+    def row_at(self, i, columns=None):
+        """
+        按行号读取一行（可只取部分列），返回普通 dict
+        """
+        row = {}
+        for col in columns or self.column_names:
+            value = self.columns[col][i]
+            row[col] = value.item() if isinstance(value, np.generic) else value
+        return row
+
+    def get_frame(self, code):
+        """
+        按代码读取一行，返回单行 DataFrame（用于导出）
+        """
+        i = self.index.get(code)
+        if i is None:
+            return None
+        return pd.DataFrame({col: self.columns[col][i:i + 1] for col in self.column_names})
+
+
+class MarketSnapshot:
+    """
+    进程内共享的全市场行情快照
+
+    后台线程在交易时段每 interval 秒刷新一次，收盘后补刷一次然后冻结；
+    请求只读取当前快照，不会自己触发全市场拉取
+    """
+
+    def __init__(self, loader=None, interval=None):
+        self._loader = loader or (lambda: upstream.call(ak.stock_zh_a_spot_em))
+        self.interval = interval or float(os.environ.get('SPOT_REFRESH_INTERVAL', 5))
+        self._current = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._updated = threading.Condition()
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def ready(self):
+        return self._current is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='spot-snapshot', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def needs_refresh(self, now=None):
+        now = now or datetime.now()
+        snap = self._current
+        if snap is None or is_trading_time(now):
+            return True
+        close = last_session_close(now)
+        return close is not None and snap.updated_at < close
+
+    def refresh(self):
+        """
+        拉取一次全市场行情并原子替换当前快照
+        """
+        df = self._loader()
+        if df is None or df.empty:
+            return self._current
+        version = self._current.version + 1 if self._current else 1
+        with self._updated:
+            self._current = Snapshot(df, version)
+            self._updated.notify_all()
+        return self._current
+
+    def wait_for_update(self, version, timeout=None):
+        """
+        阻塞直到出现比 version 更新的快照或超时，返回当前快照
+        """
+        with self._updated:
+            self._updated.wait_for(
+                lambda: self._current is not None and self._current.version > version, timeout
+            )
+            return self._current
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.needs_refresh():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"行情快照刷新失败: {e}")
+            self._stop.wait(self.interval)
+
+
+market_snapshot = MarketSnapshot()
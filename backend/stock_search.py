@@ -0,0 +1,156 @@
+"""
+股票搜索：代码前缀、名称前缀、拼音首字母前缀（如 pfyh → 浦发银行）的自动补全
+
+索引由全市场行情快照的 代码 / 名称 每天构建一次，每类键各保存一个排序好的列表，
+查询用 bisect 找到前缀所在的区间，只取前 limit 个；同一个索引也用于在请求上游之前
+拒绝不存在的股票代码
+"""
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from datetime import datetime
+
+from spot_snapshot import market_snapshot
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时只支持代码与名称搜索
+    lazy_pinyin = None
+
+# 单次搜索最多返回的结果数
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', 50))
+
+# 名称开头的特殊处理 / 上市状态标记，去掉后的名称也作为搜索键；只认列出的标记，
+# 且标记后不能紧跟字母或数字（避免把 TCL科技 这类以字母开头的名称截断）
+_NAME_MARKERS = ('*st', 's*st', 'sst', 'st', 'xd', 'xr', 'dr', 'n', 'c')
+_NAME_MARKER = re.compile(
+    '^(?:' + '|'.join(re.escape(m) for m in sorted(_NAME_MARKERS, key=len, reverse=True)) + ')(?![0-9a-z])'
+)
+_NON_ALNUM = re.compile(r'[^0-9a-z]')
+
+
+def normalize(text):
+    """
+    统一全角 / 半角与大小写，去掉空白（如 "万  科Ａ" → "万科a"）
+    """
+    return ''.join(unicodedata.normalize('NFKC', text).lower().split())
+
+
+def initials(name):
+    """
+    名称的拼音首字母（小写），名称中的字母、数字原样保留；未安装 pypinyin 时返回空字符串
+    """
+    if lazy_pinyin is None:
+        return ''
+    return _NON_ALNUM.sub('', ''.join(lazy_pinyin(normalize(name), style=Style.FIRST_LETTER)))
+
+
+class _PrefixList:
+    """
+    排序的 (键, 行号) 列表，按前缀取区间
+    """
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.rows = [row for _, row in pairs]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix(self, text, limit):
+        start = bisect_left(self.keys, text)
+        result = []
+        for i in range(start, min(start + limit, len(self.keys))):
+            if not self.keys[i].startswith(text):
+                break
+            result.append(self.rows[i])
+        return result
+
+
+class SearchIndex:
+    """
+    一天的股票搜索索引（只读）
+
+    结果排序：代码完全匹配、代码前缀、名称完全匹配、名称前缀、拼音首字母前缀，
+    同一类中按键排序
+    """
+
+    def __init__(self, codes, names, day=None):
+        self.codes = [str(code) for code in codes]
+        self.names = [str(name) for name in names]
+        self.day = day
+        self.known = set(self.codes)
+        self.pinyin = [initials(name) for name in self.names]
+
+        name_keys, pinyin_keys = set(), set()
+        for row, (name, letters) in enumerate(zip(self.names, self.pinyin)):
+            key = normalize(name)
+            # 标记在拼音首字母中原样保留（* 除外），名称键与拼音键都再加一个去掉标记的版本
+            marker = _NAME_MARKER.match(key)
+            marker = marker.group() if marker else ''
+            name_keys.update((k, row) for k in (key, key[len(marker):]) if k)
+            pinyin_keys.update((k, row) for k in (letters, letters[len(marker.replace('*', '')):]) if k)
+        self._by_code = _PrefixList((code, row) for row, code in enumerate(self.codes))
+        self._by_name = _PrefixList(name_keys)
+        self._by_pinyin = _PrefixList(pinyin_keys)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.known
+
+    def search(self, query, limit=10):
+        """
+        返回最多 limit 条 {'代码', '名称', '拼音'}
+        """
+        text = normalize(query)
+        if not text or limit <= 0:
+            return []
+        if text.isdigit():
+            groups = [self._by_code.prefix(text, limit)]
+        else:
+            groups = [self._by_name.prefix(text, limit)]
+            if text.isascii():
+                groups.append(self._by_pinyin.prefix(text, limit))
+        rows = list(dict.fromkeys(row for group in groups for row in group))[:limit]
+        return [{'代码': self.codes[row], '名称': self.names[row], '拼音': self.pinyin[row]} for row in rows]
+
+
+class SharedSearchIndex:
+    """
+    进程内共享的搜索索引：每天第一次访问时（行情快照就绪后）从快照重建，快照未就绪时为 None
+    """
+
+    def __init__(self, snapshot_source=None):
+        self._source = snapshot_source or market_snapshot
+        self._current = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        today = datetime.now().strftime('%Y%m%d')
+        index = self._current
+        if index is not None and index.day == today:
+            return index
+        snapshot = self._source.current
+        if snapshot is None:
+            return index
+        with self._lock:
+            if self._current is None or self._current.day != today:
+                names = snapshot.columns.get('名称', snapshot.codes)
+                self._current = SearchIndex(snapshot.codes, names, today)
+        return self._current
+
+    def rejects(self, code):
+        """
+        索引已就绪且其中没有该代码时返回 True（索引未就绪时不拒绝，交给上游判断）
+        """
+        index = self.current
+        return index is not None and str(code).strip() not in index
+
+
+stock_index = SharedSearchIndex()
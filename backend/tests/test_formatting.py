@@ -0,0 +1,126 @@
+"""
+按列格式化与逐值格式化的一致性：format_records / format_columns / format_frame 的输出
+必须与 format_list_values(df.to_dict('records')) 和 Series.apply(format_numeric_value) 完全相同
+（包括值的类型）
+"""
+import math
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from formatting import (
+    format_columns,
+    format_frame,
+    format_list_values,
+    format_numeric_value,
+    format_records,
+    round_array,
+)
+
+
+def _same(a, b):
+    """
+    值与类型都相同（NaN 与 NaN、NaT 与 NaT 视为相同）
+    """
+    if a is pd.NaT and b is pd.NaT:
+        return True
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return type(a) is type(b) and a == b
+
+
+def _assert_same_records(actual, expected):
+    assert len(actual) == len(expected)
+    for row_a, row_e in zip(actual, expected):
+        assert list(row_a) == list(row_e)
+        for key in row_e:
+            assert _same(row_a[key], row_e[key]), (key, row_a[key], row_e[key])
+
+
+def _rounding_edges():
+    rng = np.random.default_rng(0)
+    # .5 边界（二进制表示略大或略小于十进制值）、超大数值、负数与极小值
+    halves = np.round(rng.uniform(-1e4, 1e4, 2000), 3) + 0.0005
+    return np.concatenate([
+        [0.0, -0.0, 2.675, 1.0005, -1.0005, 0.0005, 2.5e-4, 1e-9, 1.23456, 123456789012.3456,
+         1e15 + 0.5, 2.0 ** 40 + 0.1234, -2.0 ** 53, np.inf, -np.inf, np.nan],
+        halves,
+        rng.normal(0, 1e6, 2000),
+    ])
+
+
+FRAMES = {
+    'float': pd.DataFrame({'最新价': _rounding_edges()}),
+    'float_nan': pd.DataFrame({'涨跌幅': [1.2345, np.nan, None, -0.0005, 3.0]}),
+    'int': pd.DataFrame({'成交量': [0, 1, -7, 2 ** 40, 123456789]}),
+    'bool': pd.DataFrame({'停牌': [True, False, True]}),
+    'object_mixed': pd.DataFrame({'值': pd.Series(
+        [None, '-', '', '1.23456', 'abc', 3, 2.5, float('nan'), '1e3', ' 7 '], dtype=object)}),
+    'object_numeric': pd.DataFrame({'值': pd.Series([1.23456, 2, None, 3.5], dtype=object)}),
+    'object_text': pd.DataFrame({'名称': ['浦发银行', '万科A', None, '']}),
+    'codes': pd.DataFrame({
+        '代码': ['1', '600000', '000001', ''],
+        '股票代码': pd.Series([1, 600000, 300750, 2], dtype=np.int64),
+        '证券代码': pd.Series(['000001', None, '600000', '-'], dtype=object),
+    }),
+    'dates': pd.DataFrame({
+        '日期': [date(2024, 1, 2), date(2024, 1, 3)],
+        '时间': pd.to_datetime(['2024-01-02 09:30', '2024-01-02 09:31']),
+        '时刻': [datetime(2024, 1, 2, 9, 30), None],
+    }),
+    'mixed': pd.DataFrame({
+        '代码': ['600000', '000001', '300750'],
+        '名称': ['浦发银行', '平安银行', '宁德时代'],
+        '最新价': [8.505, np.nan, 180.1234],
+        '成交量': [1, 2, 3],
+        '备注': [None, '-', ''],
+    }),
+    'empty': pd.DataFrame({'代码': pd.Series([], dtype=object), '最新价': pd.Series([], dtype=np.float64)}),
+}
+
+
+@pytest.mark.parametrize('name', FRAMES)
+@pytest.mark.parametrize('decimals', [0, 2, 3])
+def test_format_records_matches_list_values(name, decimals):
+    df = FRAMES[name]
+    expected = format_list_values(df.to_dict('records'), decimals)
+    _assert_same_records(format_records(df, decimals), expected)
+
+
+@pytest.mark.parametrize('name', FRAMES)
+def test_format_columns_matches_list_values(name):
+    df = FRAMES[name]
+    expected = format_list_values(df.to_dict('records'))
+    columns = format_columns(df)
+    assert len(columns) == len(df.columns)
+    for col, values in zip(df.columns, columns):
+        assert len(values) == len(df)
+        for actual, row in zip(values, expected):
+            assert _same(actual, row[col]), (col, actual, row[col])
+
+
+@pytest.mark.parametrize('name', FRAMES)
+def test_format_frame_matches_apply(name):
+    df = FRAMES[name]
+    exclude = [col for col in df.columns if '代码' in col]
+    actual = format_frame(df, exclude=exclude)
+    assert list(actual.columns) == list(df.columns)
+    for col in df.columns:
+        if col in exclude:
+            expected = df[col]
+        else:
+            expected = df[col].apply(format_numeric_value)
+        for a, e in zip(actual[col].tolist(), expected.tolist()):
+            assert _same(a, e), (col, a, e)
+    # 原 DataFrame 不被修改
+    assert df.equals(FRAMES[name])
+
+
+def test_round_array_matches_builtin_round():
+    values = _rounding_edges()
+    for decimals in (0, 1, 2, 3, 6):
+        rounded = round_array(values, decimals)
+        for v, r in zip(values.tolist(), rounded.tolist()):
+            assert _same(r, round(v, decimals)) or (math.isinf(v) and r == v), (v, decimals, r)
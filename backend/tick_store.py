@@ -0,0 +1,323 @@
+"""
+分时成交存档：后台线程定时拉取关注列表中股票的当日分时成交（stock_intraday_em），
+按 交易日 / 代码 分区、每列一个文件只追加写入，读取时内存映射，按时间区间二分切片
+
+目录结构: data/ticks/<YYYYMMDD>/<代码>/{time,price,volume,side}.bin
+其中 <代码> 是指向同目录下版本目录 .<代码>.<版本> 的符号链接，整体重写时写入新的版本目录后
+原子替换链接，读取方始终看到完整的旧分区或新分区
+收盘后的最后一次拉取完成后写入 complete 标记，之后该分区不再变化
+"""
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR
+from market_data import background_executor, fetch_intraday, imap_unordered
+from spot_snapshot import is_trading_time
+from trade_calendar import trade_calendar
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TICK_DIR = os.path.join(DATA_DIR, 'ticks')
+
+# 关注列表（逗号分隔的股票代码），为空时不启动采集
+TICK_WATCHLIST = [c.strip() for c in os.environ.get('TICK_WATCHLIST', '').split(',') if c.strip()]
+# 交易时段内的采集间隔（秒）与并发数
+TICK_COLLECT_INTERVAL = float(os.environ.get('TICK_COLLECT_INTERVAL', 60))
+TICK_CONCURRENCY = int(os.environ.get('TICK_CONCURRENCY', 4))
+
+# (列名, 类型)，time 列最后写入；time 为当天零点起的秒数，side 为 1 买盘 / -1 卖盘 / 0 中性盘
+_COLUMNS = (
+    ('price', np.dtype('<f8')),
+    ('volume', np.dtype('<i8')),
+    ('side', np.dtype('i1')),
+    ('time', np.dtype('<i4')),
+)
+_SIDES = {'买盘': 1, '卖盘': -1, '中性盘': 0}
+_SIDE_NAMES = np.array(['卖盘', '中性盘', '买盘'], dtype=object)
+
+# 分钟K线支持的周期（分钟）
+BAR_FREQS = (1, 5, 15, 30, 60)
+
+
+def parse_time(text):
+    """
+    HH:MM 或 HH:MM:SS 转换为当天零点起的秒数
+    """
+    parts = text.split(':')
+    if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+        raise ValueError(f'无效的时间: {text}')
+    h, m, s = (int(p) for p in parts + ['0'] * (3 - len(parts)))
+    return h * 3600 + m * 60 + s
+
+
+_TIME_STRINGS = None
+
+
+def format_times(seconds):
+    """
+    当天零点起的秒数转换为 HH:MM:SS 字符串列表（查表，整天的字符串只生成一次）
+    """
+    global _TIME_STRINGS
+    if _TIME_STRINGS is None:
+        _TIME_STRINGS = np.array([
+            f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in range(86400)
+        ], dtype=object)
+    return _TIME_STRINGS[np.asarray(seconds, dtype=np.int64)].tolist()
+
+
+def _frame_to_columns(df):
+    """
+    将 stock_intraday_em 的结果转换为各列的数组
+    """
+    times = pd.to_timedelta(df['时间'].astype(str)).to_numpy().astype('timedelta64[s]').astype(np.int64)
+    return {
+        'time': times.astype('<i4'),
+        'price': df['成交价'].to_numpy(dtype='<f8'),
+        'volume': df['手数'].to_numpy(dtype='<i8'),
+        'side': df['买卖盘性质'].map(_SIDES).fillna(0).to_numpy(dtype='i1'),
+    }
+
+
+class TickStore:
+    """
+    按 (交易日, 代码) 分区的列式分时成交存储
+
+    每列一个文件，只在末尾追加；time 列最后写入，读取时以各列的最短长度为准，
+    写到一半的追加不会被读到
+    """
+
+    def __init__(self, root=TICK_DIR):
+        self.root = root
+
+    def _dir(self, day, stock_code):
+        if not (day.isdigit() and len(day) == 8 and stock_code.isdigit()):
+            raise ValueError(f'不支持的参数: code={stock_code}, date={day}')
+        return os.path.join(self.root, day, stock_code)
+
+    def count(self, day, stock_code):
+        return self._count(os.path.realpath(self._dir(day, stock_code)))
+
+    def _count(self, directory):
+        try:
+            return min(
+                os.path.getsize(os.path.join(directory, f'{name}.bin')) // dtype.itemsize
+                for name, dtype in _COLUMNS
+            )
+        except OSError:
+            return 0
+
+    def read(self, day, stock_code, start=None, end=None):
+        """
+        读取 [start, end]（当天零点起的秒数）区间内的成交，返回 {列: 数组}（内存映射切片），
+        没有存档时返回 None
+        """
+        # 解析一次链接，各列从同一个版本目录读取；重写后旧版本目录被删除时重新解析
+        link = self._dir(day, stock_code)
+        for attempt in range(3):
+            directory = os.path.realpath(link)
+            n = self._count(directory)
+            if n == 0:
+                if attempt < 2 and os.path.realpath(link) != directory:
+                    continue
+                return None
+            try:
+                columns = {
+                    name: np.memmap(os.path.join(directory, f'{name}.bin'), dtype=dtype, mode='r', shape=(n,))
+                    for name, dtype in _COLUMNS
+                }
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        times = columns['time']
+        lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        hi = n if end is None else int(np.searchsorted(times, end, side='right'))
+        return {name: values[lo:hi] for name, values in columns.items()}
+
+    def _write(self, directory, columns, mode):
+        os.makedirs(directory, exist_ok=True)
+        for name, dtype in _COLUMNS:
+            with open(os.path.join(directory, f'{name}.bin'), mode) as f:
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+    def sync(self, day, stock_code, df):
+        """
+        用上游返回的当日全部成交更新存档，返回新增的行数
+
+        上游每次返回当天从开盘到现在的全部成交：与已存部分的最后一行一致时只追加之后的行，
+        不一致（上游修正了数据）时整体重写该分区
+        """
+        if df is None or df.empty:
+            return 0
+        columns = _frame_to_columns(df)
+        directory = self._dir(day, stock_code)
+        n = self.count(day, stock_code)
+        stored = self.read(day, stock_code) if n else None
+        if n and len(df) >= n and columns['time'][n - 1] == stored['time'][-1] \
+                and columns['price'][n - 1] == stored['price'][-1]:
+            tail = {name: values[n:] for name, values in columns.items()}
+            if len(tail['time']):
+                self._write(directory, tail, 'ab')
+            return len(tail['time'])
+        self._replace(directory, columns)
+        return len(df)
+
+    def _replace(self, directory, columns):
+        """
+        整体重写分区：写入新的版本目录，再用一次 os.replace 把分区链接指向它，
+        读取方不会看到写了一半或暂时缺失的分区
+        """
+        parent, stock_code = os.path.split(directory)
+        version = f'.{stock_code}.{time.time_ns()}'
+        self._write(os.path.join(parent, version), columns, 'wb')
+        previous = os.path.realpath(directory) if os.path.islink(directory) else None
+        if os.path.isdir(directory) and previous is None:
+            # 旧格式的分区是普通目录，不能被链接原子替换：先移走（只在第一次重写时发生）
+            previous = os.path.join(parent, f'.{stock_code}.old')
+            shutil.rmtree(previous, ignore_errors=True)
+            os.replace(directory, previous)
+        link = directory + '.tmp'
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(version, link)
+        os.replace(link, directory)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    def mark_complete(self, day, stock_code):
+        with open(os.path.join(self._dir(day, stock_code), 'complete'), 'w'):
+            pass
+
+    def is_complete(self, day, stock_code):
+        return os.path.exists(os.path.join(self._dir(day, stock_code), 'complete'))
+
+    def days(self, stock_code):
+        """
+        返回有该股票存档的交易日列表
+        """
+        try:
+            days = os.listdir(self.root)
+        except OSError:
+            return []
+        return sorted(d for d in days if d.isdigit() and self.count(d, stock_code))
+
+
+def to_frame(columns):
+    """
+    存档的列还原为与 stock_intraday_em 相同格式的 DataFrame
+    """
+    return pd.DataFrame({
+        '时间': format_times(columns['time']),
+        '成交价': np.asarray(columns['price']),
+        '手数': np.asarray(columns['volume']),
+        '买卖盘性质': _SIDE_NAMES[np.asarray(columns['side'], dtype=np.int64) + 1],
+    })
+
+
+def resample(columns, minutes):
+    """
+    聚合为 minutes 分钟K线（OHLCV），时间为每根K线的起始时刻
+    """
+    times = np.asarray(columns['time'], dtype=np.int64)
+    price = np.asarray(columns['price'])
+    volume = np.asarray(columns['volume'])
+    buckets = times // (minutes * 60)
+    # 时间有序，每个桶是连续的一段
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(buckets) else np.empty(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return pd.DataFrame({
+        '时间': format_times(buckets[starts] * minutes * 60),
+        '开盘': price[starts],
+        '收盘': price[ends],
+        '最高': np.maximum.reduceat(price, starts) if len(starts) else price[:0],
+        '最低': np.minimum.reduceat(price, starts) if len(starts) else price[:0],
+        '成交量': np.add.reduceat(volume, starts) if len(starts) else volume[:0],
+        # 手数 × 100 股
+        '成交额': np.add.reduceat(price * volume * 100, starts) if len(starts) else price[:0],
+    })
+
+
+class TickCollector:
+    """
+    分时成交采集：交易时段内每 interval 秒拉取一次关注列表，收盘数据落定后再拉取一次并标记完成
+
+    多进程部署时通过文件锁保证只有一个进程在采集
+    """
+
+    def __init__(self, store, codes=None, interval=TICK_COLLECT_INTERVAL, loader=None):
+        self.store = store
+        self.codes = TICK_WATCHLIST if codes is None else codes
+        self.interval = interval
+        self._loader = loader or fetch_intraday
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock_file = None
+        self._completed_day = None
+
+    def _acquire(self):
+        if fcntl is None:
+            return True
+        os.makedirs(self.store.root, exist_ok=True)
+        self._lock_file = open(os.path.join(self.store.root, '.collector.lock'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def start(self):
+        if not self.codes or self._thread is not None or not self._acquire():
+            return
+        self._thread = threading.Thread(target=self._run, name='tick-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def collect(self, final=False):
+        """
+        拉取一次关注列表的当日分时成交并写入存档，返回 {代码: 新增行数}
+        """
+        # 非交易日上游返回的是最近一个交易日的成交
+        day = trade_calendar.latest_trading_day(datetime.now().strftime('%Y%m%d'))
+        added = {}
+        for stock_code, df, error in imap_unordered(self._loader, self.codes, TICK_CONCURRENCY, background_executor):
+            if self._stop.is_set():
+                # 进程退出中：不再写入分区
+                break
+            if error is not None:
+                print(f"分时成交采集失败 {stock_code}: {error}")
+                continue
+            added[stock_code] = self.store.sync(day, stock_code, df)
+            if final and self.store.count(day, stock_code):
+                self.store.mark_complete(day, stock_code)
+        return added
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = datetime.now()
+            today = now.strftime('%Y%m%d')
+            try:
+                if is_trading_time(now):
+                    self.collect()
+                elif trade_calendar.last_closed_day(now) == today and self._completed_day != today:
+                    self.collect(final=True)
+                    self._completed_day = today
+            except Exception as e:
+                print(f"分时成交采集失败: {e}")
+            self._stop.wait(self.interval)
+
+
+tick_store = TickStore()
+tick_collector = TickCollector(tick_store)
@@ -0,0 +1,152 @@
+"""
+交易日历：从 akshare 交易日表加载一次并落盘，之后所有日期解析都在本地完成
+"""
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, time as dt_time
+
+import akshare as ak
+
+from config import DATA_DIR
+from upstream import upstream
+
+CALENDAR_FILE = os.path.join(DATA_DIR, 'trade_calendar.json')
+
+# 开盘前股票池为空，此时间之前"今天"按上一交易日处理
+POOL_READY_TIME = dt_time(9, 25)
+# 收盘后日线数据落定的时间，此后当天的K线视为已收盘
+CLOSE_SETTLED_TIME = dt_time(15, 30)
+
+
+class TradeCalendar:
+    """
+    交易日历
+
+    日期统一使用 YYYYMMDD 字符串，按字典序有序存放，查询用二分查找 O(log n)。
+    日历未覆盖到的日期（如跨年后尚未更新）按"工作日即交易日"兜底。
+    """
+
+    def __init__(self, path=CALENDAR_FILE, loader=None):
+        self.path = path
+        self._loader = loader or (lambda: upstream.call(ak.tool_trade_date_hist_sina))
+        self._dates = []
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_fetch_day = None
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write_file(self, dates):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dates, f)
+        os.replace(tmp_path, self.path)
+
+    def _fetch(self):
+        df = self._loader()
+        return sorted(d.strftime('%Y%m%d') for d in df['trade_date'])
+
+    def _ensure_loaded(self):
+        today = datetime.now().strftime('%Y%m%d')
+        # 日历有效，或今天已经尝试过拉取时直接返回；拉取失败且本地没有日历时，第二天再重试
+        if self._loaded and ((self._dates and self._dates[-1] >= today) or self._last_fetch_day == today):
+            return
+        with self._lock:
+            if not self._loaded:
+                self._dates = self._read_file()
+                self._loaded = True
+            # 本地日历缺失或已过期时重新拉取，每天最多尝试一次
+            if (not self._dates or self._dates[-1] < today) and self._last_fetch_day != today:
+                self._last_fetch_day = today
+                try:
+                    dates = self._fetch()
+                    if dates:
+                        self._dates = dates
+                        self._write_file(dates)
+                except Exception as e:
+                    print(f"交易日历加载失败: {e}")
+
+    def _covers(self, date_str):
+        return bool(self._dates) and self._dates[0] <= date_str <= self._dates[-1]
+
+    def is_trading_day(self, date_str):
+        """
+        判断某日是否为交易日
+        """
+        self._ensure_loaded()
+        if not self._covers(date_str):
+            return datetime.strptime(date_str, '%Y%m%d').weekday() < 5
+        i = bisect_left(self._dates, date_str)
+        return i < len(self._dates) and self._dates[i] == date_str
+
+    def latest_trading_day(self, date_str):
+        """
+        返回不晚于 date_str 的最近交易日
+        """
+        self._ensure_loaded()
+        if not self._covers(date_str):
+            day = datetime.strptime(date_str, '%Y%m%d')
+            while day.weekday() >= 5:
+                day -= timedelta(days=1)
+            return day.strftime('%Y%m%d')
+        return self._dates[bisect_right(self._dates, date_str) - 1]
+
+    def previous_trading_day(self, date_str):
+        """
+        返回严格早于 date_str 的最近交易日
+        """
+        day = datetime.strptime(date_str, '%Y%m%d') - timedelta(days=1)
+        return self.latest_trading_day(day.strftime('%Y%m%d'))
+
+    def trading_days_between(self, start_date, end_date):
+        """
+        返回 [start_date, end_date] 区间内的所有交易日
+        """
+        self._ensure_loaded()
+        if self._covers(start_date) and self._covers(end_date):
+            return self._dates[bisect_left(self._dates, start_date):bisect_right(self._dates, end_date)]
+        days = []
+        day = datetime.strptime(start_date, '%Y%m%d')
+        end = datetime.strptime(end_date, '%Y%m%d')
+        while day <= end:
+            day_str = day.strftime('%Y%m%d')
+            if self.is_trading_day(day_str):
+                days.append(day_str)
+            day += timedelta(days=1)
+        return days
+
+    def last_closed_day(self, now=None):
+        """
+        返回最近一个已收盘的交易日（当天收盘数据落定之前返回上一交易日）
+        """
+        now = now or datetime.now()
+        today = now.strftime('%Y%m%d')
+        if now.time() >= CLOSE_SETTLED_TIME and self.is_trading_day(today):
+            return today
+        return self.previous_trading_day(today)
+
+    def resolve_pool_date(self, date_param=''):
+        """
+        将股票池接口的 date 参数解析为实际要查询的交易日
+        未指定日期时从今天开始；开盘前的"今天"还没有股票池数据，退回上一交易日
+        """
+        now = datetime.now()
+        today = now.strftime('%Y%m%d')
+        target = date_param or today
+        # 校验日期格式，格式错误时抛出 ValueError
+        datetime.strptime(target, '%Y%m%d')
+        day = self.latest_trading_day(target)
+        if day == today and now.time() < POOL_READY_TIME:
+            day = self.previous_trading_day(day)
+        return day
+
+
+trade_calendar = TradeCalendar()
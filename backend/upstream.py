@@ -0,0 +1,505 @@
+"""
+上游访问层：akshare 的所有 HTTP 请求统一经过这里
+
+- 进程内共享的 keep-alive 连接池，不再每次请求新建连接
+- 按主机限制同时在途的请求数
+- 按主机的令牌桶限速，避免突发请求被上游限流或封禁
+- 连接错误、429 和 5xx 按带抖动的指数退避重试（优先遵循 Retry-After）
+- 按 akshare 函数熔断：连续超时后一段时间内直接失败，不再占用线程等待
+- 每个请求一个上游时间预算：单次 HTTP 超时和重试都不会超出请求剩余的预算
+- 异步版本 AsyncUpstream：单个 worker 可以同时挂起数百个上游请求
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+try:
+    import aiohttp
+except ImportError:  # 未安装 aiohttp 时，异步版本退回到线程池中执行同步请求
+    aiohttp = None
+
+# 每个主机的连接池大小与并发上限
+POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 32))
+HOST_CONCURRENCY = int(os.environ.get('UPSTREAM_HOST_CONCURRENCY', 8))
+# 每个主机的令牌桶：每秒补充的请求数与桶容量（允许的突发请求数）
+HOST_RATE = float(os.environ.get('UPSTREAM_RATE', 20))
+HOST_BURST = int(os.environ.get('UPSTREAM_BURST', 40))
+# 重试次数与退避参数（秒）
+MAX_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 3))
+BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF', 0.5))
+BACKOFF_CAP = float(os.environ.get('UPSTREAM_BACKOFF_CAP', 8))
+# 调用方未指定超时时使用的 (连接, 读取) 超时
+DEFAULT_TIMEOUT = (
+    float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5)),
+    float(os.environ.get('UPSTREAM_READ_TIMEOUT', 15)),
+)
+
+# 熔断：同一个 akshare 函数连续超时 / 连接失败的次数达到阈值后熔断，熔断多少秒后放行一次试探调用
+CIRCUIT_FAILURES = int(os.environ.get('UPSTREAM_CIRCUIT_FAILURES', 5))
+CIRCUIT_RESET = float(os.environ.get('UPSTREAM_CIRCUIT_RESET', 30))
+# 每个请求所有上游调用合计的时间预算（秒），0 表示不限制
+REQUEST_BUDGET = float(os.environ.get('UPSTREAM_REQUEST_BUDGET', 20))
+
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+_original_get_adapter = requests.Session.get_adapter
+
+
+class CircuitOpenError(Exception):
+    """
+    上游函数处于熔断状态，调用直接失败
+    """
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    本次请求的上游时间预算已用完
+    """
+
+
+# 当前请求的上游截止时间（time.monotonic），线程池中的任务通过 copy_context 继承
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+
+
+def start_deadline(budget=REQUEST_BUDGET):
+    """
+    在请求开始时调用：之后本请求中的上游调用合计不超过 budget 秒
+    """
+    _deadline.set(time.monotonic() + budget if budget > 0 else None)
+
+
+def clear_deadline():
+    """
+    请求结束时调用，同一线程之后的调用不再受该请求的预算限制
+    """
+    _deadline.set(None)
+
+
+def remaining():
+    """
+    当前请求剩余的上游时间预算（秒），不在请求内或不限制时返回 None
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _cap_timeout(timeout, limit):
+    if isinstance(timeout, tuple):
+        return tuple(limit if t is None else min(t, limit) for t in timeout)
+    return limit if timeout is None else min(timeout, limit)
+
+
+def _out_of_budget(delay):
+    left = remaining()
+    return left is not None and left <= delay
+
+
+def _is_timeout(error):
+    # 预算用完不是上游的问题，不计入熔断
+    return isinstance(error, (requests.Timeout, requests.ConnectionError, TimeoutError)) \
+        and not isinstance(error, DeadlineExceeded)
+
+
+class CircuitBreaker:
+    """
+    单个 akshare 函数的熔断器
+
+    连续 failures 次超时 / 连接失败后打开，reset 秒内的调用直接抛出 CircuitOpenError；
+    之后放行一个试探调用（半开），上游有响应则关闭，再次超时则重新打开
+    """
+
+    def __init__(self, name, failures=CIRCUIT_FAILURES, reset=CIRCUIT_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.state = 'closed'
+        self.consecutive = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset:
+                self.state = 'half_open'
+                self._trial = False
+            if self.state == 'half_open' and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f'上游 {self.name} 连续超时，暂停调用')
+
+    def record(self, error=None):
+        """
+        记录一次调用结果（error 为 None 表示成功）
+        """
+        with self._lock:
+            if error is None or not _is_timeout(error):
+                # 上游有响应（包括业务错误）
+                self.state = 'closed'
+                self.consecutive = 0
+                self._trial = False
+                return
+            self.consecutive += 1
+            if self.state == 'half_open' or self.consecutive >= self.failures:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    reserve() 立即预占一个令牌并返回需要等待的秒数，
+    同步代码用 time.sleep、异步代码用 asyncio.sleep 等待，两者共用同一个桶
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    第 attempt 次重试前的等待时间：有 Retry-After 时遵循它，否则为全抖动指数退避
+    """
+    if retry_after:
+        try:
+            return min(BACKOFF_CAP, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class HostState:
+    """
+    单个上游主机的并发上限、令牌桶和统计
+    """
+
+    def __init__(self, concurrency, rate, burst):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.stats = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """
+    共享的 HTTP 适配器：在 urllib3 连接池之上加入按主机限流与重试
+    """
+
+    def __init__(self, client, pool_size):
+        self.client = client
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        host = urlsplit(request.url).hostname or ''
+        state = self.client.host(host)
+        timeout = timeout or DEFAULT_TIMEOUT
+        attempt = 0
+        while True:
+            # 单次 HTTP 超时不超过请求剩余的预算
+            left = remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded('本次请求的上游时间预算已用完')
+            attempt_timeout = timeout if left is None else _cap_timeout(timeout, left)
+            with self.client.slot(state):
+                try:
+                    response = super().send(request, stream=stream, timeout=attempt_timeout, verify=verify, cert=cert, proxies=proxies)
+                except (requests.ConnectionError, requests.Timeout):
+                    state.count('errors')
+                    if attempt >= self.client.max_retries:
+                        raise
+                    delay = backoff_delay(attempt)
+                    # 剩余预算不够再等待一次重试
+                    if _out_of_budget(delay):
+                        raise
+                    response = None
+            if response is not None:
+                if response.status_code == 429:
+                    state.count('throttled')
+                if response.status_code not in RETRY_STATUS or attempt >= self.client.max_retries:
+                    return response
+                delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+                if _out_of_budget(delay):
+                    return response
+                response.close()
+            state.count('retries')
+            time.sleep(delay)
+            attempt += 1
+
+
+class UpstreamClient:
+    """
+    进程内共享的上游客户端
+
+    install() 之后，akshare 内部无论是 requests.get 还是自建 Session，
+    发出的请求都会使用同一个 UpstreamAdapter
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, host_concurrency=HOST_CONCURRENCY, rate=HOST_RATE, burst=HOST_BURST,
+                 max_retries=MAX_RETRIES):
+        self.host_concurrency = host_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.adapter = UpstreamAdapter(self, pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._calls = defaultdict(lambda: defaultdict(float))
+        self._calls_lock = threading.Lock()
+        self._breakers = {}
+        self._installed = False
+
+    def host(self, hostname):
+        state = self._hosts.get(hostname)
+        if state is None:
+            with self._hosts_lock:
+                state = self._hosts.setdefault(hostname, HostState(self.host_concurrency, self.rate, self.burst))
+        return state
+
+    def breaker(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._calls_lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(name))
+        return breaker
+
+    @contextmanager
+    def slot(self, state):
+        """
+        占用主机的一个并发名额，并按令牌桶等待
+        """
+        with state.semaphore:
+            state.count('requests')
+            state.count('inflight')
+            try:
+                if state.bucket.acquire() > 0:
+                    state.count('rate_limited')
+                yield state
+            finally:
+                state.count('inflight', -1)
+
+    def install(self):
+        """
+        让所有 requests.Session（包括 akshare 每次调用新建的 Session）改用共享适配器
+        """
+        if self._installed:
+            return
+        adapter = self.adapter
+
+        def get_adapter(session, url):
+            if url.lower().startswith(('http://', 'https://')):
+                return adapter
+            return _original_get_adapter(session, url)
+
+        requests.Session.get_adapter = get_adapter
+        self._installed = True
+
+    def call(self, fn, *args, **kwargs):
+        """
+        调用一个 akshare 函数并记录调用次数、失败次数和耗时
+        熔断中或本次请求的上游预算已用完时直接失败
+        """
+        name = getattr(fn, '__name__', str(fn))
+        breaker = self.breaker(name)
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f'调用 {name} 前本次请求的上游时间预算已用完')
+        breaker.before_call()
+        start = time.perf_counter()
+        failed = False
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            failed = True
+            breaker.record(e)
+            with self._calls_lock:
+                self._calls[name]['errors'] += 1
+            raise
+        else:
+            breaker.record()
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._calls_lock:
+                stats = self._calls[name]
+                stats['calls'] += 1
+                stats['seconds'] += elapsed
+            metrics.observe_upstream(name, elapsed, failed)
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        """
+        直接发起 GET 请求（经过同一个连接池与限流）
+        """
+        return self.session.get(url, params=params, timeout=timeout, **kwargs)
+
+    def stats(self):
+        with self._calls_lock:
+            calls = {
+                name: {
+                    'calls': int(s['calls']),
+                    'errors': int(s['errors']),
+                    'avg_ms': round(s['seconds'] / s['calls'] * 1000, 1) if s['calls'] else 0.0,
+                }
+                for name, s in self._calls.items()
+            }
+        hosts = {
+            name: dict(state.stats, concurrency=state.concurrency)
+            for name, state in list(self._hosts.items())
+        }
+        breakers = {name: breaker.stats() for name, breaker in list(self._breakers.items())}
+        return {'installed': self._installed, 'hosts': hosts, 'calls': calls, 'breakers': breakers}
+
+
+class AsyncUpstream:
+    """
+    异步上游客户端，与同步客户端共用每个主机的令牌桶
+
+    安装了 aiohttp 时使用其连接池，单个事件循环可以同时挂起大量请求；
+    否则退回到专用线程池中执行同步请求（并发受 fallback_workers 限制）
+    """
+
+    def __init__(self, client=None, limit=256, limit_per_host=None, fallback_workers=32):
+        self.client = client or upstream
+        self.limit = limit
+        self.limit_per_host = limit_per_host or self.client.host_concurrency
+        self._fallback_workers = fallback_workers
+        self._session = None
+        self._executor = None
+        self._semaphores = {}
+
+    async def __aenter__(self):
+        if aiohttp is not None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self._fallback_workers, thread_name_prefix='upstream-async')
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        return False
+
+    def _semaphore(self, host):
+        sem = self._semaphores.get(host)
+        if sem is None:
+            sem = self._semaphores[host] = asyncio.Semaphore(self.limit_per_host)
+        return sem
+
+    async def get_json(self, url, params=None, timeout=None):
+        """
+        GET 并解析 JSON，重试策略与同步客户端一致
+        """
+        if self._session is None:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self._executor, lambda: self.client.get(url, params=params, timeout=timeout)
+            )
+            response.raise_for_status()
+            return response.json()
+
+        host = urlsplit(url).hostname or ''
+        state = self.client.host(host)
+        connect_timeout, read_timeout = DEFAULT_TIMEOUT if timeout is None else (timeout, timeout)
+        client_timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        attempt = 0
+        while True:
+            async with self._semaphore(host):
+                state.count('requests')
+                delay = state.bucket.reserve()
+                if delay > 0:
+                    state.count('rate_limited')
+                    await asyncio.sleep(delay)
+                try:
+                    async with self._session.get(url, params=params, timeout=client_timeout) as response:
+                        if response.status == 429:
+                            state.count('throttled')
+                        if response.status not in RETRY_STATUS or attempt >= self.client.max_retries:
+                            response.raise_for_status()
+                            return await response.json(content_type=None)
+                        retry_after = response.headers.get('Retry-After')
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    state.count('errors')
+                    if attempt >= self.client.max_retries:
+                        raise
+                    retry_after = None
+            state.count('retries')
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def gather_json(self, requests_list):
+        """
+        并发获取多个 JSON：requests_list 为 [(url, params), ...]，
+        返回与之对应的 [(结果, 异常), ...]
+        """
+        async def one(url, params):
+            try:
+                return await self.get_json(url, params), None
+            except Exception as e:
+                return None, e
+
+        return await asyncio.gather(*(one(url, params) for url, params in requests_list))
+
+
+upstream = UpstreamClient()
@@ -0,0 +1,11 @@
+// 按列返回的数据（format=columnar 的 { columns, arrays }）转换为行
+export const toRows = ({ columns, arrays }) => {
+  const count = arrays.length ? arrays[0].length : 0;
+  const rows = new Array(count);
+  for (let i = 0; i < count; i++) {
+    const row = {};
+    for (let j = 0; j < columns.length; j++) row[columns[j]] = arrays[j][i];
+    rows[i] = row;
+  }
+  return rows;
+};